@@ -0,0 +1,91 @@
+"""
+Time how long the camera takes to start, with and without the camera capability
+cache (see cameraCacheFile in the config).
+
+Needs a real camera.  From the root of the repository:
+
+    python -m benchmarks.camera_startup --device-name /dev/video0
+
+Each start is timed from creating the Camera to it going active, split into
+finding the camera and then loading and starting it.  Without the cache every
+start probes gstreamer for cameras, with it only the first start does.
+"""
+
+import argparse
+import tempfile
+import time
+from configparser import ConfigParser
+from pathlib import Path
+
+from PyQt5.QtCore import QEventLoop, QTimer
+from PyQt5.QtMultimedia import QCamera
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.common import report
+from photobooth.camera import Camera
+
+DEFAULT_CONFIG = Path(__file__).parent.parent / "default-config.cfg"
+
+# Give up on a start after this long
+TIMEOUT_MS = 30 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="Starts per run")
+    parser.add_argument(
+        "--device-name", default="", help="Camera device, blank for the default"
+    )
+    parser.add_argument("--viewfinder-resolution", default="")
+    args = parser.parse_args()
+
+    app = QApplication([])  # NoQA: Unused variable
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, cache_path in (
+            ("without cache", ""),
+            ("with cache", str(Path(cache_dir) / "camera.json")),
+        ):
+            found, active = [], []
+            for _ in range(args.repeats):
+                config = _camera_config(args, cache_path)
+                found_in, active_in = _time_start(config)
+                found.append(found_in)
+                active.append(active_in)
+            report(f"{name}, find camera", found)
+            report(f"{name}, create to active", active)
+
+
+def _camera_config(args, cache_path):
+    config = ConfigParser()
+    config.read(DEFAULT_CONFIG)
+    camera_config = config["camera"]
+    camera_config["deviceName"] = args.device_name
+    camera_config["viewfinderResolution"] = args.viewfinder_resolution
+    camera_config["cameraCacheFile"] = cache_path
+    return camera_config
+
+
+def _time_start(config):
+    start = time.perf_counter()
+    camera = Camera(config)
+    found_in = time.perf_counter() - start
+
+    loop = QEventLoop()
+    camera.statusChanged.connect(
+        lambda status: loop.quit() if status == QCamera.ActiveStatus else None
+    )
+    QTimer.singleShot(TIMEOUT_MS, loop.quit)
+    camera.start()
+    loop.exec()
+    active_in = time.perf_counter() - start
+
+    if camera.status() != QCamera.ActiveStatus:
+        raise RuntimeError(f"Camera didn't start within {TIMEOUT_MS}ms")
+    camera.unload()
+    camera.deleteLater()
+    return found_in, active_in
+
+
+if __name__ == "__main__":
+    main()
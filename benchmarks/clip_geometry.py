@@ -0,0 +1,332 @@
+"""
+Compare the cost of repainting the masked live feed with each representation of
+the mask's shape: no clipping at all as a baseline, clip_region, its spans, the
+simplified outline path, and an overlay drawn over the unclipped frame.
+
+From the root of the repository:
+
+    python -m benchmarks.clip_geometry
+
+Each is timed painting a frame the size of the mask as it is, and scaled from a
+1280x720 camera frame, and then repainting a QGraphicsView laid out like the
+live feed, with a widget mask (clip_region), an overlay in the foreground or
+an item clipped to the path.
+"""
+
+import argparse
+
+from PyQt5.QtCore import QPointF, QRect, QSize, Qt
+from PyQt5.QtGui import (
+    QColor,
+    QImage,
+    QPainter,
+    QPainterPath,
+    QPixmap,
+    QPolygonF,
+    QRegion,
+)
+from PyQt5.QtWidgets import (
+    QApplication,
+    QGraphicsPathItem,
+    QGraphicsPixmapItem,
+    QGraphicsScene,
+    QGraphicsView,
+    QMainWindow,
+    QWidget,
+)
+
+from benchmarks.common import (
+    report,
+    synthetic_image,
+    time_calls,
+    use_offscreen_platform,
+)
+from photobooth.mask import Mask
+from photobooth.resources import images_root
+
+# Screen size and mask of each supported screen
+SCREENS = {
+    "800x480": QSize(800, 480),
+    "1366x768": QSize(1366, 768),
+    "1920x1080": QSize(1920, 1080),
+}
+CAMERA_SIZE = QSize(1280, 720)
+
+# Stands in for the background around the live feed
+_OVERLAY_FILL = QColor(32, 32, 48)
+
+# How far the simplified outline may stray from the mask, in pixels
+_OUTLINE_TOLERANCE = 1.0
+
+
+class _ClipGeometry:
+    """
+    The mask's shape as the region's spans, a simplified outline path, and an
+    overlay to draw over unclipped content, each made once up front.
+    """
+
+    def __init__(self, mask: Mask):
+        self.spans = _clip_spans(mask.clip_region)
+        self.path = _clip_outline(mask.clip_region, _OUTLINE_TOLERANCE)
+        self.overlay = _clip_overlay(mask.clip_region, mask.size, _OVERLAY_FILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=200, help="Paints per case")
+    args = parser.parse_args()
+
+    use_offscreen_platform()
+    app = QApplication([])  # NoQA: Unused variable
+
+    for screen_name, screen_size in SCREENS.items():
+        mask = Mask(images_root / f"{screen_name}-mask-cropped.png")
+        geometry = _ClipGeometry(mask)
+        print(
+            f"\n{screen_name}: {mask.clip_region.rectCount()} rects, "
+            f"{len(geometry.spans)} spans, "
+            f"{geometry.path.elementCount()} point outline "
+            f"({_pixels_off(mask, geometry)} of "
+            f"{mask.size.width() * mask.size.height()} "
+            "pixels differ from the region)"
+        )
+
+        for name, frame, source_rect in (
+            ("same size", synthetic_image(mask.size), None),
+            ("scaled", synthetic_image(CAMERA_SIZE), mask.build_clip_rect),
+        ):
+            for representation, paint in _painters(mask, geometry).items():
+                target = QImage(mask.size, QImage.Format_RGB32)
+                source = frame.rect() if source_rect is None else source_rect(frame)
+                report(
+                    f"  paint {name}, {representation}",
+                    time_calls(
+                        lambda: _paint(target, frame, source, paint), args.repeats
+                    ),
+                )
+
+        for representation in ("none", "region", "overlay", "path"):
+            window, view, item = _live_feed(
+                mask, geometry, screen_name, screen_size, representation
+            )
+            frames = [
+                QPixmap.fromImage(
+                    synthetic_image(CAMERA_SIZE).scaled(
+                        mask.size, Qt.KeepAspectRatioByExpanding
+                    )
+                )
+                for _ in range(2)
+            ]
+
+            def repaint():
+                frames.reverse()
+                item.setPixmap(frames[0])
+                view.viewport().repaint()
+
+            report(
+                f"  repaint view, {representation}", time_calls(repaint, args.repeats)
+            )
+            window.close()
+
+
+def _painters(mask: Mask, geometry: _ClipGeometry):
+    def unclipped(painter, target_rect, frame, source):
+        painter.drawImage(target_rect, frame, source)
+
+    def region(painter, target_rect, frame, source):
+        painter.setClipRegion(mask.clip_region)
+        painter.drawImage(target_rect, frame, source)
+
+    def spans(painter, target_rect, frame, source):
+        scale_x = source.width() / target_rect.width()
+        scale_y = source.height() / target_rect.height()
+        for span in geometry.spans:
+            painter.drawImage(
+                span,
+                frame,
+                QRect(
+                    source.x() + int(span.x() * scale_x),
+                    source.y() + int(span.y() * scale_y),
+                    max(1, int(span.width() * scale_x)),
+                    max(1, int(span.height() * scale_y)),
+                ),
+            )
+
+    def path(painter, target_rect, frame, source):
+        painter.setClipPath(geometry.path)
+        painter.drawImage(target_rect, frame, source)
+
+    def overlay(painter, target_rect, frame, source):
+        painter.drawImage(target_rect, frame, source)
+        painter.drawImage(0, 0, geometry.overlay)
+
+    return {
+        "unclipped": unclipped,
+        "region": region,
+        "spans": spans,
+        "path": path,
+        "overlay": overlay,
+    }
+
+
+def _paint(target: QImage, frame: QImage, source: QRect, paint):
+    painter = QPainter(target)
+    paint(painter, target.rect(), frame, source)
+    painter.end()
+
+
+class _Scene(QGraphicsScene):
+    def __init__(self, overlay):
+        super().__init__()
+        self._overlay = overlay
+
+    def drawForeground(self, painter, rect):
+        if self._overlay is not None:
+            painter.drawImage(0, 0, self._overlay)
+
+
+def _live_feed(
+    mask: Mask, geometry: _ClipGeometry, screen_name, screen_size, representation
+):
+    window = QMainWindow()
+    window.setStyleSheet(
+        "QMainWindow { background-image: url("
+        f"{images_root / f'{screen_name}-background.jpg'}); }}"
+        "QGraphicsView { border-width: 0px; border-style: solid; }"
+    )
+    window.resize(screen_size)
+    window.setCentralWidget(QWidget())
+
+    scene = _Scene(geometry.overlay if representation == "overlay" else None)
+    item = QGraphicsPixmapItem()
+    if representation == "path":
+        clip = QGraphicsPathItem(geometry.path)
+        clip.setFlag(QGraphicsPathItem.ItemClipsChildrenToShape)
+        clip.setPen(QColor(Qt.transparent))
+        scene.addItem(clip)
+        item.setParentItem(clip)
+    else:
+        scene.addItem(item)
+
+    view = QGraphicsView(scene, window.centralWidget())
+    # Roughly where the live feed sits, which doesn't change the cost
+    view.setGeometry(
+        QRect(
+            (screen_size.width() - mask.size.width()) // 2,
+            (screen_size.height() - mask.size.height()) // 2,
+            mask.size.width(),
+            mask.size.height(),
+        )
+    )
+    view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+    view.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+    if representation == "region":
+        view.setMask(mask.clip_region)
+
+    window.show()
+    QApplication.processEvents()
+    return window, view, item
+
+
+def _pixels_off(mask: Mask, geometry: _ClipGeometry):
+    """
+    How many pixels are inside the outline path but not the region, or the other
+    way round
+    """
+    image = QImage(mask.size, QImage.Format_RGB32)
+    image.fill(QColor("black"))
+    painter = QPainter(image)
+    painter.setClipRegion(mask.clip_region)
+    painter.fillRect(image.rect(), QColor(255, 0, 0))
+    painter.setClipping(False)
+    painter.setCompositionMode(QPainter.RasterOp_SourceXorDestination)
+    painter.fillPath(geometry.path, QColor(255, 0, 0))
+    painter.end()
+    return sum(
+        image.pixel(x, y) & 0xFFFFFF != 0
+        for y in range(image.height())
+        for x in range(image.width())
+    )
+
+
+def _clip_spans(region: QRegion):
+    """
+    The rectangles making up region, each a band of rows sharing the same
+    horizontal span, top to bottom then left to right.  Drawing each span
+    separately needs no clipping at all.
+    """
+    return tuple(sorted(region.rects(), key=lambda rect: (rect.top(), rect.left())))
+
+
+def _clip_outline(region: QRegion, tolerance) -> QPainterPath:
+    """
+    A closed polygon around region, simplified so that no point of region's
+    outline is more than tolerance pixels from it.
+
+    Only the leftmost and rightmost edge of each band is followed, so holes and
+    notches in region are filled in.
+    """
+    bands = {}
+    for rect in region.rects():
+        band = (rect.top(), rect.bottom() + 1)
+        left, right = bands.get(band, (rect.left(), rect.right() + 1))
+        bands[band] = (min(left, rect.left()), max(right, rect.right() + 1))
+
+    left_edge = []
+    right_edge = []
+    for (top, bottom), (left, right) in sorted(bands.items()):
+        left_edge += [(left, top), (left, bottom)]
+        right_edge += [(right, top), (right, bottom)]
+    points = _simplify(left_edge + right_edge[::-1], tolerance)
+
+    path = QPainterPath()
+    path.addPolygon(QPolygonF([QPointF(x, y) for x, y in points]))
+    path.closeSubpath()
+    return path
+
+
+def _clip_overlay(region: QRegion, size: QSize, fill: QColor) -> QImage:
+    """
+    An image of size filled with fill, except transparent inside region, to
+    draw over something unclipped instead of clipping it.
+    """
+    overlay = QImage(size, QImage.Format_ARGB32_Premultiplied)
+    overlay.fill(fill)
+    painter = QPainter(overlay)
+    painter.setCompositionMode(QPainter.CompositionMode_Clear)
+    painter.setClipRegion(region)
+    painter.fillRect(overlay.rect(), Qt.transparent)
+    painter.end()
+    return overlay
+
+
+def _simplify(points, tolerance):
+    """
+    Ramer-Douglas-Peucker: keep the ends, and recursively keep the point
+    furthest from the line between the points kept either side of it, for as
+    long as that's further than tolerance.
+    """
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    pending = [(0, len(points) - 1)]
+    while pending:
+        start, end = pending.pop()
+        (x0, y0), (x1, y1) = points[start], points[end]
+        dx, dy = x1 - x0, y1 - y0
+        length = (dx * dx + dy * dy) ** 0.5 or 1
+
+        furthest, furthest_distance = None, tolerance
+        for index in range(start + 1, end):
+            x, y = points[index]
+            distance = abs(dy * (x - x0) - dx * (y - y0)) / length
+            if distance > furthest_distance:
+                furthest, furthest_distance = index, distance
+
+        if furthest is not None:
+            keep[furthest] = True
+            pending += [(start, furthest), (furthest, end)]
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+if __name__ == "__main__":
+    main()
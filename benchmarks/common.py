@@ -0,0 +1,62 @@
+import os
+import statistics
+import time
+
+from PyQt5.QtCore import QPointF, QSize
+from PyQt5.QtGui import QColor, QImage, QPainter, QRadialGradient
+
+
+def use_offscreen_platform():
+    """
+    Let benchmarks which need a QGuiApplication run on machines with no display.
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def time_calls(fn, repeats):
+    """
+    Call fn repeats times, returning how long each call took in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+_UNITS = {"ms": 1000, "us": 1000 * 1000}
+
+
+def report(name, timings, unit="ms"):
+    scale = _UNITS[unit]
+    print(
+        f"{name:<40} "
+        f"mean {statistics.mean(timings) * scale:8.2f}{unit}  "
+        f"median {statistics.median(timings) * scale:8.2f}{unit}  "
+        f"min {min(timings) * scale:8.2f}{unit}  "
+        f"max {max(timings) * scale:8.2f}{unit}  "
+        f"(n={len(timings)})"
+    )
+
+
+def synthetic_image(size: QSize) -> QImage:
+    """
+    An image with enough going on in it that it doesn't compress unrealistically
+    well, standing in for a photo from the camera.
+    """
+    image = QImage(size, QImage.Format_RGB32)
+    gradient = QRadialGradient(
+        QPointF(size.width() / 2, size.height() / 2), size.width()
+    )
+    gradient.setColorAt(0, QColor("gold"))
+    gradient.setColorAt(0.5, QColor("teal"))
+    gradient.setColorAt(1, QColor("purple"))
+
+    painter = QPainter(image)
+    painter.fillRect(image.rect(), gradient)
+    for i in range(0, size.width(), 7):
+        painter.setPen(QColor.fromHsv((i * 13) % 360, 200, 200))
+        painter.drawLine(i, 0, size.width() - i, size.height())
+    painter.end()
+    return image
@@ -0,0 +1,92 @@
+"""
+Compare streaming print jobs to CUPS from memory against writing them to a
+temporary file in /dev/shm first.
+
+This needs a local CUPS with a printer which throws its output away, e.g. add
+`FileDevice Yes` to /etc/cups/cups-files.conf, restart cupsd and then:
+
+    lpadmin -p photobooth-bench -E -v file:///dev/null
+
+Then, from the root of the repository:
+
+    python -m benchmarks.cups_submission --printer photobooth-bench
+
+All jobs on the printer are cancelled once the benchmark has finished.
+"""
+
+import argparse
+from datetime import datetime
+
+import cups
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QGuiApplication
+
+from benchmarks.common import (
+    report,
+    synthetic_image,
+    time_calls,
+    use_offscreen_platform,
+)
+from photobooth.encoder import QtImageEncoder
+from photobooth.printer import submit_file, submit_streaming
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--printer", required=True, help="CUPS printer to use")
+    parser.add_argument("--jobs", type=int, default=20, help="Jobs per method")
+    parser.add_argument(
+        "--image", help="JPEG to print, defaults to a synthetic 1920x1080 image"
+    )
+    args = parser.parse_args()
+
+    use_offscreen_platform()
+    app = QGuiApplication([])  # NoQA: Unused variable
+
+    document = _load_document(args.image)
+    print(f"Document size: {len(document)} bytes")
+
+    conn = cups.Connection()
+    try:
+        report(
+            "printFile via /dev/shm",
+            time_calls(
+                lambda: submit_file(
+                    conn, args.printer, _title(), document, "image/jpeg", {}
+                ),
+                args.jobs,
+            ),
+        )
+        report(
+            "createJob + writeRequestData",
+            time_calls(
+                lambda: submit_streaming(
+                    conn,
+                    args.printer,
+                    _title(),
+                    document,
+                    "image/jpeg",
+                    {},
+                ),
+                args.jobs,
+            ),
+        )
+    finally:
+        conn.cancelAllJobs(args.printer, purge_jobs=True)
+
+
+def _title():
+    return datetime.now().strftime("photobooth-bench-%H-%M-%S-%f")
+
+
+def _load_document(path):
+    if path is not None:
+        with open(path, "rb") as f:
+            return f.read()
+
+    encoder = QtImageEncoder("jpeg", quality=75, subsampling="420", progressive=False)
+    return encoder.encode(synthetic_image(QSize(1920, 1080)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare encode time and output size of each print encoder and format, for each
+supported screen resolution, mask (i.e. print) size and typical camera sensor
+size.
+
+From the root of the repository:
+
+    python -m benchmarks.encoder
+
+libjpeg-turbo is only benchmarked if PyTurboJPEG is installed.
+"""
+
+import argparse
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QGuiApplication
+
+from benchmarks.common import (
+    report,
+    synthetic_image,
+    time_calls,
+    use_offscreen_platform,
+)
+from photobooth.encoder import DEFAULT_JPEG_QUALITY, QtImageEncoder, TurboJpegEncoder
+
+SIZES = {
+    "screen 800x480": QSize(800, 480),
+    "screen 1366x768": QSize(1366, 768),
+    "screen 1920x1080": QSize(1920, 1080),
+    "print 442x331": QSize(442, 331),
+    "print 622x465": QSize(622, 465),
+    "sensor 720p": QSize(1280, 720),
+    "sensor 1080p": QSize(1920, 1080),
+    "sensor 5MP (OV5647)": QSize(2592, 1944),
+    "sensor 8MP (IMX219)": QSize(3280, 2464),
+    "sensor 12MP (IMX477)": QSize(4056, 3040),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=10, help="Encodes per size")
+    parser.add_argument("--quality", type=int, default=DEFAULT_JPEG_QUALITY)
+    args = parser.parse_args()
+
+    use_offscreen_platform()
+    app = QGuiApplication([])  # NoQA: Unused variable
+
+    encoders = _encoders(args.quality)
+    for size_name, size in SIZES.items():
+        image = synthetic_image(size)
+        print(f"\n{size_name}")
+        for encoder_name, encoder in encoders.items():
+            size_kib = len(encoder.encode(image)) / 1024
+            report(
+                f"  {encoder_name} ({size_kib:.0f}KiB)",
+                time_calls(lambda: encoder.encode(image), args.repeats),
+            )
+
+
+def _encoders(quality):
+    encoders = {
+        "qt jpeg": QtImageEncoder("jpeg", quality, "420", progressive=False),
+        "qt jpeg progressive": QtImageEncoder("jpeg", quality, "420", progressive=True),
+        "qt png": QtImageEncoder("png", quality, "420", progressive=False),
+        "qt ppm": QtImageEncoder("ppm", quality, "420", progressive=False),
+    }
+    try:
+        for subsampling in ("420", "422", "444"):
+            encoders[f"turbo jpeg {subsampling}"] = TurboJpegEncoder(
+                quality, subsampling, progressive=False
+            )
+    except (ImportError, OSError, RuntimeError) as e:
+        print(f"Skipping libjpeg-turbo: {e}")
+    return encoders
+
+
+if __name__ == "__main__":
+    main()
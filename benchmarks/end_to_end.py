@@ -0,0 +1,344 @@
+"""
+Run the whole booth headless for a number of guests, with a mock camera and a
+mock printer, and report how long each guest took, how long each stage of
+their session took, and how much memory and CPU the booth used.
+
+From the root of the repository:
+
+    python -m benchmarks.end_to_end --cycles 20
+
+Buttons are pressed through RpiIo, just as the GPIO buttons would press them.
+The camera plays --frames, either a directory of images or an animated image,
+or synthetic frames if not given, and each print takes --printer-seconds.
+Anything else comes from --config, e.g. to try out captureMode=ringBuffer.
+
+Save the results with --save, and compare later runs against them with
+--baseline.
+"""
+
+import argparse
+import json
+import logging
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from PyQt5.QtCore import QSize, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.common import report, synthetic_image, use_offscreen_platform
+from photobooth.main import _read_config, build_photobooth
+
+# Pages of MainWindow's stacked widget, see MainWindow.set_widgets
+IDLE_PAGE = 0
+PREVIEW_PAGE = 1
+ERROR_PAGE = 3
+
+
+class _Guests:
+    """
+    Walks up to the booth whenever it's ready, presses yes, and accepts the
+    photo (or rejects it, every reject_every guests), cycles times over.
+    """
+
+    def __init__(self, app, photobooth, cycles, reject_every, think_seconds):
+        self._app = app
+        self._photobooth = photobooth
+        self._cycles = cycles
+        self._reject_every = reject_every
+        self._think_ms = int(think_seconds * 1000)
+
+        self.started = 0
+        self.errors = 0
+        self.cycle_times = []
+        self._cycle_started_at = None
+        self._ready = False
+        self._pending_press = None
+        self._finished_at = None
+
+        photobooth.idle_widget.ready.connect(self._on_ready)
+        photobooth.main_window.central_widget.currentChanged.connect(
+            self._on_page_changed
+        )
+        photobooth.print_queue.status_changed.connect(self._next_guest)
+        app.focusChanged.connect(self._on_focus_changed)
+
+    @property
+    def finished_at(self):
+        return self._finished_at
+
+    def _on_ready(self):
+        self._ready = True
+        self._next_guest()
+
+    def _on_page_changed(self, index):
+        if index == PREVIEW_PAGE:
+            if self._reject_every and self.started % self._reject_every == 0:
+                self._press_after_thinking(self._press_no)
+            else:
+                self._press_after_thinking(self._press_yes)
+        elif index == ERROR_PAGE:
+            self.errors += 1
+            self._press_after_thinking(self._press_yes)
+        else:
+            self._next_guest()
+
+    def _on_focus_changed(self, old, new):
+        if self._pending_press is not None and self._page_has_focus():
+            press, self._pending_press = self._pending_press, None
+            press()
+        self._next_guest()
+
+    def _page_has_focus(self):
+        # RpiIo only passes button presses on to the page with focus
+        return self._photobooth.main_window.central_widget.currentWidget().hasFocus()
+
+    def _press_after_thinking(self, press):
+        def think():
+            if self._page_has_focus():
+                press()
+            else:
+                self._pending_press = press
+
+        QTimer.singleShot(self._think_ms, think)
+
+    def _next_guest(self, *args):
+        page = self._photobooth.main_window.central_widget.currentIndex()
+        queue = self._photobooth.print_queue
+        if (
+            not self._ready
+            or page != IDLE_PAGE
+            or not self._page_has_focus()
+            or (queue.is_full and queue.block_when_full)
+        ):
+            return
+
+        now = time.monotonic()
+        if self._cycle_started_at is not None:
+            self.cycle_times.append(now - self._cycle_started_at)
+            self._cycle_started_at = None
+
+        if self.started < self._cycles:
+            self._ready = False
+            self.started += 1
+            self._cycle_started_at = now
+            self._press_yes()
+        elif queue.depth == 0:
+            # Every guest has been and every print has come out
+            self._finished_at = now
+            self._app.quit()
+
+    def _press_yes(self):
+        self._photobooth.rpi_io.on_yes_pressed()
+
+    def _press_no(self):
+        self._photobooth.rpi_io.no_button_pressed.emit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=10, help="Guests to serve")
+    parser.add_argument(
+        "--config", default=None, help="Config file to use, default-config.cfg if not"
+    )
+    parser.add_argument(
+        "--frames", default=None, help="Directory of images or animated image"
+    )
+    parser.add_argument("--fps", type=float, default=15, help="Mock camera fps")
+    parser.add_argument("--screen", default="800,480", help="Screen size to lay out")
+    parser.add_argument(
+        "--countdown-seconds", type=int, default=1, help="countdownTimerSeconds"
+    )
+    parser.add_argument(
+        "--printer-seconds", type=float, default=1, help="Seconds for each print"
+    )
+    parser.add_argument(
+        "--think-seconds",
+        type=float,
+        default=0.5,
+        help="Seconds each guest looks at the preview before deciding",
+    )
+    parser.add_argument(
+        "--reject-every",
+        type=int,
+        default=0,
+        help="Reject every nth photo rather than printing it, 0 to print them all",
+    )
+    parser.add_argument(
+        "--timeout-seconds", type=float, default=600, help="Give up after this long"
+    )
+    parser.add_argument("--save", default=None, help="Save the results as JSON here")
+    parser.add_argument(
+        "--baseline", default=None, help="Compare with results saved by --save"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the booth's log")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.ERROR)
+    use_offscreen_platform()
+    app = QApplication([])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        session_log_file = tmp_dir / "sessions.jsonl"
+        config = _benchmark_config(args, tmp_dir, session_log_file)
+
+        started_at = time.monotonic()
+        cpu_started = _cpu_seconds()
+        with build_photobooth(app, config) as photobooth:
+            guests = _Guests(
+                app,
+                photobooth,
+                args.cycles,
+                args.reject_every,
+                args.think_seconds,
+            )
+            photobooth.main_window.showFullScreen()
+            photobooth.main_window.activateWindow()
+
+            timed_out = []
+
+            def give_up():
+                timed_out.append(True)
+                app.quit()
+
+            QTimer.singleShot(int(args.timeout_seconds * 1000), give_up)
+            app.exec_()
+
+            wall_seconds = (guests.finished_at or time.monotonic()) - started_at
+            cpu_seconds = _cpu_seconds() - cpu_started
+            dropped_events = sum(
+                photobooth.main_controller.dropped_events.values()
+            ) + sum(photobooth.idle_widget.dropped_events.values())
+
+        stage_seconds = _stage_seconds(session_log_file)
+
+    if timed_out:
+        print(
+            f"Gave up after {args.timeout_seconds}s with {guests.started} of "
+            f"{args.cycles} guests started"
+        )
+
+    results = {
+        "cycles": len(guests.cycle_times),
+        "errors": guests.errors,
+        "dropped_events": dropped_events,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        # Kilobytes on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "cycle_seconds": guests.cycle_times,
+        "stage_seconds": stage_seconds,
+    }
+    _report(results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            _compare(results, json.load(f))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if timed_out:
+        sys.exit(1)
+
+
+def _benchmark_config(args, tmp_dir, session_log_file):
+    config = _read_config(args.config)
+
+    if args.frames is None:
+        frames_dir = tmp_dir / "frames"
+        frames_dir.mkdir()
+        for i, width in enumerate((640, 642, 644, 646)):
+            # Slightly different sizes, so that each frame is a little different
+            # once they've all been scaled to the first one's
+            synthetic_image(QSize(width, 480)).save(str(frames_dir / f"{i}.png"))
+        frames = str(frames_dir)
+    else:
+        frames = str(Path(args.frames).resolve())
+
+    config["camera"]["useMockCamera"] = "True"
+    config["camera"]["mockCameraFrames"] = frames
+    config["camera"]["mockCameraFps"] = str(args.fps)
+    # Nothing to remember between runs
+    config["camera"]["cameraCacheFile"] = ""
+    config["camera"]["viewfinderCacheFile"] = ""
+    config["camera"]["shutterLagFile"] = ""
+    config["printer"]["useMockPrinter"] = "True"
+    config["printer"]["mockPrinterSeconds"] = str(args.printer_seconds)
+    config["rpiIo"]["useMockGpioZero"] = "True"
+    config["gui"]["screenSize"] = args.screen
+    config["gui"]["countdownTimerSeconds"] = str(args.countdown_seconds)
+    if not config.has_section("tracing"):
+        config.add_section("tracing")
+    config["tracing"]["sessionLogFile"] = str(session_log_file)
+    config["tracing"]["prometheusFile"] = ""
+    return config
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _stage_seconds(session_log_file):
+    stage_seconds = defaultdict(list)
+    if not session_log_file.exists():
+        return stage_seconds
+    with session_log_file.open() as f:
+        for line in f:
+            if line.strip():
+                for stage, seconds in json.loads(line)["seconds"].items():
+                    stage_seconds[stage].append(seconds)
+    return dict(stage_seconds)
+
+
+def _report(results):
+    print(
+        f"{results['cycles']} cycles in {results['wall_seconds']:.1f}s, "
+        f"{results['errors']} errors, {results['dropped_events']} dropped events"
+    )
+    if results["cycle_seconds"]:
+        report("cycle", results["cycle_seconds"])
+    for stage, seconds in sorted(results["stage_seconds"].items()):
+        report(f"stage {stage}", seconds)
+    print(
+        f"peak RSS {results['peak_rss_mib']:.1f}MiB, "
+        f"CPU {results['cpu_seconds']:.1f}s "
+        f"({100 * results['cpu_seconds'] / results['wall_seconds']:.0f}% of one core)"
+    )
+
+
+def _compare(results, baseline):
+    print("Compared with baseline (median, then change):")
+    rows = [("cycle", results["cycle_seconds"], baseline["cycle_seconds"])] + [
+        (f"stage {stage}", seconds, baseline["stage_seconds"].get(stage))
+        for stage, seconds in sorted(results["stage_seconds"].items())
+    ]
+    for name, seconds, baseline_seconds in rows:
+        if seconds and baseline_seconds:
+            median = statistics.median(seconds)
+            baseline_median = statistics.median(baseline_seconds)
+            print(
+                f"{name:<40} {baseline_median * 1000:8.2f}ms -> "
+                f"{median * 1000:8.2f}ms  "
+                f"({_percent_change(median, baseline_median)})"
+            )
+    for name in ("peak_rss_mib", "cpu_seconds"):
+        print(
+            f"{name:<40} {baseline[name]:8.2f} -> {results[name]:8.2f}  "
+            f"({_percent_change(results[name], baseline[name])})"
+        )
+
+
+def _percent_change(value, baseline_value):
+    if baseline_value == 0:
+        return "n/a"
+    return f"{100 * (value - baseline_value) / baseline_value:+.1f}%"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compare masking photos with QPainter against VectorizedCompositor, checking
+that they give the same result, for each mask and typical camera sensor size.
+
+From the root of the repository:
+
+    python -m benchmarks.mask
+
+Needs numpy installed.
+"""
+
+import argparse
+
+import numpy
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QColor, QGuiApplication, QImage, QPainter
+
+from benchmarks.common import (
+    report,
+    synthetic_image,
+    time_calls,
+    use_offscreen_platform,
+)
+from photobooth.mask import Mask
+from photobooth.resources import images_root
+
+MASKS = (
+    "800x480-mask-cropped.png",
+    "1366x768-mask-cropped.png",
+    "1920x1080-mask-cropped.png",
+)
+SENSOR_SIZES = (
+    QSize(640, 480),
+    QSize(1280, 720),
+    QSize(1920, 1080),
+    QSize(2592, 1944),
+    QSize(3280, 2464),
+    QSize(4056, 3040),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=50, help="Calls per size")
+    args = parser.parse_args()
+
+    use_offscreen_platform()
+    app = QGuiApplication([])  # NoQA: Unused variable
+
+    for mask_name in MASKS:
+        qpainter = Mask(images_root / mask_name, vectorized=False)
+        vectorized = Mask(images_root / mask_name, vectorized=True)
+        for size in SENSOR_SIZES:
+            image = synthetic_image(size)
+            print(f"\n{mask_name} from {size.width()}x{size.height()}")
+            _check(qpainter, vectorized, image)
+            for name, mask in (("qpainter", qpainter), ("vectorized", vectorized)):
+                report(
+                    f"  {name} mask",
+                    time_calls(lambda: mask.mask(image), args.repeats),
+                )
+                report(
+                    f"  {name} shrink_and_clip_to_mask_size",
+                    time_calls(
+                        lambda: mask.shrink_and_clip_to_mask_size(image), args.repeats
+                    ),
+                )
+
+
+def _check(qpainter: Mask, vectorized: Mask, image: QImage):
+    """
+    Print how many pixels differ between the two ways of masking.
+
+    Qt samples clipped spans very slightly differently to unclipped ones, so the
+    QPainter mask can be a pixel out from its own unclipped output in a few
+    places.  VectorizedCompositor always matches the unclipped output.
+    """
+    inside = _pixels(_clip_region_image(qpainter)) != 0xFF000000
+    unclipped = _pixels(qpainter.shrink_and_clip_to_mask_size(image))
+    clipped = _pixels(qpainter.mask(image))
+    masked = _pixels(vectorized.mask(image))
+
+    unclipped_differences = numpy.count_nonzero(masked[inside] != unclipped[inside])
+    clipped_differences = numpy.count_nonzero(masked[inside] != clipped[inside])
+    print(
+        f"  pixels differing from QPainter: {unclipped_differences} unclipped, "
+        f"{clipped_differences} clipped"
+    )
+
+    if unclipped_differences:
+        raise AssertionError("Vectorized mask differs from QPainter")
+    if (masked[~inside] != 0xFFFFFFFF).any():
+        raise AssertionError("Vectorized mask isn't white outside the mask")
+    if (_pixels(vectorized.shrink_and_clip_to_mask_size(image)) != unclipped).any():
+        raise AssertionError("Vectorized shrink_and_clip_to_mask_size differs")
+
+
+def _clip_region_image(mask: Mask) -> QImage:
+    image = QImage(mask.size, QImage.Format_RGB32)
+    image.fill(QColor("black"))
+    painter = QPainter(image)
+    painter.setClipRegion(mask.clip_region)
+    painter.fillRect(image.rect(), QColor("white"))
+    painter.end()
+    return image
+
+
+def _pixels(image: QImage):
+    bits = image.constBits()
+    bits.setsize(image.byteCount())
+    # Copied, as the QImage might be thrown away as soon as we return
+    return numpy.frombuffer(bits, numpy.uint32).copy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Time repainting the live feed with the countdown overlay off, on, and on as it
+used to be drawn with drawText on every frame, for each screen's mask size.
+
+From the root of the repository:
+
+    python -m benchmarks.overlay_text
+
+Each repaint swaps the frame shown, as the viewfinder does, and waits for the
+view to repaint what changed.  The cached overlay is timed with the frame
+mirrored too, as isMirrored does to the live feed, and any case where the text
+doesn't make it onto the screen is called out.
+"""
+
+import argparse
+
+from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QPainter, QPixmap, QTransform
+from PyQt5.QtWidgets import QApplication, QGraphicsPixmapItem, QGraphicsView
+
+from benchmarks.common import (
+    report,
+    synthetic_image,
+    time_calls,
+    use_offscreen_platform,
+)
+from photobooth.mask import Mask
+from photobooth.resources import images_root
+from photobooth.widgets.overlay_text_graphics_scene import OverlayTextGraphicsScene
+
+MASKS = (
+    "800x480-mask-cropped.png",
+    "1366x768-mask-cropped.png",
+    "1920x1080-mask-cropped.png",
+)
+
+
+class _DrawTextScene(OverlayTextGraphicsScene):
+    """
+    Draws the overlay text from scratch on every frame, for comparison
+    """
+
+    def set_overlay_text(self, overlay_text):
+        self._overlay_text = overlay_text
+
+    def drawForeground(self, painter: QPainter, rect: QRectF) -> None:
+        if self._overlay_text:
+            painter.setFont(self._font)
+            painter.drawText(rect, Qt.AlignCenter, self._overlay_text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=200, help="Frames per case")
+    args = parser.parse_args()
+
+    use_offscreen_platform()
+    app = QApplication([])  # NoQA: Unused variable
+
+    for mask_name in MASKS:
+        mask = Mask(images_root / mask_name)
+        frames = [
+            QPixmap.fromImage(synthetic_image(mask.size)),
+            QPixmap.fromImage(synthetic_image(mask.size).mirrored(True, False)),
+        ]
+        print(f"\n{mask_name}")
+        for name, scene_class, text, mirrored in (
+            ("overlay off", OverlayTextGraphicsScene, "", False),
+            ("overlay off, mirrored", OverlayTextGraphicsScene, "", True),
+            ("overlay on, cached", OverlayTextGraphicsScene, "3", False),
+            ("overlay on, cached, mirrored", OverlayTextGraphicsScene, "3", True),
+            ("overlay on, drawText", _DrawTextScene, "3", False),
+            ("wait on, cached", OverlayTextGraphicsScene, "Wait..", False),
+            ("wait on, cached, mirrored", OverlayTextGraphicsScene, "Wait..", True),
+            ("wait on, drawText", _DrawTextScene, "Wait..", False),
+        ):
+            scene = scene_class(mask.size)
+            item = QGraphicsPixmapItem(frames[0])
+            if mirrored:
+                # As LiveFeedWidget mirrors the video item, which moves the
+                # scene into negative x
+                item.setTransform(QTransform().scale(-1, 1))
+            scene.addItem(item)
+            view = QGraphicsView(scene)
+            view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+            view.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+            view.setFixedSize(mask.size)
+            view.setMask(mask.clip_region)
+            view.show()
+            QApplication.processEvents()
+            without_text = view.grab().toImage()
+            scene.set_overlay_text(text)
+            QApplication.processEvents()
+            if text and view.grab().toImage() == without_text:
+                print(f"  {name}: overlay text isn't on screen!")
+
+            def next_frame():
+                frames.reverse()
+                item.setPixmap(frames[0])
+                QApplication.processEvents()
+
+            report(f"  {name}", time_calls(next_frame, args.repeats))
+            view.close()
+
+
+if __name__ == "__main__":
+    main()
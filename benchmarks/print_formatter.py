@@ -0,0 +1,156 @@
+"""
+Compare ScalingImageFormatter against FusedImageFormatter: time per print, how
+much peak memory grows while printing, and how different the pages are.
+
+From the root of the repository:
+
+    python -m benchmarks.print_formatter
+
+Each formatter is run in a fresh process, so that peak memory isn't muddied by
+the other one.  Peak memory is read from /proc, so this only works on Linux.
+"""
+
+import argparse
+import subprocess
+import sys
+from configparser import ConfigParser
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QColor, QGuiApplication
+
+from benchmarks.common import (
+    report,
+    synthetic_image,
+    time_calls,
+    use_offscreen_platform,
+)
+from photobooth.captured_image import CapturedImage
+from photobooth.image_formatter import FusedImageFormatter, ScalingImageFormatter
+from photobooth.mask import Mask
+from photobooth.resources import images_root
+
+FORMATTERS = {
+    "scaling": ScalingImageFormatter,
+    "fused": FusedImageFormatter,
+}
+MASKS = (
+    "800x480-mask-cropped.png",
+    "1920x1080-mask-cropped.png",
+)
+SENSOR_SIZES = (
+    QSize(1280, 720),
+    QSize(1920, 1080),
+    QSize(2592, 1944),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=50, help="Prints per size")
+    parser.add_argument("--scale-factor", default=".5")
+    parser.add_argument("--formatter", choices=FORMATTERS, help=argparse.SUPPRESS)
+    parser.add_argument("--mask", choices=MASKS, help=argparse.SUPPRESS)
+    parser.add_argument("--size", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    use_offscreen_platform()
+    if args.formatter is not None:
+        _run_one(args)
+        return
+
+    app = QGuiApplication([])  # NoQA: Unused variable
+    for mask_name in MASKS:
+        mask = Mask(images_root / mask_name)
+        config = _config(args.scale_factor)
+        for size in SENSOR_SIZES:
+            size_arg = f"{size.width()}x{size.height()}"
+            print(f"\n{mask_name} from {size_arg}")
+            _compare(mask, config, synthetic_image(size))
+            for formatter in FORMATTERS:
+                subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.print_formatter",
+                        f"--formatter={formatter}",
+                        f"--mask={mask_name}",
+                        f"--size={size_arg}",
+                        f"--repeats={args.repeats}",
+                        f"--scale-factor={args.scale_factor}",
+                    ],
+                    check=True,
+                )
+
+
+def _run_one(args):
+    app = QGuiApplication([])  # NoQA: Unused variable
+    width, height = (int(n) for n in args.size.split("x"))
+    image = synthetic_image(QSize(width, height))
+    mask = Mask(images_root / args.mask)
+    config = _config(args.scale_factor)
+
+    # Includes anything the formatter allocates up front
+    baseline_kib = _reset_peak_rss()
+    formatter = FORMATTERS[args.formatter](mask, config)
+    # A new CapturedImage each time, as it caches what's been rendered from it
+    timings = time_calls(
+        lambda: formatter.format_image(CapturedImage(image, is_mirrored=True)),
+        args.repeats,
+    )
+    peak_growth_kib = _memory_status_kib("VmHWM") - baseline_kib
+
+    report(f"  {args.formatter} (peak +{peak_growth_kib}KiB)", timings)
+
+
+def _compare(mask, config, image):
+    scaling = ScalingImageFormatter(mask, config).format_image(
+        CapturedImage(image, is_mirrored=True)
+    )
+    fused = FusedImageFormatter(mask, config).format_image(
+        CapturedImage(image, is_mirrored=True)
+    )
+
+    differing = 0
+    total_difference = 0
+    for y in range(scaling.height()):
+        for x in range(scaling.width()):
+            a, b = QColor(scaling.pixel(x, y)), QColor(fused.pixel(x, y))
+            difference = (
+                abs(a.red() - b.red())
+                + abs(a.green() - b.green())
+                + abs(a.blue() - b.blue())
+            )
+            differing += difference != 0
+            total_difference += difference
+    pixels = scaling.width() * scaling.height()
+    print(
+        f"  {differing} of {pixels} pixels differ between the formatters, "
+        f"mean difference per channel {total_difference / pixels / 3:.2f}"
+    )
+
+
+def _config(scale_factor):
+    config = ConfigParser()
+    config.read_dict({"printer": {"scaleFactor": scale_factor}})
+    return config["printer"]
+
+
+def _reset_peak_rss():
+    """
+    Reset VmHWM back down to VmRSS, returning it
+    """
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    return _memory_status_kib("VmRSS")
+
+
+def _memory_status_kib(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    raise ValueError(f"{field} missing from /proc/self/status")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Time dispatching an event to MainController's handler for it, as it was with
+_expect_state_then_switch and inspect.stack, and through a TransitionTable, for
+both an event which is handled and one which is dropped.
+
+From the root of the repository:
+
+    python -m benchmarks.state_machine
+
+Logging is turned off, so that only the dispatch itself is timed.  The handler
+does nothing, and is called from --depth nested frames, standing in for
+however deep the stack is when a Qt signal arrives.
+"""
+
+import argparse
+import inspect
+import logging
+
+from benchmarks.common import report, time_calls
+from photobooth.state_machine import ANY_STATE, TransitionTable
+
+logger = logging.getLogger(__name__)
+
+
+class _Idle:
+    pass
+
+
+class _Preview:
+    pass
+
+
+class _InspectController:
+    """
+    Dispatches as MainController did, with a wrapper per expected state
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.accept = self._expect_state_then_switch(_Preview, self._handler)
+
+    def _handler(self):
+        pass
+
+    def _expect_state_then_switch(self, expected_state, switch_to):
+        def _inner(*args, **kwargs):
+            caller = inspect.stack()[1][3]
+            if isinstance(self.state, expected_state):
+                logger.debug("Caught %s while in %s state", caller, self.state)
+                switch_to(*args, **kwargs)
+            else:
+                logger.warning(
+                    "Dropping unexpected %s while in %s state", caller, self.state
+                )
+
+        return _inner
+
+
+class _TableController:
+    """
+    Dispatches as MainController does now
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self._transitions = TransitionTable(
+            "Benchmark",
+            {
+                (ANY_STATE, "error"): self._handler,
+                (_Idle, "image_captured"): self._handler,
+                (_Preview, "accept"): self._handler,
+                (_Preview, "reject"): self._handler,
+            },
+        )
+
+    def accept(self):
+        self._transitions.dispatch(type(self.state), "accept")
+
+    def _handler(self):
+        pass
+
+
+def _nested(depth, fn):
+    if depth == 0:
+        fn()
+    else:
+        _nested(depth - 1, fn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=2000, help="Events per case")
+    parser.add_argument("--depth", type=int, default=5, help="Frames above handler")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    for name, controller_class in (
+        ("inspect.stack", _InspectController),
+        ("transition table", _TableController),
+    ):
+        for outcome, state in (("handled", _Preview()), ("dropped", _Idle())):
+            controller = controller_class(state)
+            report(
+                f"{name}, {outcome}",
+                time_calls(
+                    lambda: _nested(args.depth, controller.accept), args.repeats
+                ),
+                unit="us",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from PyQt5.QtCore import QObject, Qt, QTimer
+from PyQt5.QtMultimedia import (
+    QCamera,
+    QCameraViewfinderSettings,
+    QVideoFrame,
+    QVideoProbe,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveViewfinder(QObject):
+    """
+    Pick the highest viewfinder resolution which keeps up target_fps, and step
+    down to a lower one whenever the measured frame rate falls short, e.g.
+    because the Pi has got hot and throttled itself.
+
+    The resolution which was last found to work is cached in cache_path for
+    each camera device, and next time the one above it is tried first rather
+    than starting again from the top.  If that keeps up it's cached instead,
+    otherwise it's stepped down from as usual, so one slow spell, e.g. while
+    the Pi warms up, doesn't keep the resolution down for good.
+    """
+
+    # How often the frame rate is checked, ignoring the first check after the
+    # camera starts while it settles down
+    CHECK_INTERVAL_MS = 5 * 1000
+
+    # How close to target_fps counts as keeping up
+    FPS_TOLERANCE = 0.9
+
+    def __init__(self, camera: QCamera, device_name, target_fps, cache_path):
+        super().__init__()
+        self._camera = camera
+        self._device_name = device_name
+        self._target_fps = target_fps
+        self._cache_path = Path(cache_path).expanduser() if cache_path else None
+
+        # Best first, filled in once the camera is loaded and can tell us
+        self._candidates = None
+        self._current = None
+        self._held = False
+
+        # Guarded by _lock, as frames arrive on the camera's streaming thread
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._counting_since = None
+        self._settled = False
+
+        self._probe = QVideoProbe()
+        if not self._probe.setSource(camera):
+            raise ValueError(
+                "This camera doesn't support probing viewfinder frames, so "
+                "viewfinderResolution=auto can't be used"
+            )
+        self._probe.videoFrameProbed.connect(self._on_frame_probed, Qt.DirectConnection)
+
+        self._camera.statusChanged.connect(self._on_status_changed)
+        self._check_timer = QTimer()
+        self._check_timer.timeout.connect(self._check_frame_rate)
+
+    def apply(self):
+        """
+        Set the viewfinder settings, called whenever the camera has loaded
+        """
+        if self._candidates is None:
+            self._candidates = self._find_candidates()
+            if not self._candidates:
+                logger.warning(
+                    "No viewfinder settings reach %s fps, using the default",
+                    self._target_fps,
+                )
+                return
+            self._current = self._cached_candidate()
+
+        if self._current is not None:
+            self._camera.setViewfinderSettings(self._candidates[self._current])
+
+    def hold(self, held: bool):
+        """
+        Don't change resolution while held, e.g. while a photo is being taken
+        """
+        self._held = held
+
+    def _find_candidates(self):
+        # Keep the fastest settings for each resolution, biggest first
+        best_by_resolution = {}
+        for settings in self._camera.supportedViewfinderSettings():
+            max_fps = settings.maximumFrameRate()
+            # 0 means the camera didn't say, so we'll have to find out
+            if 0 < max_fps < self._target_fps:
+                continue
+            key = (settings.resolution().width(), settings.resolution().height())
+            current = best_by_resolution.get(key)
+            if current is None or max_fps > current.maximumFrameRate():
+                best_by_resolution[key] = settings
+
+        candidates = [
+            best_by_resolution[key]
+            for key in sorted(
+                best_by_resolution, key=lambda size: size[0] * size[1], reverse=True
+            )
+        ]
+        logger.info(
+            "Viewfinder resolutions which might reach %s fps: %s",
+            self._target_fps,
+            ", ".join(_describe(settings) for settings in candidates),
+        )
+        return candidates
+
+    def _cached_candidate(self):
+        cached = self._read_cache().get(self._device_name)
+        if cached is not None:
+            for index, settings in enumerate(self._candidates):
+                resolution = settings.resolution()
+                if [resolution.width(), resolution.height()] == cached["resolution"]:
+                    logger.info(
+                        "Cached viewfinder settings %s, trying %s first",
+                        cached,
+                        _describe(self._candidates[max(0, index - 1)]),
+                    )
+                    return max(0, index - 1)
+            logger.warning("Ignoring unsupported cached settings %s", cached)
+        return 0
+
+    def _on_frame_probed(self, frame: QVideoFrame):
+        with self._lock:
+            self._frames += 1
+
+    def _on_status_changed(self, status: QCamera.Status):
+        if status == QCamera.ActiveStatus:
+            self._reset_count(settled=False)
+            self._check_timer.start(AdaptiveViewfinder.CHECK_INTERVAL_MS)
+        else:
+            self._check_timer.stop()
+
+    def _reset_count(self, settled):
+        with self._lock:
+            self._frames = 0
+            self._counting_since = time.monotonic()
+            self._settled = settled
+
+    def _check_frame_rate(self):
+        with self._lock:
+            frames, counting_since, settled = (
+                self._frames,
+                self._counting_since,
+                self._settled,
+            )
+        self._reset_count(settled=True)
+
+        if not settled or self._current is None or self._held:
+            # Either still settling down or in the middle of taking a photo,
+            # which is no time to be changing resolution
+            return
+
+        fps = frames / (time.monotonic() - counting_since)
+        logger.debug(
+            "Viewfinder at %s: %.1f fps",
+            _describe(self._candidates[self._current]),
+            fps,
+        )
+        if fps >= self._target_fps * AdaptiveViewfinder.FPS_TOLERANCE:
+            self._write_cache(fps)
+        elif self._current + 1 < len(self._candidates):
+            self._current += 1
+            logger.warning(
+                "Viewfinder only reached %.1f of %s fps, stepping down to %s",
+                fps,
+                self._target_fps,
+                _describe(self._candidates[self._current]),
+            )
+            # Settings only take effect once the camera restarts
+            self._camera.stop()
+            self.apply()
+            self._camera.start()
+        else:
+            logger.warning(
+                "Viewfinder only reached %.1f of %s fps at the lowest resolution",
+                fps,
+                self._target_fps,
+            )
+
+    def _read_cache(self):
+        if self._cache_path is None or not self._cache_path.exists():
+            return {}
+        try:
+            with self._cache_path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.exception("Ignoring unreadable cache %s", self._cache_path)
+            return {}
+
+    def _write_cache(self, fps):
+        if self._cache_path is None:
+            return
+        resolution = self._candidates[self._current].resolution()
+        entry = {
+            "resolution": [resolution.width(), resolution.height()],
+            "measured_fps": round(fps, 1),
+            "target_fps": self._target_fps,
+        }
+        cache = self._read_cache()
+        if cache.get(self._device_name, {}).get("resolution") == entry["resolution"]:
+            return
+
+        cache[self._device_name] = entry
+        temporary_path = self._cache_path.with_name(self._cache_path.name + ".tmp")
+        try:
+            self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with temporary_path.open("w") as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(temporary_path, self._cache_path)
+            logger.info("Cached viewfinder settings %s", entry)
+        except OSError:
+            logger.exception("Failed to write cache %s", self._cache_path)
+
+
+def _describe(settings: QCameraViewfinderSettings):
+    resolution = settings.resolution()
+    return (
+        f"{resolution.width()}x{resolution.height()}"
+        f"@{settings.maximumFrameRate():g}fps"
+    )
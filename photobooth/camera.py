@@ -1,50 +1,123 @@
 import logging
+import time
 
 from PyQt5.QtMultimedia import QCamera, QCameraInfo, QCameraViewfinderSettings
 
+from photobooth.adaptive_viewfinder import AdaptiveViewfinder
+from photobooth.camera_capabilities import CameraCapabilityCache
+from photobooth.mock_camera import MockCamera
 from photobooth.utils import is_none_or_empty, one, to_qsize
 
 logger = logging.getLogger(__name__)
 
 
+def camera_factory(camera_config):
+    if camera_config.getboolean("useMockCamera", fallback=False):
+        return MockCamera(camera_config)
+    else:
+        return Camera(camera_config)
+
+
 class Camera(QCamera):
     def __init__(self, config) -> None:
-        super().__init__(_find_camera_info(config["deviceName"]))
+        created_at = time.monotonic()
+        capabilities = CameraCapabilityCache(config.get("cameraCacheFile", fallback=""))
+        device_name = capabilities.find_device(config["deviceName"])
+        if device_name is None:
+            # Not seen this camera before, or it's changed, so ask gstreamer
+            device_name = _find_camera_info(config["deviceName"]).deviceName()
+            found_from = "probe"
+        else:
+            found_from = "cache"
+        found_at = time.monotonic()
 
+        super().__init__(device_name.encode())
+        self.device_name = device_name
+        self._requested_device_name = config["deviceName"]
+        self._capabilities = capabilities
+        self._created_at = created_at
+        self._ready = False
+        logger.info(
+            "Found camera %s from %s in %.3fs",
+            device_name,
+            found_from,
+            found_at - created_at,
+        )
+
+        self._adaptive_viewfinder = None
         if is_none_or_empty(config["viewfinderResolution"]):
             self._requested_viewfinder_resolution = None
+        elif config["viewfinderResolution"] == "auto":
+            self._requested_viewfinder_resolution = None
+            self._adaptive_viewfinder = AdaptiveViewfinder(
+                self,
+                self.device_name,
+                config.getint("targetViewfinderFps", fallback=15),
+                config.get("viewfinderCacheFile", fallback=""),
+            )
         else:
             self._requested_viewfinder_resolution = to_qsize(
                 config["viewfinderResolution"]
             )
+            # Fail now rather than once the camera has loaded, if we already
+            # know the resolution isn't supported
+            cached_settings = capabilities.viewfinder_settings(device_name)
+            if cached_settings is not None:
+                self._check_viewfinder_resolution(
+                    [settings.resolution() for settings in cached_settings]
+                )
 
         self.statusChanged.connect(self._on_status_changed)
 
+    def hold_viewfinder_settings(self, held: bool) -> None:
+        """
+        Stop the viewfinder resolution being changed while held, e.g. while
+        taking a photo.  Only matters for viewfinderResolution=auto.
+        """
+        if self._adaptive_viewfinder is not None:
+            self._adaptive_viewfinder.hold(held)
+
     def _on_status_changed(self, status: QCamera.Status) -> None:
         logger.debug("_on_camera_status_changed: %s", status)
         if status == QCamera.LoadedStatus:
+            if not self._ready:
+                logger.info(
+                    "Camera loaded %.3fs after startup",
+                    time.monotonic() - self._created_at,
+                )
+            supported_settings = self.supportedViewfinderSettings()
+            self._capabilities.store(
+                self._requested_device_name, self.device_name, supported_settings
+            )
             supported_resolutions = self.supportedViewfinderResolutions()
             logger.info("Supported view finder resolutions: %s", supported_resolutions)
-            if self._requested_viewfinder_resolution:
-                if self._requested_viewfinder_resolution in supported_resolutions:
-                    logger.info(
-                        "Setting resolution to %s",
-                        self._requested_viewfinder_resolution,
-                    )
-                    requested_settings = QCameraViewfinderSettings()
-                    requested_settings.setResolution(
-                        self._requested_viewfinder_resolution
-                    )
-                    self.setViewfinderSettings(requested_settings)
-                else:
-                    raise ValueError(
-                        "Requested viewfinder resolution %s, "
-                        "but the only supported resolutions are %s",
-                        ", ".join(map(str, supported_resolutions)),
-                    )
+            if self._adaptive_viewfinder is not None:
+                self._adaptive_viewfinder.apply()
+            elif self._requested_viewfinder_resolution:
+                self._check_viewfinder_resolution(supported_resolutions)
+                logger.info(
+                    "Setting resolution to %s",
+                    self._requested_viewfinder_resolution,
+                )
+                requested_settings = QCameraViewfinderSettings()
+                requested_settings.setResolution(self._requested_viewfinder_resolution)
+                self.setViewfinderSettings(requested_settings)
 
             camera_resolution = self.viewfinderSettings().resolution()
             logger.info("Using resolution: %s", camera_resolution)
+        elif status == QCamera.ActiveStatus and not self._ready:
+            self._ready = True
+            logger.info(
+                "Camera active %.3fs after startup", time.monotonic() - self._created_at
+            )
+
+    def _check_viewfinder_resolution(self, supported_resolutions):
+        if self._requested_viewfinder_resolution not in supported_resolutions:
+            raise ValueError(
+                f"Requested viewfinder resolution "
+                f"{self._requested_viewfinder_resolution}, but the only supported "
+                f"resolutions are {', '.join(map(str, supported_resolutions))}"
+            )
 
 
 def _find_camera_info(requested_device_name):
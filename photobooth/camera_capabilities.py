@@ -0,0 +1,145 @@
+import copy
+import json
+import logging
+import os
+from pathlib import Path
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtMultimedia import QCameraViewfinderSettings, QVideoFrame
+
+logger = logging.getLogger(__name__)
+
+# Where v4l2 devices, e.g. /dev/video0, are described by the kernel
+_VIDEO4LINUX_ROOT = Path("/sys/class/video4linux")
+
+
+class CameraCapabilityCache:
+    """
+    Remember which camera was found and what it can do, so that the next start
+    doesn't have to ask gstreamer to enumerate every camera, which can take
+    seconds with USB webcams.
+
+    Each device is cached along with its identity, i.e. its name and USB vendor,
+    product and serial number read from sysfs, and an entry is only used while
+    the same device is still plugged in at the same device name.  Anything else
+    means a full probe, and the cache is refreshed whenever the camera loads.
+    """
+
+    def __init__(self, cache_path):
+        self._path = Path(cache_path).expanduser() if cache_path else None
+        self._cache = self._load()
+
+    def find_device(self, requested_device_name):
+        """
+        The device name to open for requested_device_name, where blank means
+        the default camera, or None if it can't be trusted from the cache.
+        """
+        device_name = (
+            self._cache.get("default")
+            if not requested_device_name
+            else requested_device_name
+        )
+        if device_name is None or self._entry(device_name) is None:
+            return None
+        return device_name
+
+    def viewfinder_settings(self, device_name):
+        """
+        The cached viewfinder settings of device_name, or None if unknown
+        """
+        entry = self._entry(device_name)
+        if entry is None:
+            return None
+        return [_settings_from_json(settings) for settings in entry["settings"]]
+
+    def store(self, requested_device_name, device_name, viewfinder_settings):
+        """
+        Update the cache with what's just been found out about device_name,
+        only writing it out if anything has changed.
+        """
+        entry = {
+            "identity": _device_identity(device_name),
+            "settings": [_settings_to_json(s) for s in viewfinder_settings],
+        }
+        cache = copy.deepcopy(self._cache)
+        cache.setdefault("devices", {})[device_name] = entry
+        if not requested_device_name:
+            cache["default"] = device_name
+        if cache == self._cache:
+            return
+
+        self._cache = cache
+        if self._path is None:
+            return
+        # Write then rename, so that nothing ever reads half a file
+        temporary_path = self._path.with_name(self._path.name + ".tmp")
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with temporary_path.open("w") as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(temporary_path, self._path)
+            logger.info("Cached capabilities of camera %s", device_name)
+        except OSError:
+            logger.exception("Failed to write camera cache %s", self._path)
+
+    def _entry(self, device_name):
+        entry = self._cache.get("devices", {}).get(device_name)
+        if entry is None:
+            return None
+        identity = _device_identity(device_name)
+        if identity is None or identity != entry["identity"]:
+            logger.info(
+                "Camera %s has changed from %s to %s, ignoring cache",
+                device_name,
+                entry["identity"],
+                identity,
+            )
+            return None
+        return entry
+
+    def _load(self):
+        if self._path is None or not self._path.exists():
+            return {}
+        try:
+            with self._path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.exception("Ignoring unreadable camera cache %s", self._path)
+            return {}
+
+
+def _device_identity(device_name):
+    """
+    e.g. "UVC Camera (046d:0825) 046d 0825 1A2B3C4D" for a v4l2 device name such
+    as /dev/video0, from the kernel's name for it plus the vendor, product and
+    serial number if it's a USB device, or None if there's no such device.
+    """
+    video = _VIDEO4LINUX_ROOT / Path(device_name).name
+    try:
+        identity = [(video / "name").read_text().strip()]
+        # device is the USB interface, the vendor and product are on its parent
+        usb_device = (video / "device").resolve().parent
+        for name in ("idVendor", "idProduct", "serial"):
+            if (usb_device / name).exists():
+                identity.append((usb_device / name).read_text().strip())
+    except OSError:
+        return None
+    return " ".join(identity)
+
+
+def _settings_to_json(settings: QCameraViewfinderSettings):
+    return {
+        "resolution": [settings.resolution().width(), settings.resolution().height()],
+        "minimumFrameRate": settings.minimumFrameRate(),
+        "maximumFrameRate": settings.maximumFrameRate(),
+        "pixelFormat": int(settings.pixelFormat()),
+    }
+
+
+def _settings_from_json(settings) -> QCameraViewfinderSettings:
+    result = QCameraViewfinderSettings()
+    result.setResolution(QSize(*settings["resolution"]))
+    result.setMinimumFrameRate(settings["minimumFrameRate"])
+    result.setMaximumFrameRate(settings["maximumFrameRate"])
+    result.setPixelFormat(QVideoFrame.PixelFormat(settings["pixelFormat"]))
+    return result
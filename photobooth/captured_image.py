@@ -0,0 +1,54 @@
+import logging
+
+from PyQt5.QtGui import QImage
+
+from photobooth.mask import Mask
+
+logger = logging.getLogger(__name__)
+
+
+class CapturedImage:
+    """
+    A photo just as it came from the camera, along with whether it still needs
+    mirroring.
+
+    Rather than mirroring the full size photo up front, and then cropping and
+    scaling copies of that for each screen and for printing, each of those asks
+    for exactly the image it needs, with mirroring, cropping, scaling and
+    masking all done in the one draw straight from the camera's pixels.  Each
+    result is cached, as the preview and printing screens and the print job
+    all want the same few images.
+
+    Safe to use from the render thread and the GUI thread at once; at worst
+    both render the same image, and only one of them is kept.
+    """
+
+    def __init__(self, image: QImage, is_mirrored: bool):
+        self.image = image
+        self.is_mirrored = is_mirrored
+        self._cache = {}
+
+    def size(self):
+        return self.image.size()
+
+    def preview(self, mask: Mask) -> QImage:
+        """
+        Cropped and scaled to the size of mask, but not masked
+        """
+        return self._cached("preview", mask, mask.shrink_and_clip_to_mask_size)
+
+    def masked(self, mask: Mask) -> QImage:
+        """
+        Cropped and scaled to the size of mask, and masked, see Mask.mask
+        """
+        return self._cached("masked", mask, mask.mask)
+
+    def _cached(self, kind, mask, render):
+        key = (kind, id(mask))
+        result = self._cache.get(key)
+        if result is None:
+            logger.debug("Rendering %s of captured image", kind)
+            result = self._cache.setdefault(
+                key, render(self.image, mirrored=self.is_mirrored)
+            )
+        return result
@@ -0,0 +1,121 @@
+import logging
+
+from PyQt5.QtCore import QRect, QSize
+from PyQt5.QtGui import QColor, QImage
+
+logger = logging.getLogger(__name__)
+
+_white = QColor("white")
+
+
+class VectorizedCompositor:
+    """
+    Crop, scale and mask an image in one pass with numpy, instead of painting it
+    with QPainter through a clip region of one rectangle per scanline.
+
+    Which pixels are inside the mask is worked out once, and so is, for each
+    size of source image, which source pixel ends up in each of those output
+    pixels.  Compositing is then one gather straight out of the source QImage's
+    buffer and one scatter straight into the result's.
+
+    Pixels are sampled exactly as QPainter.drawImage does without
+    SmoothPixmapTransform, i.e. nearest neighbour, so that the result is
+    identical to what Mask would otherwise paint.
+
+    Raises ImportError if numpy isn't installed.
+    """
+
+    def __init__(self, mask_image: QImage):
+        # Imported here as it's optional, see Mask
+        import numpy
+
+        self._numpy = numpy
+        self.size = mask_image.size()
+
+        mask_image = mask_image.convertToFormat(QImage.Format_RGB32)
+        # Same as the clip region, which is everything that isn't pure white
+        self._inside = numpy.flatnonzero(
+            (pixel_view(numpy, mask_image) & 0xFFFFFF) != 0xFFFFFF
+        )
+        logger.debug(
+            "%s of %s pixels inside mask",
+            self._inside.size,
+            self.size.width() * self.size.height(),
+        )
+
+        # Source pixel index for every output pixel and for those inside the
+        # mask, by (source size, crop rect)
+        self._plans = {}
+
+    def composite(
+        self, image: QImage, crop_rect: QRect, masked=True, mirrored=False
+    ) -> QImage:
+        """
+        Scale the crop_rect part of image to the size of the mask.  If masked,
+        only pixels inside the mask are drawn and the rest are left white.  If
+        mirrored, image is flipped left to right first, and crop_rect is of
+        the flipped image.
+        """
+        if image.format() != QImage.Format_RGB32:
+            image = image.convertToFormat(QImage.Format_RGB32)
+
+        plan, masked_plan = self._plan(image.size(), crop_rect, mirrored)
+        source = pixel_view(self._numpy, image).reshape(-1)
+
+        result = QImage(self.size, QImage.Format_RGB32)
+        target = pixel_view(self._numpy, result, writable=True).reshape(-1)
+        if masked:
+            result.fill(_white)
+            target[self._inside] = source.take(masked_plan)
+        else:
+            source.take(plan, out=target)
+        return result
+
+    def _plan(self, source_size: QSize, crop_rect: QRect, mirrored):
+        key = (
+            source_size.width(),
+            source_size.height(),
+            crop_rect.x(),
+            crop_rect.y(),
+            crop_rect.width(),
+            crop_rect.height(),
+            mirrored,
+        )
+        plan = self._plans.get(key)
+        if plan is None:
+            logger.info("Building sampling plan for %s", key)
+            plan = self._build_plan(source_size, crop_rect, mirrored)
+            self._plans[key] = plan
+        return plan
+
+    def _build_plan(self, source_size: QSize, crop_rect: QRect, mirrored):
+        numpy = self._numpy
+        columns = _axis(
+            numpy, self.size.width(), crop_rect.x(), crop_rect.width()
+        ).clip(0, source_size.width() - 1)
+        if mirrored:
+            columns = source_size.width() - 1 - columns
+        rows = _axis(numpy, self.size.height(), crop_rect.y(), crop_rect.height()).clip(
+            0, source_size.height() - 1
+        )
+        plan = (rows[:, numpy.newaxis] * source_size.width() + columns).reshape(-1)
+        return plan, plan[self._inside]
+
+
+def _axis(numpy, target_length, crop_start, crop_length):
+    """
+    For each pixel along one axis of the target, the source pixel it's sampled
+    from, rounding like Qt's 16.16 fixed point scaling does.
+    """
+    step = (crop_length << 16) // target_length
+    return crop_start + ((numpy.arange(target_length) * step + step // 2) >> 16)
+
+
+def pixel_view(numpy, image: QImage, writable=False):
+    """
+    The pixels of a 32 bit QImage as a height x width array of uint32, without
+    copying them.  32 bit scanlines are always aligned, so there's no padding.
+    """
+    bits = image.bits() if writable else image.constBits()
+    bits.setsize(image.byteCount())
+    return numpy.frombuffer(bits, numpy.uint32).reshape(image.height(), image.width())
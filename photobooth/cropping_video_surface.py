@@ -0,0 +1,283 @@
+import logging
+
+from PyQt5.QtCore import QRect, QRectF, QSize, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter
+from PyQt5.QtMultimedia import (
+    QAbstractVideoBuffer,
+    QAbstractVideoSurface,
+    QVideoFrame,
+    QVideoSurfaceFormat,
+)
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+
+from photobooth.compositor import pixel_view
+
+logger = logging.getLogger(__name__)
+
+
+class CroppingVideoSurface(QAbstractVideoSurface):
+    """
+    A viewfinder which only converts the part of each frame that's actually
+    shown, rather than converting, scaling and painting the whole frame and
+    then clipping most of it away.
+
+    Frames are fitted to target_size as QGraphicsVideoItem does with
+    KeepAspectRatioByExpanding, i.e. scaled to cover it and centred, but only
+    the pixels within visible_rect of that are sampled, straight from the
+    camera's own YUV or RGB buffer, and converted into image.  Which bytes of
+    the frame each of those pixels come from, mirrored if need be, is worked
+    out once per frame layout, so each frame is a few gathers and some integer
+    arithmetic on only as many pixels as are on the screen.
+
+    frame_ready is emitted whenever image has been updated.
+
+    Raises ImportError if numpy isn't installed.
+    """
+
+    frame_ready = pyqtSignal()
+
+    def __init__(self, target_size: QSize, visible_rect: QRect, is_mirrored: bool):
+        super().__init__()
+        # Imported here as it's optional, see LiveFeedWidget
+        import numpy
+
+        self._numpy = numpy
+        self._target_size = target_size
+        self._visible_rect = visible_rect
+        self._is_mirrored = is_mirrored
+
+        self.image = QImage(visible_rect.size(), QImage.Format_RGB32)
+        self.image.fill(QColor("black"))
+        self._pixels = pixel_view(numpy, self.image, writable=True)
+
+        # Byte indices to sample for the current frame layout, see _build_plan
+        self._layout = None
+        self._plan = None
+        # Reused for the intermediate steps of converting each frame
+        self._scratch = [numpy.empty(self._pixels.shape, numpy.int32) for _ in range(5)]
+
+    def supportedPixelFormats(self, handle_type=QAbstractVideoBuffer.NoHandle):
+        if handle_type != QAbstractVideoBuffer.NoHandle:
+            return []
+        return list(_CONVERTERS)
+
+    def start(self, surface_format: QVideoSurfaceFormat) -> bool:
+        logger.info(
+            "Starting viewfinder with %s frames of %s",
+            surface_format.pixelFormat(),
+            surface_format.frameSize(),
+        )
+        self._layout = None
+        return super().start(surface_format)
+
+    def present(self, frame: QVideoFrame) -> bool:
+        converter = _CONVERTERS.get(frame.pixelFormat())
+        if converter is None or not frame.map(QVideoFrame.ReadOnly):
+            self.setError(QAbstractVideoSurface.IncorrectFormatError)
+            return False
+        try:
+            layout = (
+                frame.pixelFormat(),
+                frame.width(),
+                frame.height(),
+                frame.bytesPerLine(),
+            )
+            if layout != self._layout:
+                self._plan = self._build_plan(converter, *layout[1:])
+                self._layout = layout
+
+            size = frame.mappedBytes()
+            bits = frame.bits()
+            bits.setsize(size)
+            converter.convert(
+                self._numpy,
+                self._numpy.frombuffer(bits, self._numpy.uint8),
+                self._plan,
+                self._pixels,
+                self._scratch,
+            )
+        finally:
+            frame.unmap()
+
+        self.frame_ready.emit()
+        return True
+
+    def _build_plan(self, converter, width, height, bytes_per_line):
+        numpy = self._numpy
+        # Scale to cover target_size, centred, as KeepAspectRatioByExpanding
+        scale = max(
+            self._target_size.width() / width, self._target_size.height() / height
+        )
+        offset_x = (width * scale - self._target_size.width()) / 2
+        offset_y = (height * scale - self._target_size.height()) / 2
+
+        xs = numpy.arange(self._visible_rect.left(), self._visible_rect.right() + 1)
+        if self._is_mirrored:
+            xs = self._target_size.width() - 1 - xs
+        ys = numpy.arange(self._visible_rect.top(), self._visible_rect.bottom() + 1)
+        columns = ((xs + offset_x + 0.5) / scale).astype(numpy.intp).clip(0, width - 1)
+        rows = ((ys + offset_y + 0.5) / scale).astype(numpy.intp).clip(0, height - 1)
+
+        logger.info(
+            "Sampling %sx%s of %sx%s viewfinder frames",
+            len(columns),
+            len(rows),
+            width,
+            height,
+        )
+        return converter.plan(numpy, rows, columns, height, bytes_per_line)
+
+
+class VideoSurfaceItem(QGraphicsItem):
+    """
+    Draws a CroppingVideoSurface's image at its visible_rect, taking up the
+    whole of target_size in the scene like the QGraphicsVideoItem it replaces.
+    """
+
+    def __init__(self, surface: CroppingVideoSurface, target_size, visible_rect):
+        super().__init__()
+        self._surface = surface
+        self._bounding_rect = QRectF(0, 0, target_size.width(), target_size.height())
+        self._visible_rect = visible_rect
+        surface.frame_ready.connect(self._on_frame_ready)
+
+    def boundingRect(self) -> QRectF:
+        return self._bounding_rect
+
+    def paint(
+        self,
+        painter: QPainter,
+        option: QStyleOptionGraphicsItem,
+        widget: QWidget = None,
+    ) -> None:
+        painter.drawImage(self._visible_rect.topLeft(), self._surface.image)
+
+    def _on_frame_ready(self):
+        self.update(QRectF(self._visible_rect))
+
+
+class _PackedRgb:
+    """
+    32 bit RGB, one uint32 per pixel, so no conversion is needed
+    """
+
+    @staticmethod
+    def plan(numpy, rows, columns, height, bytes_per_line):
+        return (rows[:, numpy.newaxis] * (bytes_per_line // 4) + columns,)
+
+    @staticmethod
+    def convert(numpy, buffer, plan, out, scratch):
+        (pixels,) = plan
+        # Only whole pixels, in case the buffer has trailing padding
+        words = buffer[: buffer.size - buffer.size % 4].view(numpy.uint32)
+        numpy.bitwise_or(words.take(pixels), 0xFF000000, out=out)
+
+
+class _Yuv:
+    """
+    Base for YUV formats, where plan gives the byte offsets of each pixel's Y,
+    U and V, and the sampled pixels are converted from BT.601 to RGB.  All the
+    arithmetic is done in place in scratch, as allocating temporaries for
+    every step takes longer than the arithmetic itself.
+    """
+
+    @staticmethod
+    def convert(numpy, buffer, plan, out, scratch):
+        y_offsets, u_offsets, v_offsets = plan
+        c, d, e, channel, rgb = scratch
+        numpy.subtract(buffer.take(y_offsets), 16, out=c, dtype=numpy.int32)
+        c *= 298
+        c += 128
+        numpy.subtract(buffer.take(u_offsets), 128, out=d, dtype=numpy.int32)
+        numpy.subtract(buffer.take(v_offsets), 128, out=e, dtype=numpy.int32)
+
+        # Red, c + 409e
+        numpy.multiply(e, 409, out=channel)
+        channel += c
+        _to_channel(numpy, channel, 16)
+        rgb[...] = channel
+        # Blue, c + 516d
+        numpy.multiply(d, 516, out=channel)
+        channel += c
+        _to_channel(numpy, channel, 0)
+        rgb |= channel
+        # Green, c - 100d - 208e, overwriting e and d as they're not needed
+        e *= -208
+        d *= -100
+        numpy.add(c, d, out=channel)
+        channel += e
+        _to_channel(numpy, channel, 8)
+        rgb |= channel
+
+        out[...] = rgb
+        out |= 0xFF000000
+
+
+def _to_channel(numpy, value, shift):
+    value >>= 8
+    numpy.clip(value, 0, 255, out=value)
+    value <<= shift
+
+
+class _Yuv420Planar(_Yuv):
+    """
+    A full size Y plane, then quarter size U and V planes, swapped for YV12
+    """
+
+    def __init__(self, u_first):
+        self._u_first = u_first
+
+    def plan(self, numpy, rows, columns, height, bytes_per_line):
+        y = rows[:, numpy.newaxis] * bytes_per_line + columns
+        chroma = (rows[:, numpy.newaxis] // 2) * (bytes_per_line // 2) + (columns // 2)
+        first = height * bytes_per_line + chroma
+        second = first + (height // 2) * (bytes_per_line // 2)
+        return (y, first, second) if self._u_first else (y, second, first)
+
+
+class _Yuv420SemiPlanar(_Yuv):
+    """
+    A full size Y plane, then a half height plane of interleaved U and V, or V
+    and U for NV21
+    """
+
+    def __init__(self, u_first):
+        self._u_first = u_first
+
+    def plan(self, numpy, rows, columns, height, bytes_per_line):
+        y = rows[:, numpy.newaxis] * bytes_per_line + columns
+        first = (
+            height * bytes_per_line
+            + (rows[:, numpy.newaxis] // 2) * bytes_per_line
+            + (columns // 2) * 2
+        )
+        return (y, first, first + 1) if self._u_first else (y, first + 1, first)
+
+
+class _Yuv422Packed(_Yuv):
+    """
+    Pairs of pixels sharing U and V, packed as Y0 U Y1 V for YUYV, or U Y0 V Y1
+    for UYVY
+    """
+
+    def __init__(self, y_first):
+        self._y_first = y_first
+
+    def plan(self, numpy, rows, columns, height, bytes_per_line):
+        row_start = rows[:, numpy.newaxis] * bytes_per_line
+        pair_start = row_start + (columns // 2) * 4
+        if self._y_first:
+            return row_start + columns * 2, pair_start + 1, pair_start + 3
+        return row_start + columns * 2 + 1, pair_start, pair_start + 2
+
+
+_CONVERTERS = {
+    QVideoFrame.Format_YUV420P: _Yuv420Planar(u_first=True),
+    QVideoFrame.Format_YV12: _Yuv420Planar(u_first=False),
+    QVideoFrame.Format_NV12: _Yuv420SemiPlanar(u_first=True),
+    QVideoFrame.Format_NV21: _Yuv420SemiPlanar(u_first=False),
+    QVideoFrame.Format_YUYV: _Yuv422Packed(y_first=True),
+    QVideoFrame.Format_UYVY: _Yuv422Packed(y_first=False),
+    QVideoFrame.Format_RGB32: _PackedRgb(),
+    QVideoFrame.Format_ARGB32: _PackedRgb(),
+}
@@ -0,0 +1,221 @@
+import logging
+import statistics
+import time
+from collections import deque
+from itertools import count
+
+import cups
+from PyQt5.QtCore import (
+    QCoreApplication,
+    QObject,
+    Qt,
+    QThread,
+    QTimer,
+    pyqtSignal,
+    pyqtSlot,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CupsConnectionManager(QObject):
+    """
+    Own the connection to CUPS on a worker thread, so that no IPC call ever
+    blocks the GUI.
+
+    Requests are made with call, which runs either a named method of
+    cups.Connection, or a function taking the connection as its first argument,
+    on the worker thread.  The result (or error message) is passed to on_result
+    (or on_error) back on the thread which made the call.
+
+    The connection is health checked every so often and whenever a call fails,
+    and if it's gone away, e.g. because cupsd restarted, it's re-opened with
+    exponential backoff.  Every call is timed, see latency_measured.
+    """
+
+    # Emitted with the name of the call and how long it took in seconds
+    latency_measured = pyqtSignal(str, float)
+    connected = pyqtSignal()
+    disconnected = pyqtSignal(str)
+
+    _request = pyqtSignal(int, object, tuple, dict)
+    _request_blocking = pyqtSignal(object, tuple, dict, object)
+    _stop_worker = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._request_ids = count(1)
+        self._callbacks = {}
+
+        self._worker = _CupsWorker()
+        self._thread = QThread()
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.start)
+
+        self._request.connect(self._worker.run)
+        self._request_blocking.connect(
+            self._worker.run_blocking, Qt.BlockingQueuedConnection
+        )
+        self._stop_worker.connect(self._worker.stop, Qt.BlockingQueuedConnection)
+        self._worker.finished.connect(self._on_finished)
+        self._worker.failed.connect(self._on_failed)
+        self._worker.latency_measured.connect(self.latency_measured)
+        self._worker.connected.connect(self.connected)
+        self._worker.disconnected.connect(self.disconnected)
+
+        QCoreApplication.instance().aboutToQuit.connect(self._stop)
+        self._thread.start()
+
+    def call(self, fn, *args, on_result=None, on_error=None, **kwargs):
+        request_id = next(self._request_ids)
+        self._callbacks[request_id] = (on_result, on_error)
+        self._request.emit(request_id, fn, args, kwargs)
+
+    def call_blocking(self, fn, *args, **kwargs):
+        """
+        Like call, but wait for the result and return it, raising if the call
+        failed.  Only for use at startup, before the GUI is up and running.
+        """
+        outcome = []
+        self._request_blocking.emit(fn, args, kwargs, outcome)
+        [(result, error)] = outcome
+        if error is not None:
+            raise error
+        return result
+
+    def _on_finished(self, request_id, result):
+        on_result, _ = self._callbacks.pop(request_id)
+        if on_result is not None:
+            on_result(result)
+
+    def _on_failed(self, request_id, message):
+        _, on_error = self._callbacks.pop(request_id)
+        if on_error is not None:
+            on_error(message)
+
+    def _stop(self):
+        self._stop_worker.emit()
+        self._thread.quit()
+        self._thread.wait()
+
+
+class _CupsWorker(QObject):
+    HEALTH_CHECK_INTERVAL_MS = 10 * 1000
+    MIN_RECONNECT_DELAY_SECONDS = 1
+    MAX_RECONNECT_DELAY_SECONDS = 30
+
+    # Calls slower than this are logged as warnings
+    SLOW_CALL_SECONDS = 1
+    LATENCY_SAMPLES = 100
+
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    latency_measured = pyqtSignal(str, float)
+    connected = pyqtSignal()
+    disconnected = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._conn = None
+        self._health_check_timer = None
+        self._reconnect_delay_seconds = _CupsWorker.MIN_RECONNECT_DELAY_SECONDS
+        self._latencies = deque(maxlen=_CupsWorker.LATENCY_SAMPLES)
+
+    @pyqtSlot()
+    def start(self):
+        # Called on the worker thread, so that everything is created there
+        self._health_check_timer = QTimer()
+        self._health_check_timer.timeout.connect(self._health_check)
+        self._health_check_timer.start(_CupsWorker.HEALTH_CHECK_INTERVAL_MS)
+        self._connect()
+
+    @pyqtSlot()
+    def stop(self):
+        # Timers have to be stopped and thrown away on the thread they belong to
+        self._health_check_timer.stop()
+        self._health_check_timer = None
+        self._conn = None
+
+    @pyqtSlot(int, object, tuple, dict)
+    def run(self, request_id, fn, args, kwargs):
+        try:
+            result = self._call(fn, args, kwargs)
+        except Exception as e:
+            self.failed.emit(request_id, str(e))
+        else:
+            self.finished.emit(request_id, result)
+
+    @pyqtSlot(object, tuple, dict, object)
+    def run_blocking(self, fn, args, kwargs, outcome):
+        try:
+            outcome.append((self._call(fn, args, kwargs), None))
+        except Exception as e:
+            outcome.append((None, e))
+
+    def _call(self, fn, args, kwargs):
+        if self._conn is None:
+            raise RuntimeError("Not connected to CUPS")
+
+        name = fn if isinstance(fn, str) else fn.__name__
+        start = time.monotonic()
+        try:
+            if isinstance(fn, str):
+                return getattr(self._conn, fn)(*args, **kwargs)
+            else:
+                return fn(self._conn, *args, **kwargs)
+        except Exception:
+            logger.exception("CUPS call %s failed", name)
+            # Might just be a bad request, but might be that cupsd has gone away
+            self._check_connection()
+            raise
+        finally:
+            self._record_latency(name, time.monotonic() - start)
+
+    def _record_latency(self, name, seconds):
+        self._latencies.append(seconds)
+        if seconds >= _CupsWorker.SLOW_CALL_SECONDS:
+            logger.warning("Slow CUPS call %s took %.3fs", name, seconds)
+        else:
+            logger.debug("CUPS call %s took %.3fs", name, seconds)
+        self.latency_measured.emit(name, seconds)
+
+    def _health_check(self):
+        if self._conn is None or not self._check_connection():
+            return
+
+        if self._latencies:
+            logger.info(
+                "CUPS call latency over last %s calls - median: %.3fs, max: %.3fs",
+                len(self._latencies),
+                statistics.median(self._latencies),
+                max(self._latencies),
+            )
+
+    def _check_connection(self):
+        try:
+            self._conn.getDefault()
+        except (cups.IPPError, cups.HTTPError, RuntimeError) as e:
+            logger.error("CUPS health check failed: %s", e)
+            self._conn = None
+            self.disconnected.emit(str(e))
+            self._connect()
+            return False
+        return True
+
+    def _connect(self):
+        try:
+            self._conn = cups.Connection()
+        except RuntimeError:
+            logger.exception(
+                "Failed to connect to CUPS, retrying in %ss",
+                self._reconnect_delay_seconds,
+            )
+            QTimer.singleShot(self._reconnect_delay_seconds * 1000, self._connect)
+            self._reconnect_delay_seconds = min(
+                self._reconnect_delay_seconds * 2,
+                _CupsWorker.MAX_RECONNECT_DELAY_SECONDS,
+            )
+        else:
+            logger.info("Connected to CUPS")
+            self._reconnect_delay_seconds = _CupsWorker.MIN_RECONNECT_DELAY_SECONDS
+            self.connected.emit()
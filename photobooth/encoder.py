@@ -0,0 +1,140 @@
+import logging
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QImageWriter
+
+logger = logging.getLogger(__name__)
+
+# MIME types CUPS knows each format by
+MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "ppm": "image/x-portable-anymap",
+}
+
+DEFAULT_JPEG_QUALITY = 75
+JPEG_SUBSAMPLINGS = ("444", "422", "420")
+
+
+def encoder_factory(printer_config):
+    """
+    Build the encoder described by the printer config, using libjpeg-turbo for
+    JPEGs if it's installed and falling back to Qt otherwise.
+    """
+    image_format = printer_config.get("printFormat", fallback="jpeg").lower()
+    if image_format not in MIME_TYPES:
+        raise ValueError(
+            f"Unknown printFormat {image_format}, "
+            f"supported formats are {', '.join(MIME_TYPES)}"
+        )
+
+    quality = printer_config.getint("jpegQuality", fallback=DEFAULT_JPEG_QUALITY)
+    if quality < 0 or quality > 100:
+        raise ValueError("Only JPEG qualities between 0 and 100 are valid")
+
+    subsampling = printer_config.get("jpegSubsampling", fallback="420")
+    if subsampling not in JPEG_SUBSAMPLINGS:
+        raise ValueError(
+            f"Unknown jpegSubsampling {subsampling}, "
+            f"supported values are {', '.join(JPEG_SUBSAMPLINGS)}"
+        )
+
+    progressive = printer_config.getboolean("jpegProgressive", fallback=False)
+
+    if image_format == "jpeg":
+        try:
+            encoder = TurboJpegEncoder(quality, subsampling, progressive)
+        except (ImportError, OSError, RuntimeError) as e:
+            logger.info("libjpeg-turbo not available, using Qt to encode: %s", e)
+        else:
+            logger.info("Using libjpeg-turbo to encode")
+            return encoder
+
+    return QtImageEncoder(image_format, quality, subsampling, progressive)
+
+
+class QtImageEncoder:
+    """
+    Encode with whichever of Qt's image plugins handles image_format.
+
+    Qt gives no control over chroma subsampling, so that's left to the plugin's
+    default.
+    """
+
+    def __init__(self, image_format, quality, subsampling, progressive):
+        self.image_format = image_format
+        self.mime_type = MIME_TYPES[image_format]
+        self._quality = quality
+        self._progressive = progressive
+
+        if image_format == "jpeg" and subsampling != "420":
+            logger.warning(
+                "Qt can't set JPEG subsampling, ignoring jpegSubsampling=%s",
+                subsampling,
+            )
+
+    def encode(self, image: QImage) -> bytes:
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+
+        writer = QImageWriter(buffer, self.image_format.encode())
+        if self.image_format == "jpeg":
+            writer.setQuality(self._quality)
+            writer.setProgressiveScanWrite(self._progressive)
+        if not writer.write(image):
+            raise ValueError(
+                f"Failed to encode image as {self.image_format}: "
+                f"{writer.errorString()}"
+            )
+
+        buffer.close()
+        return data.data()
+
+
+class TurboJpegEncoder:
+    """
+    Encode JPEGs with libjpeg-turbo, via PyTurboJPEG, straight from the QImage's
+    pixel buffer.  Raises ImportError, OSError or RuntimeError if PyTurboJPEG,
+    numpy or libturbojpeg itself aren't installed.
+    """
+
+    image_format = "jpeg"
+    mime_type = MIME_TYPES["jpeg"]
+
+    def __init__(self, quality, subsampling, progressive):
+        # Imported here as they're optional, see encoder_factory
+        import numpy
+        import turbojpeg
+
+        self._numpy = numpy
+        self._turbojpeg = turbojpeg
+        self._turbo_jpeg = turbojpeg.TurboJPEG()
+
+        self._quality = quality
+        self._subsampling = {
+            "444": turbojpeg.TJSAMP_444,
+            "422": turbojpeg.TJSAMP_422,
+            "420": turbojpeg.TJSAMP_420,
+        }[subsampling]
+        self._flags = turbojpeg.TJFLAG_PROGRESSIVE if progressive else 0
+
+    def encode(self, image: QImage) -> bytes:
+        if image.format() != QImage.Format_RGB32:
+            image = image.convertToFormat(QImage.Format_RGB32)
+
+        # Format_RGB32 is stored as 0xffRRGGBB words, i.e. B, G, R, X bytes on
+        # a little-endian machine, with no padding at the end of each line.
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        pixels = self._numpy.frombuffer(bits, self._numpy.uint8).reshape(
+            image.height(), image.width(), 4
+        )
+
+        return self._turbo_jpeg.encode(
+            pixels,
+            quality=self._quality,
+            pixel_format=self._turbojpeg.TJPF_BGRX,
+            jpeg_subsample=self._subsampling,
+            flags=self._flags,
+        )
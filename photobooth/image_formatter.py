@@ -1,9 +1,19 @@
 from PyQt5.QtCore import QPoint, QRect
-from PyQt5.QtGui import QColor, QImage, QPainter
+from PyQt5.QtGui import QColor, QImage, QPainter, QTransform
+
+from photobooth.captured_image import CapturedImage
+from photobooth.mask import mirror_rect, mirror_transform
 
 _white = QColor("white")
 
 
+def image_formatter_factory(mask, config):
+    if config.getboolean("fusedFormatting", fallback=False):
+        return FusedImageFormatter(mask, config)
+    else:
+        return ScalingImageFormatter(mask, config)
+
+
 class ScalingImageFormatter:
     """
     Scale the image content by scale_content, e.g. if the image is 200x200 and
@@ -19,21 +29,80 @@ class ScalingImageFormatter:
             raise ValueError("Only scale factors between 0 and 1 are valid")
         self._scale_factor = scale_factor
 
-    def format_image(self, raw_image: QImage):
-        masked = self._mask.mask(raw_image)
+    def format_image(self, captured: CapturedImage):
+        masked = captured.masked(self._mask)
 
         image_size = masked.size()
         content_size = image_size * self._scale_factor
-        image = QImage(image_size, raw_image.format())
+        image = QImage(image_size, masked.format())
         image.fill(_white)
 
         painter = QPainter(image)
 
         def get_image_content_rect():
-            x = (image_size.width() - content_size.width()) / 2
-            y = (image_size.height() - content_size.height()) / 2
+            x = (image_size.width() - content_size.width()) // 2
+            y = (image_size.height() - content_size.height()) // 2
             return QRect(QPoint(x, y), content_size)
 
         painter.drawImage(get_image_content_rect(), masked.scaled(content_size))
         painter.end()
         return image
+
+
+class FusedImageFormatter:
+    """
+    Lay the page out like ScalingImageFormatter, but crop, mirror, mask, scale
+    and centre the raw image in a single draw, straight onto a page image which is
+    reused from one print to the next.
+
+    The result is close to ScalingImageFormatter's but not identical: the photo
+    is resampled once, straight to its printed size, rather than to the mask's
+    size and then again to the printed size.  About one pixel in ten differs, by
+    a few levels per channel.
+
+    The page is handed out as a shallow copy, so if it's still being held on to
+    when the next image is formatted, Qt copies it rather than drawing over it.
+    """
+
+    def __init__(self, mask, config):
+        self._mask = mask
+
+        scale_factor = float(config["scaleFactor"])
+        if scale_factor > 1 or scale_factor < 0:
+            raise ValueError("Only scale factors between 0 and 1 are valid")
+
+        page_size = mask.size
+        content_size = page_size * scale_factor
+        self._content_rect = QRect(
+            QPoint(
+                (page_size.width() - content_size.width()) // 2,
+                (page_size.height() - content_size.height()) // 2,
+            ),
+            content_size,
+        )
+        self._clip_region = (
+            QTransform()
+            .translate(self._content_rect.x(), self._content_rect.y())
+            .scale(
+                content_size.width() / page_size.width(),
+                content_size.height() / page_size.height(),
+            )
+            .map(mask.clip_region)
+        )
+
+        self._page = QImage(page_size, QImage.Format_RGB32)
+
+    def format_image(self, captured: CapturedImage):
+        self._page.fill(_white)
+
+        raw_image = captured.image
+        clip_rect = self._mask.build_clip_rect(raw_image)
+        painter = QPainter(self._page)
+        painter.setClipRegion(self._clip_region)
+        if captured.is_mirrored:
+            painter.setTransform(mirror_transform(self._content_rect))
+            clip_rect = mirror_rect(clip_rect, raw_image.width())
+        painter.drawImage(self._content_rect, raw_image, clip_rect)
+        painter.end()
+
+        return QImage(self._page)
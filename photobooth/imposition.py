@@ -0,0 +1,222 @@
+import logging
+from functools import partial
+from typing import Sequence
+
+from PyQt5.QtCore import QPoint, QRect, QSize, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+from photobooth.captured_image import CapturedImage
+from photobooth.mask import Mask
+from photobooth.render_worker import RenderWorker, SpeculativeRenderer
+
+logger = logging.getLogger(__name__)
+
+_white = QColor("white")
+
+
+class SheetLayout:
+    """
+    A grid of rows x columns cells, filled row by row, with each photo taking up
+    copies cells in a row, e.g. 4 rows, 2 columns and 2 copies is a strip of four
+    photos printed twice side by side, to be cut in half.
+    """
+
+    def __init__(self, printer_config):
+        self.rows = printer_config.getint("sheetRows", fallback=1)
+        self.columns = printer_config.getint("sheetColumns", fallback=1)
+        self.copies = printer_config.getint("copiesPerPhoto", fallback=1)
+
+        if self.rows < 1 or self.columns < 1 or self.copies < 1:
+            raise ValueError("sheetRows, sheetColumns and copiesPerPhoto must be >= 1")
+        if (self.rows * self.columns) % self.copies != 0:
+            raise ValueError(
+                f"A {self.rows}x{self.columns} sheet can't be split evenly into "
+                f"{self.copies} copies of each photo"
+            )
+
+    @property
+    def is_single_photo(self):
+        return self.rows == 1 and self.columns == 1
+
+    @property
+    def photos_per_sheet(self):
+        return self.rows * self.columns // self.copies
+
+    def cells(self, photo_index):
+        """
+        The (row, column) of each cell holding the photo_index'th photo
+        """
+        for cell_index in range(
+            photo_index * self.copies, (photo_index + 1) * self.copies
+        ):
+            yield divmod(cell_index, self.columns)
+
+
+class SheetFormatter:
+    """
+    Lay out several masked photos on one sheet, with each cell the size of the
+    mask, and then scale the content by scaleFactor like ScalingImageFormatter.
+    """
+
+    def __init__(self, mask: Mask, layout: SheetLayout, config):
+        self._mask = mask
+        self._layout = layout
+
+        scale_factor = float(config["scaleFactor"])
+        if scale_factor > 1 or scale_factor < 0:
+            raise ValueError("Only scale factors between 0 and 1 are valid")
+        self._scale_factor = scale_factor
+
+        self._sheet_size = QSize(
+            self._mask.size.width() * layout.columns,
+            self._mask.size.height() * layout.rows,
+        )
+        content_size = self._sheet_size * self._scale_factor
+        self._content_rect = QRect(
+            QPoint(
+                (self._sheet_size.width() - content_size.width()) // 2,
+                (self._sheet_size.height() - content_size.height()) // 2,
+            ),
+            content_size,
+        )
+
+    def mask_photo(self, captured: CapturedImage) -> QImage:
+        return captured.masked(self._mask)
+
+    def format_sheet(self, masked_photos: Sequence[QImage]) -> QImage:
+        sheet = QImage(self._sheet_size, QImage.Format_RGB32)
+        sheet.fill(_white)
+
+        painter = QPainter(sheet)
+        painter.setRenderHints(QPainter.Antialiasing, QPainter.SmoothPixmapTransform)
+        for photo_index, masked in enumerate(masked_photos):
+            for row, column in self._layout.cells(photo_index):
+                # Each cell is scaled straight from the masked photo onto the
+                # sheet, rather than via an intermediate scaled copy.
+                painter.drawImage(self._cell_rect(row, column), masked)
+        painter.end()
+
+        return sheet
+
+    def _cell_rect(self, row, column):
+        cell_width = self._content_rect.width() / self._layout.columns
+        cell_height = self._content_rect.height() / self._layout.rows
+        left = self._content_rect.left() + round(column * cell_width)
+        top = self._content_rect.top() + round(row * cell_height)
+        right = self._content_rect.left() + round((column + 1) * cell_width)
+        bottom = self._content_rect.top() + round((row + 1) * cell_height)
+        return QRect(left, top, right - left, bottom - top)
+
+
+class SheetRenderer(SpeculativeRenderer):
+    """
+    A SpeculativeRenderer which collects committed photos onto a sheet, and only
+    has something to print once the sheet is full.
+
+    While a photo is on screen, it's masked in the background, or if it would
+    fill the sheet then the whole sheet is rendered.  Once committed, the photo
+    either completes the sheet and ready is emitted, or it's added to the sheet
+    and added_to_sheet is emitted.  A sheet which isn't filled within
+    sheetTimeoutSeconds is printed anyway, and emitted with flushed.
+    """
+
+    added_to_sheet = pyqtSignal(int, int)
+    flushed = pyqtSignal(bytes)
+
+    def __init__(
+        self,
+        render_worker: RenderWorker,
+        sheet_formatter: SheetFormatter,
+        layout: SheetLayout,
+        printer_config,
+    ):
+        super().__init__(render_worker, sheet_formatter)
+        self._layout = layout
+        self._masked_photos = []
+        self._flush_job_id = None
+
+        self._flush_timer = QTimer()
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(
+            printer_config.getint("sheetTimeoutSeconds", fallback=120) * 1000
+        )
+        self._flush_timer.timeout.connect(self._flush)
+
+    def start(self, image: CapturedImage):
+        super().start(image)
+        # Don't print the sheet out from under a photo which might be added to
+        # it.  After super().start, as that discards, which restarts the timer.
+        self._flush_timer.stop()
+
+    def discard(self):
+        super().discard()
+        if self._masked_photos and not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _submit(self, image):
+        masked_photos = tuple(self._masked_photos)
+        if len(masked_photos) + 1 == self._layout.photos_per_sheet:
+            return self._render_worker.submit(
+                partial(_render_full_sheet, self._image_formatter, masked_photos, image)
+            )
+        else:
+            return self._render_worker.submit(
+                partial(self._image_formatter.mask_photo, image), encode=False
+            )
+
+    def _deliver(self, result):
+        if isinstance(result, bytes):
+            logger.info("Sheet complete")
+            self._masked_photos = []
+            self._flush_timer.stop()
+            self.ready.emit(result)
+        else:
+            self._masked_photos.append(result)
+            logger.info(
+                "Added photo to sheet, %s of %s",
+                len(self._masked_photos),
+                self._layout.photos_per_sheet,
+            )
+            self._flush_timer.start()
+            self.added_to_sheet.emit(
+                len(self._masked_photos), self._layout.photos_per_sheet
+            )
+
+    def _flush(self):
+        if not self._masked_photos:
+            return
+
+        logger.info("Printing partial sheet of %s photos", len(self._masked_photos))
+        if self._job_id is not None:
+            self._render_worker.cancel(self._job_id)
+            self._job_id = None
+        self._flush_job_id = self._render_worker.submit(
+            partial(self._image_formatter.format_sheet, tuple(self._masked_photos))
+        )
+        self._masked_photos = []
+
+        if self._image is not None:
+            # Anything rendered for the photo on screen was onto the sheet which
+            # has just been printed, so start again on a new sheet
+            self._data = None
+            self._job_id = self._submit(self._image)
+
+    def _on_rendered(self, job_id, result):
+        if job_id == self._flush_job_id:
+            self._flush_job_id = None
+            self.flushed.emit(result)
+        else:
+            super()._on_rendered(job_id, result)
+
+    def _on_failed(self, job_id, message):
+        if job_id == self._flush_job_id:
+            self._flush_job_id = None
+            logger.error("Failed to render partial sheet: %s", message)
+        else:
+            super()._on_failed(job_id, message)
+
+
+def _render_full_sheet(sheet_formatter: SheetFormatter, masked_photos, image):
+    return sheet_formatter.format_sheet(
+        masked_photos + (sheet_formatter.mask_photo(image),)
+    )
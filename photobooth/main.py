@@ -2,19 +2,28 @@ import argparse
 import logging
 import signal
 from configparser import ConfigParser
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 
 from PyQt5 import QtGui
 from PyQt5.QtCore import QPoint, QSize
 from PyQt5.QtWidgets import QApplication
 
-from photobooth.camera import Camera
-from photobooth.image_formatter import ScalingImageFormatter
+from photobooth.camera import camera_factory
+from photobooth.encoder import encoder_factory
+from photobooth.image_formatter import image_formatter_factory
+from photobooth.imposition import SheetFormatter, SheetLayout, SheetRenderer
 from photobooth.main_controller import MainController
 from photobooth.mask import Mask
+from photobooth.pixmap_cache import PixmapCache
+from photobooth.print_queue import PrintQueue
 from photobooth.printer import printer_factory
+from photobooth.render_worker import RenderWorker, SpeculativeRenderer
 from photobooth.resources import fonts_root, images_root, stylesheets_root
-from photobooth.rpi_io import rpi_io_factory
+from photobooth.rpi_io import RpiIo, rpi_io_factory
+from photobooth.session_trace import SessionTracer
+from photobooth.utils import is_none_or_empty, to_qsize
 from photobooth.widgets.error_widget import ErrorWidget
 from photobooth.widgets.idle_widget import IdleWidget
 from photobooth.widgets.main_window import MainWindow
@@ -66,6 +75,21 @@ _screen_config = {
 }
 
 
+@dataclass
+class Photobooth:
+    """
+    The parts of a running photobooth which something other than a guest might
+    want to drive or watch, e.g. benchmarks.end_to_end
+    """
+
+    main_window: MainWindow
+    main_controller: MainController
+    idle_widget: IdleWidget
+    rpi_io: RpiIo
+    print_queue: PrintQueue
+    tracer: SessionTracer
+
+
 def main():
     args = _parse_args()
 
@@ -76,14 +100,36 @@ def main():
     app = QApplication([])
     app.setApplicationName(APPLICATION_NAME)
 
-    screen_config = _get_screen_config(app)
-
     signal.signal(signal.SIGINT, _sigint_handler(app))
 
+    with build_photobooth(app, config) as photobooth:
+        photobooth.main_window.showFullScreen()
+        app.exec_()
+
+
+@contextmanager
+def build_photobooth(app: QApplication, config) -> Photobooth:
+    screen_config = _get_screen_config(app, config["gui"])
+
     _load_fonts()
 
-    camera = Camera(config["camera"])
-    mask = Mask(images_root / screen_config["mask"])
+    camera = camera_factory(config["camera"])
+    mask = Mask(
+        images_root / screen_config["mask"],
+        vectorized=config["gui"].getboolean("vectorizedMasking", fallback=False),
+    )
+
+    # Shared by the preview, printing and error screens
+    pixmap_cache = PixmapCache(
+        config["gui"].getint("pixmapCacheMiB", fallback=32) * 1024 * 1024
+    )
+
+    # Older configs have no [tracing] section, so don't trace anything for them
+    tracing_config = config["tracing"] if config.has_section("tracing") else {}
+    tracer = SessionTracer(
+        session_log_file=tracing_config.get("sessionLogFile", ""),
+        prometheus_file=tracing_config.get("prometheusFile", ""),
+    )
 
     with rpi_io_factory(config["rpiIo"]) as rpi_io:
         main_window = MainWindow()
@@ -94,25 +140,35 @@ def main():
             mask_offset=screen_config["mask_offset"],
             camera=camera,
             rpi_io=rpi_io,
+            tracer=tracer,
             parent=main_window,
         )
         preview_widget = PreviewWidget(
             mask=mask,
             mask_offset=screen_config["mask_offset"],
+            pixmap_cache=pixmap_cache,
             rpi_io=rpi_io,
             parent=main_window,
         )
         printing_widget = PrintingWidget(
-            mask=mask, mask_offset=screen_config["mask_offset"], parent=main_window
+            mask=mask,
+            mask_offset=screen_config["mask_offset"],
+            pixmap_cache=pixmap_cache,
+            parent=main_window,
         )
         error_widget = ErrorWidget(
             mask=mask,
             mask_offset=screen_config["mask_offset"],
+            pixmap_cache=pixmap_cache,
             rpi_io=rpi_io,
             parent=main_window,
         )
-        image_formatter = ScalingImageFormatter(mask, config["printer"])
-        printer = printer_factory(config["printer"], image_formatter)
+        encoder = encoder_factory(config["printer"])
+        renderer = _renderer_factory(mask, encoder, config["printer"])
+        print_queue = PrintQueue(
+            printer_factory(config["printer"], encoder.mime_type, tracer),
+            config["printer"],
+        )
 
         main_window.set_widgets(
             idle_widget=idle_widget,
@@ -121,22 +177,45 @@ def main():
             error_widget=error_widget,
         )
 
-        main_controller = MainController(  # NoQA: Unused variable
+        main_controller = MainController(
             main_window=main_window,
             idle_widget=idle_widget,
             preview_widget=preview_widget,
             printing_widget=printing_widget,
             error_widget=error_widget,
-            printer=printer,
+            print_queue=print_queue,
+            renderer=renderer,
+            tracer=tracer,
             config=config["gui"],
         )
 
         with (stylesheets_root / screen_config["stylesheet"]).open("r") as stylesheet:
             app.setStyleSheet(stylesheet.read())
 
-        main_window.showFullScreen()
+        yield Photobooth(
+            main_window=main_window,
+            main_controller=main_controller,
+            idle_widget=idle_widget,
+            rpi_io=rpi_io,
+            print_queue=print_queue,
+            tracer=tracer,
+        )
+
 
-        app.exec_()
+def _renderer_factory(mask, encoder, printer_config):
+    render_worker = RenderWorker(encoder)
+    layout = SheetLayout(printer_config)
+    if layout.is_single_photo:
+        return SpeculativeRenderer(
+            render_worker, image_formatter_factory(mask, printer_config)
+        )
+    else:
+        return SheetRenderer(
+            render_worker,
+            SheetFormatter(mask, layout, printer_config),
+            layout,
+            printer_config,
+        )
 
 
 def _parse_args():
@@ -160,16 +239,19 @@ def _read_config(requested_config_location):
     return config
 
 
-def _get_screen_config(app):
-    screensize = app.desktop().screenGeometry().size()
+def _get_screen_config(app, gui_config):
+    if is_none_or_empty(gui_config.get("screenSize", fallback="")):
+        screensize = app.desktop().screenGeometry().size()
+    else:
+        screensize = to_qsize(gui_config["screenSize"])
     screensize_as_tuple = screensize.width(), screensize.height()
     try:
         screen_config = _screen_config[screensize_as_tuple]
     except KeyError:
+        supported_sizes = ", ".join(f"{w}x{h}" for w, h in _screen_config)
         raise ValueError(
             f"Unsupported resolution: {screensize} - only supported sizes are "
-            f"{', '.join(_screen_config.keys())}.  See main.py for how to add "
-            f"more"
+            f"{supported_sizes}.  See main.py for how to add more"
         )
     return screen_config
 
@@ -1,11 +1,15 @@
-import inspect
 import logging
 from dataclasses import dataclass
+from functools import partial
 
 from PyQt5.QtCore import QTimer
-from PyQt5.QtGui import QImage
 
-from photobooth.printer import LibCupsPrinter
+from photobooth.captured_image import CapturedImage
+from photobooth.imposition import SheetRenderer
+from photobooth.print_queue import PrintQueue
+from photobooth.render_worker import SpeculativeRenderer
+from photobooth.session_trace import SessionTracer
+from photobooth.state_machine import ANY_STATE, TransitionTable
 from photobooth.widgets.error_widget import ErrorWidget
 from photobooth.widgets.idle_widget import IdleWidget
 from photobooth.widgets.main_window import MainWindow
@@ -25,11 +29,11 @@ class MainController:
 
     @dataclass
     class Preview:
-        image: QImage
+        image: CapturedImage
 
     @dataclass
     class Printing:
-        image: QImage
+        image: CapturedImage
 
     @dataclass
     class Error:
@@ -42,7 +46,9 @@ class MainController:
         preview_widget: PreviewWidget,
         printing_widget: PrintingWidget,
         error_widget: ErrorWidget,
-        printer: LibCupsPrinter,
+        print_queue: PrintQueue,
+        renderer: SpeculativeRenderer,
+        tracer: SessionTracer,
         config,
     ):
         super().__init__()
@@ -51,97 +57,182 @@ class MainController:
         self._preview_widget = preview_widget
         self._printing_widget = printing_widget
         self._error_widget = error_widget
-        self._printer = printer
+        self._print_queue = print_queue
+        self._renderer = renderer
+        self._tracer = tracer
         self._error_timeout_seconds = config.getint("errorTimeoutSeconds")
         self._preview_timeout_seconds = config.getint("previewTimeoutSeconds")
 
         self._timeout_timer = QTimer()
 
-        # Connect signals
+        # Transitions
         #
 
-        self._idle_widget.error.connect(self._switch_to_error)
-        self._idle_widget.image_captured.connect(
-            self._expect_state_then_switch(MainController.Idle, self._switch_to_preview)
-        )
-
-        self._preview_widget.accept.connect(
-            self._expect_state_then_switch(
-                MainController.Preview, self._switch_to_printing
-            )
+        Idle, Preview, Printing, Error = (
+            MainController.Idle,
+            MainController.Preview,
+            MainController.Printing,
+            MainController.Error,
         )
-        self._preview_widget.reject.connect(
-            self._expect_state_then_switch(MainController.Preview, self._switch_to_idle)
+        self._transitions = TransitionTable(
+            "MainController",
+            {
+                (ANY_STATE, "error"): self._switch_to_error,
+                (Idle, "image_captured"): self._switch_to_preview,
+                (Preview, "accept"): self._switch_to_printing,
+                (Preview, "reject"): self._on_rejected,
+                (Preview, "preview_timeout"): self._on_preview_timeout,
+                (Printing, "print_job_rendered"): self._submit_print_job,
+                (Printing, "print_job_render_failed"): self._on_print_job_render_failed,
+                (Printing, "added_to_sheet"): self._on_added_to_sheet,
+                (Printing, "print_job_queued"): self._switch_to_idle,
+                # e.g. a partial sheet, printed after sheetTimeoutSeconds
+                (ANY_STATE, "print_job_queued"): self._on_other_print_job_queued,
+                (Error, "accept"): self._switch_to_idle,
+                (Error, "error_timeout"): self._switch_to_idle,
+            },
         )
 
-        self._printer.error.connect(self._switch_to_error)
-        self._printer.success.connect(
-            self._expect_state_then_switch(
-                MainController.Printing,
-                self._switch_to_idle,
-            )
-        )
+        # Connect signals
+        #
 
-        self._error_widget.accept.connect(
-            self._expect_state_then_switch(MainController.Error, self._switch_to_idle)
-        )
+        self._idle_widget.error.connect(self._on("error"))
+        self._idle_widget.image_captured.connect(self._on("image_captured"))
+
+        self._preview_widget.accept.connect(self._on("accept"))
+        self._preview_widget.reject.connect(self._on("reject"))
+
+        self._renderer.ready.connect(self._on("print_job_rendered"))
+        self._renderer.failed.connect(self._on("print_job_render_failed"))
+        if isinstance(self._renderer, SheetRenderer):
+            self._renderer.added_to_sheet.connect(self._on("added_to_sheet"))
+            self._renderer.flushed.connect(self._print_queue.submit)
+
+        self._print_queue.error.connect(self._on("error"))
+        self._print_queue.queued.connect(self._on("print_job_queued"))
+        self._print_queue.job_failed.connect(self._on_print_job_failed)
+        self._print_queue.status_changed.connect(self._on_print_queue_status_changed)
+
+        self._error_widget.accept.connect(self._on("accept"))
 
         self._main_window.quit.connect(self._main_window.deleteLater)
 
         # Initialise state
         #
 
+        self.state = None
         self._switch_to_idle()
 
     def _cancel_timeouts(self):
         self._timeout_timer.stop()
 
-    def _expect_state_then_switch(self, expected_state, switch_to):
-        def _inner(*args, **kwargs):
-            caller = inspect.stack()[1][3]
-            if isinstance(self.state, expected_state):
-                logger.debug("Caught %s while in %s state", caller, self.state)
-                switch_to(*args, **kwargs)
-            else:
-                logger.warning(
-                    "Dropping unexpected %s while in %s state", caller, self.state
-                )
+    @property
+    def dropped_events(self):
+        """
+        How many of each event have been dropped in each state
+        """
+        return self._transitions.dropped
+
+    def dispatch(self, event: str, *args):
+        self._transitions.dispatch(type(self.state), event, *args)
 
-        return _inner
+    def _on(self, event: str):
+        """
+        A slot which dispatches event, along with the signal's arguments
+        """
+        return partial(self.dispatch, event)
 
     def _switch_to_idle(self):
         self._cancel_timeouts()
+        self._renderer.discard()
         self.state = MainController.Idle()
         self._idle_widget.reload()
         self._main_window.select_idle()
 
     def _switch_to_preview(self, image):
+        self._tracer.begin("preview")
         self._cancel_timeouts()
         self.state = MainController.Preview(image)
         self.last_captured_image = image
+        self._renderer.start(image)
         self._preview_widget.set_image(image)
         self._main_window.select_preview()
+        self._tracer.end("preview")
+        self._tracer.begin("decision")
         self._timeout_timer.singleShot(
             self._preview_timeout_seconds * 1000,
-            self._expect_state_then_switch(
-                MainController.Preview, self._switch_to_idle
-            ),
+            self._on("preview_timeout"),
         )
 
     def _switch_to_printing(self):
+        self._tracer.end("decision")
+        self._tracer.begin("print_render")
         self._cancel_timeouts()
         self.state = MainController.Printing(self.state.image)
         self._printing_widget.set_image(self.state.image)
         self._main_window.select_printing()
-        self._printer.print(self.state.image)
+        self._renderer.commit()
+
+    def _on_rejected(self):
+        self._tracer.end("decision")
+        self._tracer.finish_current("rejected")
+        self._switch_to_idle()
+
+    def _on_preview_timeout(self):
+        self._tracer.finish_current("timed_out")
+        self._switch_to_idle()
+
+    def _submit_print_job(self, data: bytes):
+        # The print queue finishes the session once the job has printed
+        self._tracer.end("print_render")
+        session = self._tracer.current_session()
+        self._tracer.release_session()
+        self._print_queue.submit(data, session)
+
+    def _on_other_print_job_queued(self):
+        # The print queue's status has already been updated, so nothing to do
+        logger.debug("Print job queued in state %s", type(self.state).__name__)
+
+    def _on_added_to_sheet(self, photos_on_sheet: int, photos_per_sheet: int):
+        self._tracer.end("print_render")
+        self._tracer.finish_current("added_to_sheet")
+        self._switch_to_idle()
+        self._idle_widget.show_notice(
+            f"Added to sheet, {photos_on_sheet} of {photos_per_sheet}"
+        )
+
+    def _on_print_job_render_failed(self, message: str):
+        self._switch_to_error(f"Failed to prepare print: {message}")
+
+    def _on_print_job_failed(self, message: str):
+        # The guest who's waiting for this print has probably wandered off by
+        # now, so let whoever's at the booth know without interrupting them.
+        self._idle_widget.show_notice(f"Print failed: {message[:50]}")
+
+    def _on_print_queue_status_changed(self, depth: int, is_full: bool):
+        if is_full:
+            self._idle_widget.set_status_text(
+                "Printer busy, please wait"
+                if self._print_queue.block_when_full
+                else "Printer busy"
+            )
+        elif depth > 0:
+            self._idle_widget.set_status_text(f"Printing {depth}")
+        else:
+            self._idle_widget.set_status_text("")
+        self._idle_widget.set_capture_blocked(
+            is_full and self._print_queue.block_when_full
+        )
 
     def _switch_to_error(self, message: str):
         logger.error("_on_error: %s", message)
+        self._tracer.finish_current("error")
         self._cancel_timeouts()
+        self._renderer.discard()
         self.state = MainController.Error(message)
         self._main_window.select_error()
         self._error_widget.set_error_message(message)
         self._timeout_timer.singleShot(
             self._error_timeout_seconds * 1000,
-            self._expect_state_then_switch(MainController.Error, self._switch_to_idle),
+            self._on("error_timeout"),
         )
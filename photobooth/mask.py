@@ -2,13 +2,34 @@ import logging
 from pathlib import Path
 
 from PyQt5.QtCore import QRect, Qt
-from PyQt5.QtGui import QColor, QImage, QPainter, QPixmap, QRegion
+from PyQt5.QtGui import QColor, QImage, QPainter, QPixmap, QRegion, QTransform
+
+from photobooth.compositor import VectorizedCompositor
 
 logger = logging.getLogger(__name__)
 
+_white = QColor("white")
+
 
 class Mask:
-    def __init__(self, mask_path: Path):
+    """
+    The shape photos are cut out into, everything which isn't white in the mask
+    image.
+
+    Images are cropped, scaled and masked with QPainter, or if vectorized is True
+    and numpy is installed, with VectorizedCompositor.  The two match exactly
+    without clipping, but QPainter samples a little differently when clipped to
+    clip_region, so the masked photos which are printed can differ by a few
+    hundred pixels, e.g. 331 for the 1920x1080 mask from a 4056x3040 photo; see
+    benchmarks.mask.
+
+    clip_region is only around a hundred rects for these masks, and clipping to
+    it measured about as cheap as not clipping at all, so there's nothing to be
+    had from clipping to spans, an outline path or an overlay instead; see
+    benchmarks.clip_geometry.
+    """
+
+    def __init__(self, mask_path: Path, vectorized=False):
         mask_pix = QPixmap()
         if not mask_pix.load(str(mask_path)):
             raise ValueError(f"Failed to load mask from {mask_path}")
@@ -21,35 +42,67 @@ class Mask:
         )
         logger.debug("clip_region: %s", self.clip_region)
         logger.debug("clip_region bounding rect: %s", self.clip_region.boundingRect())
-
-    def mask(self, image: QImage) -> QImage:
-        clip_rect = self._build_clip_rect(image)
+        logger.debug("clip_region rects: %s", self.clip_region.rectCount())
+
+        self._compositor = None
+        if vectorized:
+            try:
+                self._compositor = VectorizedCompositor(mask_pix.toImage())
+            except ImportError as e:
+                logger.info("numpy not available, masking with QPainter: %s", e)
+
+    def mask(self, image: QImage, mirrored=False) -> QImage:
+        """
+        Crop and scale image to fill the mask, leaving everything outside the
+        mask white.  If mirrored, image is flipped left to right in the same
+        draw.
+        """
+        clip_rect = self.build_clip_rect(image)
+        if self._compositor is not None:
+            return self._compositor.composite(
+                image, clip_rect, masked=True, mirrored=mirrored
+            )
 
         masked = QImage(self.size, QImage.Format_RGB32)
+        masked.fill(_white)
 
         painter = QPainter(masked)
         painter.setRenderHints(QPainter.Antialiasing, QPainter.SmoothPixmapTransform)
         painter.setClipRegion(self.clip_region)
+        if mirrored:
+            painter.setTransform(mirror_transform(masked.rect()))
+            clip_rect = mirror_rect(clip_rect, image.width())
         painter.drawImage(masked.rect(), image, clip_rect)
 
         painter.end()
 
         return masked
 
-    def shrink_and_clip_to_mask_size(self, image):
-        clip_rect = self._build_clip_rect(image)
+    def shrink_and_clip_to_mask_size(self, image, mirrored=False):
+        clip_rect = self.build_clip_rect(image)
+        if self._compositor is not None:
+            return self._compositor.composite(
+                image, clip_rect, masked=False, mirrored=mirrored
+            )
 
         shrunk_and_clipped = QImage(self.size, QImage.Format_RGB32)
 
         painter = QPainter(shrunk_and_clipped)
         painter.setRenderHints(QPainter.Antialiasing, QPainter.SmoothPixmapTransform)
+        if mirrored:
+            painter.setTransform(mirror_transform(shrunk_and_clipped.rect()))
+            clip_rect = mirror_rect(clip_rect, image.width())
         painter.drawImage(shrunk_and_clipped.rect(), image, clip_rect)
 
         painter.end()
 
         return shrunk_and_clipped
 
-    def _build_clip_rect(self, image):
+    def build_clip_rect(self, image):
+        """
+        The largest rect in the middle of image with the same aspect ratio as
+        the mask
+        """
         logger.debug("Image size: %s", image.size())
         image_height_for_width = image.height() / image.width()
         mask_height_for_width = float(self.size.height()) / self.size.width()
@@ -63,7 +116,7 @@ class Mask:
             clip_height = int(image.size().width() * mask_height_for_width)
             clip_rect = QRect(
                 0,
-                (image.size().height() - clip_height) / 2,
+                (image.size().height() - clip_height) // 2,
                 image.size().width(),
                 clip_height,
             )
@@ -71,10 +124,24 @@ class Mask:
             # image is wider than mask
             clip_width = int(image.size().height() / mask_height_for_width)
             clip_rect = QRect(
-                (image.size().width() - clip_width) / 2,
+                (image.size().width() - clip_width) // 2,
                 0,
                 clip_width,
                 image.size().height(),
             )
         logger.debug("Clip rect: %s", clip_rect)
         return clip_rect
+
+
+def mirror_transform(rect: QRect) -> QTransform:
+    """
+    Flips anything drawn within rect left to right, leaving it within rect
+    """
+    return QTransform(-1, 0, 0, 1, rect.left() + rect.right() + 1, 0)
+
+
+def mirror_rect(rect: QRect, width) -> QRect:
+    """
+    Where rect ends up when an image width pixels wide is flipped left to right
+    """
+    return QRect(width - rect.x() - rect.width(), rect.y(), rect.width(), rect.height())
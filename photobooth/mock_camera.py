@@ -0,0 +1,166 @@
+import logging
+from itertools import count
+from pathlib import Path
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
+from PyQt5.QtMultimedia import (
+    QAbstractVideoSurface,
+    QCamera,
+    QCameraViewfinderSettings,
+    QVideoFrame,
+    QVideoSurfaceFormat,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MockCamera(QObject):
+    """
+    Mock camera which plays frames from a directory of images, or from an
+    animated image such as a GIF, round and round at mockCameraFps.  Photos
+    are whichever frame is showing when capture is triggered.
+
+    Stands in for Camera as far as LiveFeedWidget is concerned, so the whole
+    booth can run without a webcam, e.g. see benchmarks.end_to_end.
+    """
+
+    device_name = "mock"
+
+    error = pyqtSignal(int)
+    statusChanged = pyqtSignal(int)
+
+    def __init__(self, camera_config):
+        super().__init__()
+        self._frames = _load_frames(Path(camera_config["mockCameraFrames"]))
+        self._frame_index = 0
+        self._status = QCamera.UnloadedStatus
+        self._surface = None
+
+        self._settings = QCameraViewfinderSettings()
+        self._settings.setResolution(self._frames[0].size())
+
+        self._timer = QTimer()
+        self._timer.setInterval(
+            int(1000 / camera_config.getfloat("mockCameraFps", fallback=15))
+        )
+        self._timer.timeout.connect(self._present_next_frame)
+
+        logger.warning(
+            "Mock camera playing %s frames from %s",
+            len(self._frames),
+            camera_config["mockCameraFrames"],
+        )
+
+    def setViewfinder(self, viewfinder):
+        if isinstance(viewfinder, QAbstractVideoSurface):
+            self._surface = viewfinder
+        else:
+            # A QGraphicsVideoItem, which draws whatever its surface is given
+            self._surface = viewfinder.videoSurface()
+
+    def setCaptureMode(self, mode):
+        pass
+
+    def image_capture(self):
+        """
+        A stand in for QCameraImageCapture, taking the frame on screen
+        """
+        return _MockImageCapture(self)
+
+    def current_frame(self) -> QImage:
+        return self._frames[self._frame_index]
+
+    def status(self):
+        return self._status
+
+    def viewfinderSettings(self):
+        return self._settings
+
+    def hold_viewfinder_settings(self, held: bool) -> None:
+        pass
+
+    def searchAndLock(self):
+        pass
+
+    def unlock(self):
+        pass
+
+    def start(self):
+        # Load and start on the next turn of the event loop, as a real camera
+        # would, rather than during the caller's slot
+        QTimer.singleShot(0, self._start)
+
+    def stop(self):
+        self._timer.stop()
+        if self._surface is not None:
+            self._surface.stop()
+        self._set_status(QCamera.LoadedStatus)
+
+    def unload(self):
+        self.stop()
+        self._set_status(QCamera.UnloadedStatus)
+
+    def _start(self):
+        if self._status == QCamera.ActiveStatus:
+            return
+        self._set_status(QCamera.LoadedStatus)
+        if self._surface is not None:
+            self._surface.start(
+                QVideoSurfaceFormat(
+                    self._settings.resolution(), QVideoFrame.Format_RGB32
+                )
+            )
+        self._timer.start()
+        self._set_status(QCamera.ActiveStatus)
+
+    def _set_status(self, status):
+        if status != self._status:
+            self._status = status
+            self.statusChanged.emit(status)
+
+    def _present_next_frame(self):
+        self._frame_index = (self._frame_index + 1) % len(self._frames)
+        if self._surface is not None:
+            self._surface.present(QVideoFrame(self.current_frame()))
+
+
+class _MockImageCapture(QObject):
+    # Same signatures as QCameraImageCapture's
+    imageExposed = pyqtSignal(int)
+    imageCaptured = pyqtSignal(int, QImage)
+    error = pyqtSignal(int, int, str)
+
+    def __init__(self, camera: MockCamera):
+        super().__init__()
+        self._camera = camera
+        self._capture_ids = count(1)
+
+    def capture(self) -> int:
+        capture_id = next(self._capture_ids)
+        image = self._camera.current_frame()
+
+        def captured():
+            self.imageExposed.emit(capture_id)
+            self.imageCaptured.emit(capture_id, image)
+
+        QTimer.singleShot(0, captured)
+        return capture_id
+
+
+def _load_frames(location: Path):
+    if location.is_dir():
+        paths = sorted(p for p in location.iterdir() if p.is_file())
+        frames = [QImage(str(path)) for path in paths]
+    else:
+        reader = QImageReader(str(location))
+        frames = []
+        while reader.canRead():
+            frames.append(reader.read())
+
+    frames = [frame for frame in frames if not frame.isNull()]
+    if not frames:
+        raise ValueError(f"No frames found for mock camera in {location}")
+    # Frames all have to be the size the viewfinder was started with
+    size = frames[0].size()
+    return [frame.scaled(size).convertToFormat(QImage.Format_RGB32) for frame in frames]
@@ -0,0 +1,72 @@
+import logging
+from collections import OrderedDict
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QImage, QPixmap
+
+logger = logging.getLogger(__name__)
+
+
+class PixmapCache:
+    """
+    A least recently used cache of pixmaps made from images, e.g. a captured
+    photo cropped to the size of the mask, shared between the screens which
+    show them.
+
+    Pixmaps are keyed by the source image's cacheKey, the size they were made
+    for and a description of how they were made from it, e.g. "preview
+    mirrored".  Once the pixmaps add up to more than budget_bytes, the least
+    recently used are dropped until they fit again.
+
+    Only use from the GUI thread, like QPixmap.
+    """
+
+    def __init__(self, budget_bytes):
+        self._budget_bytes = budget_bytes
+        self._pixmaps = OrderedDict()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, image: QImage, size: QSize, transform: str, render) -> QPixmap:
+        """
+        The pixmap made from image for size by transform, calling render to
+        make it if it's not already cached.
+        """
+        key = (image.cacheKey(), size.width(), size.height(), transform)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._hits += 1
+            self._pixmaps.move_to_end(key)
+            self._log_stats("hit", key)
+            return pixmap
+
+        self._misses += 1
+        self._log_stats("miss", key)
+        pixmap = render()
+        self._pixmaps[key] = pixmap
+        self._total_bytes += _size_bytes(pixmap)
+        self._evict()
+        return pixmap
+
+    def _evict(self):
+        # Always keep the newest, even if it's over budget on its own
+        while self._total_bytes > self._budget_bytes and len(self._pixmaps) > 1:
+            key, pixmap = self._pixmaps.popitem(last=False)
+            self._total_bytes -= _size_bytes(pixmap)
+            logger.debug("Evicted pixmap %s", key)
+
+    def _log_stats(self, result, key):
+        logger.debug(
+            "Pixmap cache %s for %s (hits: %s, misses: %s, %s pixmaps, %.1fMiB)",
+            result,
+            key,
+            self._hits,
+            self._misses,
+            len(self._pixmaps),
+            self._total_bytes / 1024 / 1024,
+        )
+
+
+def _size_bytes(pixmap: QPixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
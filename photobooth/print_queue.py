@@ -0,0 +1,104 @@
+import logging
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from photobooth.session_trace import Session
+
+logger = logging.getLogger(__name__)
+
+
+class PrintQueue(QObject):
+    """
+    Keep track of every job which has been sent to the printer but hasn't
+    finished printing yet.
+
+    Once the queue holds maxQueuedJobs jobs it reports itself as full, so that
+    the GUI can stop (or at least warn) guests from taking more photos until the
+    printer catches up.
+    """
+
+    THROUGHPUT_WINDOW_SECONDS = 60 * 60
+
+    # A job has been accepted by the printer, or failed to be accepted
+    queued = pyqtSignal()
+    error = pyqtSignal(str)
+
+    # A job which was accepted failed to print
+    job_failed = pyqtSignal(str)
+
+    # Number of outstanding jobs and whether the queue is full
+    status_changed = pyqtSignal(int, bool)
+
+    def __init__(self, printer, printer_config):
+        super().__init__()
+        self._printer = printer
+        self._max_queued_jobs = printer_config.getint("maxQueuedJobs", fallback=3)
+        self.block_when_full = printer_config.getboolean(
+            "blockWhenQueueFull", fallback=True
+        )
+        if self._max_queued_jobs < 1:
+            raise ValueError("maxQueuedJobs must be at least 1")
+
+        self._outstanding_jobs = set()
+        self._completed_at = deque()
+
+        self._printer.queued.connect(self._on_queued)
+        self._printer.error.connect(self.error)
+        self._printer.job_completed.connect(self._on_job_completed)
+        self._printer.job_failed.connect(self._on_job_failed)
+
+    @property
+    def depth(self):
+        return len(self._outstanding_jobs)
+
+    @property
+    def is_full(self):
+        return self.depth >= self._max_queued_jobs
+
+    def submit(self, data: bytes, session: Session = None):
+        if self.is_full:
+            logger.warning("Submitting job to full print queue, depth: %s", self.depth)
+        self._printer.print(data, session)
+
+    def _on_queued(self, job_id):
+        logger.info("Queued job %s", job_id)
+        self._outstanding_jobs.add(job_id)
+        self._emit_status()
+        self.queued.emit()
+
+    def _on_job_completed(self, job_id):
+        if not self._remove(job_id):
+            return
+
+        now = time.monotonic()
+        self._completed_at.append(now)
+        while now - self._completed_at[0] > PrintQueue.THROUGHPUT_WINDOW_SECONDS:
+            self._completed_at.popleft()
+        logger.info(
+            "Job %s completed, %s printed in the last hour, %s still queued",
+            job_id,
+            len(self._completed_at),
+            self.depth,
+        )
+        self._emit_status()
+
+    def _on_job_failed(self, job_id, message):
+        if not self._remove(job_id):
+            return
+
+        logger.error("Job %s failed: %s", job_id, message)
+        self._emit_status()
+        self.job_failed.emit(message)
+
+    def _remove(self, job_id):
+        try:
+            self._outstanding_jobs.remove(job_id)
+            return True
+        except KeyError:
+            logger.warning("Dropping update for unknown job %s", job_id)
+            return False
+
+    def _emit_status(self):
+        self.status_changed.emit(self.depth, self.is_full)
@@ -1,25 +1,31 @@
 import logging
-import uuid
+import mimetypes
+import tempfile
+import time
 from datetime import datetime
+from itertools import count
 
 import cups
 from PyQt5.QtCore import QObject, QTimer, pyqtSignal
-from PyQt5.QtGui import QImage
+
+from photobooth.cups_connection import CupsConnectionManager
+from photobooth.session_trace import Session, SessionTracer
 
 logger = logging.getLogger(__name__)
 
 
-def printer_factory(printer_config, image_formatter):
+def printer_factory(printer_config, document_format, tracer: SessionTracer):
     if printer_config.getboolean("useMockPrinter"):
-        return MockPrinter(printer_config, image_formatter)
+        return MockPrinter(printer_config, document_format, tracer)
     else:
-        return LibCupsPrinter(printer_config, image_formatter)
+        return LibCupsPrinter(
+            printer_config, CupsConnectionManager(), document_format, tracer
+        )
 
 
 class LibCupsPrinter(QObject):
-    FILENAME = f"/dev/shm/photobooth-{uuid.uuid4().hex}.jpg"
-    STATE_CHECK_TIMER_MS = 500
-    MAX_TICKS_IN_PROCESSING_OR_HELD = 2 * 60 * 2  # 1 minutes
+    SPOOL_DIRECTORY = "/dev/shm"
+    PRINTER_CHECK_TIMER_MS = 10 * 1000
 
     IPP_STATES = {
         cups.IPP_JOB_PENDING: "IPP_JOB_PENDING",
@@ -31,137 +37,484 @@ class LibCupsPrinter(QObject):
         cups.IPP_JOB_COMPLETED: "IPP_JOB_COMPLETED",
     }
 
+    # Emitted once CUPS has accepted a job, or failed to accept it
+    queued = pyqtSignal(int)
     error = pyqtSignal(str)
-    success = pyqtSignal()
 
-    def __init__(self, printer_config, image_formatter):
-        super().__init__()
-        self._image_formatter = image_formatter
-
-        self._conn = cups.Connection()
-        self._job_id = None
+    # Emitted once a queued job has finished printing, or failed to print
+    job_completed = pyqtSignal(int)
+    job_failed = pyqtSignal(int, str)
 
-        requested_printer_name = printer_config["name"]
-        requested_printer_name = (
-            requested_printer_name if requested_printer_name != "" else None
+    def __init__(
+        self,
+        printer_config,
+        connection: CupsConnectionManager,
+        document_format,
+        tracer: SessionTracer,
+    ):
+        super().__init__()
+        self._connection = connection
+        self._tracer = tracer
+        # MIME type of the documents we'll be sent, see photobooth.encoder
+        self._document_format = document_format
+        self._use_streaming = printer_config.getboolean(
+            "useStreamingSubmission", fallback=True
         )
 
-        self._printer = self._find_printer(requested_printer_name)
+        requested_printer_names = [
+            name.strip() for name in printer_config["name"].split(",") if name.strip()
+        ]
+        self._destinations = [
+            _Destination(name) for name in self._find_printers(requested_printer_names)
+        ]
+        # Destination, submission time and traced session, by job ID
+        self._jobs = {}
 
-        self._state_timer = QTimer()
-        self._state_timer.timeout.connect(self._check_job_state)
-        self._ticks_elapsed = None
+        self._monitor = _JobMonitor(connection)
+        self._monitor.job_completed.connect(self._on_job_completed)
+        self._monitor.job_failed.connect(self._on_job_failed)
 
-        logger.info("Using printer: %s", self._printer)
+        self._printer_check_timer = QTimer()
+        self._printer_check_timer.timeout.connect(self._check_printers)
+        if len(self._destinations) > 1:
+            self._printer_check_timer.start(LibCupsPrinter.PRINTER_CHECK_TIMER_MS)
 
-    def print(self, image: QImage):
+        logger.info("Using printers: %s", ", ".join(d.name for d in self._destinations))
+
+    def print(self, document: bytes, session: Session = None):
         job_title = datetime.now().strftime("photobooth-%y-%m-%d--%H-%M-%S")
         logger.debug("print: %s", job_title)
-        self._image_formatter.format_image(image).save(LibCupsPrinter.FILENAME, "jpeg")
+        if session is not None:
+            session.begin("print_submit")
 
-        try:
-            self._job_id = self._conn.printFile(
-                self._printer,
-                LibCupsPrinter.FILENAME,
-                job_title,
-                # To adjust brightness you can pass options in here,
-                # see https://wiki.debian.org/CUPSImageManipulation#Adjusting_the_Image_Brightness
-                # e.g. {"gamma": "1250"} or {"brightness": "150"}.
-                # One day I should put this properly in the config!
-                {}
-            )
+        destination = self._choose_destination()
+        if destination is None:
+            self._finish_session(session, "submit_failed")
+            self.error.emit("Print failed: all printers are out of action")
+            return
+        # Count the job against the printer straight away, so that jobs submitted
+        # in quick succession don't all go to the same place.
+        destination.submitting += 1
+
+        # To adjust brightness you can pass options in here,
+        # see https://wiki.debian.org/CUPSImageManipulation#Adjusting_the_Image_Brightness  # noqa: E501
+        # e.g. {"gamma": "1250"} or {"brightness": "150"}.
+        # One day I should put this properly in the config!
+        options = {}
 
-        except cups.IPPError as e:
-            logger.exception("Failed to call printFile")
-            self.error.emit(f"Print failed: {str(e)}")
-        self._state_timer.start(LibCupsPrinter.STATE_CHECK_TIMER_MS)
+        def on_submitted(job_id):
+            destination.submitting -= 1
+            self._on_submitted(job_id, destination, session)
 
-    def _check_job_state(self):
         def on_error(message):
-            logger.error(message)
-            self.error.emit(message)
-            self._job_id = None
-            self._state_timer.stop()
-
-        def on_success():
-            self.success.emit()
-            self._job_id = None
-            self._state_timer.stop()
-
-        if self._job_id is None:
-            on_error("Vanishing job ID")
+            destination.submitting -= 1
+            logger.error("Failed to submit print job: %s", message)
+            self._finish_session(session, "submit_failed")
+            self.error.emit(f"Print failed: {message}")
+
+        def submit_via_file(message=None):
+            if message is not None:
+                logger.error("Streaming submission failed, falling back: %s", message)
+            self._connection.call(
+                submit_file,
+                destination.name,
+                job_title,
+                document,
+                self._document_format,
+                options,
+                on_result=on_submitted,
+                on_error=on_error,
+            )
+
+        if self._use_streaming:
+            self._connection.call(
+                submit_streaming,
+                destination.name,
+                job_title,
+                document,
+                self._document_format,
+                options,
+                on_result=on_submitted,
+                on_error=submit_via_file,
+            )
         else:
-            job_attributes = self._conn.getJobAttributes(self._job_id)
-            logger.debug("job_attributes: %s", job_attributes)
-
-            job_state = job_attributes["job-state"]
-            job_printer_state_message = job_attributes.get("job-printer-state-message")
-
-            if job_state in [cups.IPP_JOB_PROCESSING, cups.IPP_JOB_PENDING]:
-                if self._ticks_elapsed is None:
-                    self._ticks_elapsed = 0
-                else:
-                    self._ticks_elapsed += 1
-                    if (
-                        self._ticks_elapsed
-                        >= LibCupsPrinter.MAX_TICKS_IN_PROCESSING_OR_HELD
-                    ):
-                        on_error(
-                            "Print job is stuck in pending/processing"
-                            " - run out of paper?"
-                        )
+            submit_via_file()
+
+    def _on_submitted(self, job_id, destination, session):
+        logger.debug("Submitted job %s to %s", job_id, destination.name)
+        if session is not None:
+            session.end("print_submit")
+            session.begin("print")
+        destination.outstanding_jobs.add(job_id)
+        self._jobs[job_id] = (destination, time.monotonic(), session)
+        self._monitor.track(job_id)
+        self.queued.emit(job_id)
+
+    def _choose_destination(self):
+        in_rotation = [d for d in self._destinations if d.in_rotation]
+        if not in_rotation:
+            return None
+        destination = min(in_rotation, key=_Destination.estimated_completion_seconds)
+        logger.debug(
+            "Chose %s, estimates: %s",
+            destination.name,
+            {d.name: d.estimated_completion_seconds() for d in in_rotation},
+        )
+        return destination
+
+    def _on_job_completed(self, job_id):
+        destination, submitted_at, session = self._jobs.pop(job_id)
+        destination.on_job_completed(job_id, submitted_at)
+        if session is not None:
+            session.end("print")
+        self._finish_session(session, "printed")
+        self.job_completed.emit(job_id)
+
+    def _on_job_failed(self, job_id, message):
+        destination, _, session = self._jobs.pop(job_id)
+        destination.outstanding_jobs.discard(job_id)
+        self._finish_session(session, "print_failed")
+        if len(self._destinations) > 1:
+            destination.take_out_of_rotation(message)
+        self.job_failed.emit(job_id, f"{destination.name}: {message}")
+
+    def _finish_session(self, session, outcome):
+        if session is not None:
+            self._tracer.finish(session, outcome)
+
+    def _check_printers(self):
+        self._connection.call(
+            "getPrinters", on_result=self._on_printers, on_error=logger.error
+        )
+
+    def _on_printers(self, printers):
+        for destination in self._destinations:
+            attributes = printers.get(destination.name)
+            if attributes is None:
+                destination.take_out_of_rotation("printer has vanished")
+            elif attributes.get("printer-state") == cups.IPP_PRINTER_STOPPED:
+                destination.take_out_of_rotation(
+                    attributes.get("printer-state-message", "printer stopped")
+                )
             else:
-                self._ticks_elapsed = None
-
-                if job_state == cups.IPP_JOB_COMPLETED:
-                    on_success()
-                else:
-                    state_name = LibCupsPrinter.IPP_STATES.get(
-                        job_state, f"unknown job state: {job_state}"
-                    )
-                    on_error(
-                        f"Bad print state: {state_name}, "
-                        f"message: {job_printer_state_message}"
-                    )
-
-    def _find_printer(self, printer_name):
-        all_printers = self._conn.getPrinters().keys()
-        if printer_name is None:
-            default_printer = self._conn.getDefault()
+                destination.on_printer_ok()
+
+    def _find_printers(self, printer_names):
+        all_printers = self._connection.call_blocking("getPrinters").keys()
+        if not printer_names:
+            default_printer = self._connection.call_blocking("getDefault")
             if not default_printer:
                 available_printers = ", ".join(all_printers)
                 raise ValueError(
                     "No system default printer, please specify a printer in config, "
                     f"Available printers: {available_printers}"
                 )
-            return default_printer
-        if printer_name not in all_printers:
-            raise ValueError(
-                "Unknown printer %s, known printers are: %s",
-                printer_name,
-                ", ".join(all_printers),
+            return [default_printer]
+        for printer_name in printer_names:
+            if printer_name not in all_printers:
+                raise ValueError(
+                    f"Unknown printer {printer_name}, known printers are: "
+                    f"{', '.join(all_printers)}"
+                )
+        return printer_names
+
+
+class _Destination:
+    """
+    One of the printers jobs can be sent to, and what we know about how busy it is.
+    """
+
+    # Before we've seen a job finish, assume this
+    DEFAULT_JOB_SECONDS = 60
+    # Weight given to the latest job when updating the average job time
+    JOB_SECONDS_SMOOTHING = 0.3
+    # After a failure, stay out of rotation at least this long
+    MIN_SECONDS_OUT_OF_ROTATION = 30
+
+    def __init__(self, name):
+        self.name = name
+        self.outstanding_jobs = set()
+        self.submitting = 0
+        self.in_rotation = True
+        self._out_of_rotation_since = None
+        self._average_job_seconds = _Destination.DEFAULT_JOB_SECONDS
+        self._last_job_finished_at = None
+
+    def estimated_completion_seconds(self):
+        queue_length = len(self.outstanding_jobs) + self.submitting
+        return (queue_length + 1) * self._average_job_seconds
+
+    def on_job_completed(self, job_id, submitted_at):
+        self.outstanding_jobs.discard(job_id)
+
+        # Jobs print one after the other, so this one only started once the
+        # previous one finished.
+        now = time.monotonic()
+        started_at = max(submitted_at, self._last_job_finished_at or submitted_at)
+        self._last_job_finished_at = now
+        self._average_job_seconds += _Destination.JOB_SECONDS_SMOOTHING * (
+            (now - started_at) - self._average_job_seconds
+        )
+        logger.debug("%s average job time: %.1fs", self.name, self._average_job_seconds)
+
+    def take_out_of_rotation(self, message):
+        if self.in_rotation:
+            logger.warning("Taking %s out of rotation: %s", self.name, message)
+        self.in_rotation = False
+        self._out_of_rotation_since = time.monotonic()
+
+    def on_printer_ok(self):
+        if self.in_rotation:
+            return
+        if (
+            time.monotonic() - self._out_of_rotation_since
+            >= _Destination.MIN_SECONDS_OUT_OF_ROTATION
+        ):
+            logger.info("Putting %s back into rotation", self.name)
+            self.in_rotation = True
+            self._out_of_rotation_since = None
+
+
+class _JobMonitor(QObject):
+    """
+    Watch the state of every queued job until it finishes.
+
+    All the tracked jobs are fetched with one getJobs call per tick, which is
+    made on the connection's worker thread so none of this blocks the GUI.
+    """
+
+    STATE_CHECK_TIMER_MS = 500
+    MAX_SECONDS_IN_PENDING_OR_PROCESSING = 2 * 60
+
+    job_completed = pyqtSignal(int)
+    job_failed = pyqtSignal(int, str)
+
+    def __init__(self, connection: CupsConnectionManager):
+        super().__init__()
+        self._connection = connection
+        self._request_in_flight = False
+
+        self._timer = QTimer()
+        self._timer.timeout.connect(self._check_job_states)
+
+        # Time by which each job should have finished, by job ID.  While it's
+        # pending, a job gets longer for each job queued ahead of it, and once
+        # it starts processing it gets MAX_SECONDS_IN_PENDING_OR_PROCESSING
+        # from then.
+        self._deadlines = {}
+        self._processing = set()
+        # When CUPS last told us about each job, by job ID
+        self._seen_at = {}
+        # Last seen state of each job, by job ID, just to keep the logs quiet
+        self._states = {}
+
+    def track(self, job_id):
+        jobs_ahead = len(self._deadlines)
+        self._deadlines[job_id] = time.monotonic() + (
+            _JobMonitor.MAX_SECONDS_IN_PENDING_OR_PROCESSING * (jobs_ahead + 1)
+        )
+        self._seen_at[job_id] = time.monotonic()
+        if not self._timer.isActive():
+            self._timer.start(_JobMonitor.STATE_CHECK_TIMER_MS)
+
+    def _check_job_states(self):
+        if self._request_in_flight:
+            # cupsd is slow, don't pile more requests on top of it
+            return
+
+        self._request_in_flight = True
+        self._connection.call(
+            "getJobs",
+            which_jobs="all",
+            first_job_id=min(self._deadlines),
+            requested_attributes=[
+                "job-id",
+                "job-state",
+                "job-printer-state-message",
+            ],
+            on_result=self._on_jobs,
+            on_error=self._on_jobs_error,
+        )
+
+    def _on_jobs(self, jobs):
+        self._request_in_flight = False
+
+        now = time.monotonic()
+        for job_id in list(self._deadlines):
+            job_attributes = jobs.get(job_id)
+            if job_attributes is None:
+                self._on_error(job_id, "Vanishing job ID")
+            else:
+                self._seen_at[job_id] = now
+                self._check_job_state(job_id, job_attributes, now)
+
+        if not self._deadlines:
+            self._timer.stop()
+
+    def _on_jobs_error(self, message):
+        self._request_in_flight = False
+        logger.error("Failed to get job states, will retry: %s", message)
+
+        # Don't let jobs hang around forever if CUPS never comes back
+        now = time.monotonic()
+        for job_id, seen_at in list(self._seen_at.items()):
+            if now - seen_at >= _JobMonitor.MAX_SECONDS_IN_PENDING_OR_PROCESSING:
+                self._on_error(job_id, f"Lost track of print job: {message}")
+
+        if not self._deadlines:
+            self._timer.stop()
+
+    def _check_job_state(self, job_id, job_attributes, now):
+        job_state = job_attributes["job-state"]
+        job_printer_state_message = job_attributes.get("job-printer-state-message")
+
+        if self._states.get(job_id) != job_state:
+            logger.debug("Job %s attributes: %s", job_id, job_attributes)
+            self._states[job_id] = job_state
+
+        if job_state == cups.IPP_JOB_PROCESSING and job_id not in self._processing:
+            self._processing.add(job_id)
+            self._deadlines[job_id] = (
+                now + _JobMonitor.MAX_SECONDS_IN_PENDING_OR_PROCESSING
+            )
+
+        if job_state in [cups.IPP_JOB_PROCESSING, cups.IPP_JOB_PENDING]:
+            if now >= self._deadlines[job_id]:
+                self._on_error(
+                    job_id,
+                    "Print job is stuck in pending/processing - run out of paper?",
+                )
+        elif job_state == cups.IPP_JOB_COMPLETED:
+            self._forget(job_id)
+            self.job_completed.emit(job_id)
+        else:
+            state_name = LibCupsPrinter.IPP_STATES.get(
+                job_state, f"unknown job state: {job_state}"
+            )
+            self._on_error(
+                job_id,
+                f"Bad print state: {state_name}, message: {job_printer_state_message}",
             )
-        return printer_name
+
+    def _on_error(self, job_id, message):
+        logger.error("Job %s: %s", job_id, message)
+        self._forget(job_id)
+        self.job_failed.emit(job_id, message)
+
+    def _forget(self, job_id):
+        del self._deadlines[job_id]
+        del self._seen_at[job_id]
+        self._processing.discard(job_id)
+        self._states.pop(job_id, None)
+
+
+# HTTP status returned by writeRequestData while the server is happy to carry on
+# receiving data.
+_HTTP_CONTINUE = 100
+
+
+def submit_streaming(
+    conn: cups.Connection,
+    printer: str,
+    job_title: str,
+    document: bytes,
+    document_format: str,
+    options,
+    chunk_size=64 * 1024,
+) -> int:
+    """
+    Send a document to CUPS straight from memory, in chunks of chunk_size bytes.
+    """
+    job_id = conn.createJob(printer, job_title, options)
+    try:
+        conn.startDocument(printer, job_id, job_title, document_format, 1)
+        for offset in range(0, len(document), chunk_size):
+            chunk = document[offset : offset + chunk_size]
+            status = conn.writeRequestData(chunk, len(chunk))
+            if status != _HTTP_CONTINUE:
+                raise cups.HTTPError(status)
+        conn.finishDocument(printer)
+    except (cups.IPPError, cups.HTTPError):
+        try:
+            conn.cancelJob(job_id)
+        except cups.IPPError:
+            logger.exception("Failed to cancel partially submitted job %s", job_id)
+        raise
+    return job_id
+
+
+def submit_file(
+    conn: cups.Connection,
+    printer: str,
+    job_title: str,
+    document: bytes,
+    document_format: str,
+    options,
+) -> int:
+    """
+    Send a document to CUPS by writing it to a temporary file in shared memory.
+
+    CUPS reads the whole file during printFile, so it's safe to delete it as soon
+    as printFile returns.
+    """
+    # CUPS sniffs the type from the content, the suffix is just for humans
+    with tempfile.NamedTemporaryFile(
+        dir=LibCupsPrinter.SPOOL_DIRECTORY,
+        prefix="photobooth-",
+        suffix=mimetypes.guess_extension(document_format) or "",
+    ) as f:
+        f.write(document)
+        f.flush()
+        return conn.printFile(printer, f.name, job_title, options)
 
 
 class MockPrinter(QObject):
     TIMEOUT_SECONDS = 5
-    FILE_PATH = "/tmp/photobooth_mock_printer.jpeg"
+    # Followed by the extension for the format being printed
+    FILE_PATH_STEM = "/tmp/photobooth_mock_printer"
 
+    queued = pyqtSignal(int)
     error = pyqtSignal(str)
-    success = pyqtSignal()
 
-    # noinspection PyUnusedLocal
-    def __init__(self, printer_config, image_formatter):
+    job_completed = pyqtSignal(int)
+    job_failed = pyqtSignal(int, str)
+
+    def __init__(self, printer_config, document_format, tracer: SessionTracer):
         super().__init__()
-        self._image_formatter = image_formatter
-        self._timer = None
+        self._tracer = tracer
+        self._file_path = MockPrinter.FILE_PATH_STEM + (
+            mimetypes.guess_extension(document_format) or ""
+        )
+        self._job_seconds = printer_config.getfloat(
+            "mockPrinterSeconds", fallback=MockPrinter.TIMEOUT_SECONDS
+        )
+        self._job_ids = count(1)
+        # Jobs print one after the other, like they would on a real printer
+        self._last_job_finishes_at = time.monotonic()
 
-    # noinspection PyUnusedLocal
-    def print(self, image: QImage):
-        self._image_formatter.format_image(image).save(MockPrinter.FILE_PATH)
-        logger.warning("Mock printer printed image to: %s", MockPrinter.FILE_PATH)
-        self._timer = QTimer()
-        self._timer.singleShot(
-            MockPrinter.TIMEOUT_SECONDS * 1000, lambda: self.success.emit()
+    def print(self, document: bytes, session: Session = None):
+        if session is not None:
+            session.begin("print_submit")
+        with open(self._file_path, "wb") as f:
+            f.write(document)
+        job_id = next(self._job_ids)
+        if session is not None:
+            session.end("print_submit")
+            session.begin("print")
+        logger.warning("Mock printer printed job %s to: %s", job_id, self._file_path)
+
+        now = time.monotonic()
+        self._last_job_finishes_at = (
+            max(now, self._last_job_finishes_at) + self._job_seconds
         )
+        QTimer.singleShot(
+            int((self._last_job_finishes_at - now) * 1000),
+            lambda: self._on_job_completed(job_id, session),
+        )
+        self.queued.emit(job_id)
+
+    def _on_job_completed(self, job_id, session):
+        if session is not None:
+            session.end("print")
+            self._tracer.finish(session, "printed")
+        self.job_completed.emit(job_id)
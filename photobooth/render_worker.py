@@ -0,0 +1,229 @@
+import logging
+import time
+from functools import partial
+from itertools import count
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+
+from photobooth.captured_image import CapturedImage
+
+logger = logging.getLogger(__name__)
+
+
+class RenderWorker(QObject):
+    """
+    Run image rendering jobs on a background thread.
+
+    A job is a function returning a QImage, e.g. one which masks and formats a
+    captured image for printing.  It's run away from the GUI thread, optionally
+    followed by encoding the image with encoder, and the result (the QImage, or
+    the encoded bytes) is reported back through the rendered and failed
+    signals.  At most max_pending_jobs jobs can be queued or running at once,
+    any more are failed straight away.
+    """
+
+    MAX_PENDING_JOBS = 2
+
+    rendered = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+    # Emitted from the pool thread, delivered on the thread which owns the worker
+    _job_succeeded = pyqtSignal(int, object)
+    _job_failed = pyqtSignal(int, str)
+
+    def __init__(self, encoder, max_pending_jobs=MAX_PENDING_JOBS):
+        super().__init__()
+        self._encoder = encoder
+        self._max_pending_jobs = max_pending_jobs
+
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(1)
+
+        self._job_ids = count(1)
+        self._pending = {}
+        # Cancelled jobs which the pool may already be running, kept until they
+        # report back, as Qt doesn't own them and would be left running a
+        # deleted job if they were garbage collected
+        self._cancelled = {}
+
+        self._job_succeeded.connect(self._on_job_succeeded)
+        self._job_failed.connect(self._on_job_failed)
+
+    def submit(self, render, encode=True) -> int:
+        job_id = next(self._job_ids)
+
+        if len(self._pending) >= self._max_pending_jobs:
+            logger.warning("Render queue full, rejecting job %s", job_id)
+            QTimer.singleShot(
+                0, lambda: self.failed.emit(job_id, "Render queue is full")
+            )
+            return job_id
+
+        logger.debug("Submitting render job %s", job_id)
+        job = _RenderJob(job_id, render, self._encoder if encode else None, self)
+        self._pending[job_id] = job
+        self._pool.start(job)
+        return job_id
+
+    def cancel(self, job_id: int):
+        job = self._pending.pop(job_id, None)
+        if job is None:
+            return
+
+        logger.debug("Cancelling render job %s", job_id)
+        job.cancelled = True
+        if not self._pool.tryTake(job):
+            # Already running, so hold on to it until it finishes
+            self._cancelled[job_id] = job
+
+    @pyqtSlot(int, object)
+    def _on_job_succeeded(self, job_id, result):
+        if self._pending.pop(job_id, None) is None:
+            self._cancelled.pop(job_id, None)
+            logger.debug("Discarding result of cancelled render job %s", job_id)
+        else:
+            self.rendered.emit(job_id, result)
+
+    @pyqtSlot(int, str)
+    def _on_job_failed(self, job_id, message):
+        if self._pending.pop(job_id, None) is None:
+            self._cancelled.pop(job_id, None)
+            logger.debug("Discarding failure of cancelled render job %s", job_id)
+        else:
+            self.failed.emit(job_id, message)
+
+
+class _RenderJob(QRunnable):
+    def __init__(self, job_id, render, encoder, worker: RenderWorker):
+        super().__init__()
+        # The worker keeps hold of the job until it reports back, even if it's
+        # cancelled while running, see RenderWorker.cancel.  run always reports
+        # back, so that the worker knows when it can let go.
+        self.setAutoDelete(False)
+        self.cancelled = False
+        self._job_id = job_id
+        self._render = render
+        self._encoder = encoder
+        self._worker = worker
+
+    def run(self):
+        try:
+            if self.cancelled:
+                self._worker._job_failed.emit(self._job_id, "Cancelled")
+                return
+            result = self._render()
+
+            if self.cancelled:
+                self._worker._job_failed.emit(self._job_id, "Cancelled")
+                return
+            if self._encoder is not None:
+                result = self._encoder.encode(result)
+                logger.debug("Rendered job %s, %s bytes", self._job_id, len(result))
+            else:
+                logger.debug("Rendered job %s", self._job_id)
+
+            self._worker._job_succeeded.emit(self._job_id, result)
+        except Exception as e:
+            logger.exception("Render job %s failed", self._job_id)
+            self._worker._job_failed.emit(self._job_id, str(e))
+
+
+class SpeculativeRenderer(QObject):
+    """
+    Render an image for printing before we know whether it will be printed.
+
+    start is called as soon as an image is on screen, and commit once the user
+    has asked for it to be printed.  If the render finished in the meantime,
+    ready is emitted straight away (a hit), otherwise it's emitted as soon as
+    the render finishes (a miss).  discard throws away any render in progress
+    or already finished.
+    """
+
+    ready = pyqtSignal(bytes)
+    failed = pyqtSignal(str)
+
+    def __init__(self, render_worker: RenderWorker, image_formatter):
+        super().__init__()
+        self._render_worker = render_worker
+        self._render_worker.rendered.connect(self._on_rendered)
+        self._render_worker.failed.connect(self._on_failed)
+        self._image_formatter = image_formatter
+
+        self._image = None
+        self._job_id = None
+        self._data = None
+        self._committed_at = None
+
+        self._hits = 0
+        self._misses = 0
+
+    def start(self, image: CapturedImage):
+        self.discard()
+        self._image = image
+        self._job_id = self._submit(image)
+
+    def commit(self):
+        if self._image is None:
+            logger.warning("Dropping commit with no image to render")
+            return
+
+        self._committed_at = time.monotonic()
+        if self._data is not None:
+            self._hits += 1
+            self._log_stats("hit")
+            self._emit_ready()
+        else:
+            self._misses += 1
+            self._log_stats("miss")
+            if self._job_id is None:
+                # The speculative render failed, so give it one more go now that
+                # we know the result is actually wanted.
+                self._job_id = self._submit(self._image)
+
+    def discard(self):
+        if self._job_id is not None:
+            self._render_worker.cancel(self._job_id)
+        self._image = None
+        self._job_id = None
+        self._data = None
+        self._committed_at = None
+
+    def _submit(self, image):
+        return self._render_worker.submit(
+            partial(self._image_formatter.format_image, image)
+        )
+
+    def _deliver(self, result):
+        self.ready.emit(result)
+
+    def _on_rendered(self, job_id, result):
+        if job_id != self._job_id:
+            return
+        self._job_id = None
+        self._data = result
+        if self._committed_at is not None:
+            self._emit_ready()
+
+    def _on_failed(self, job_id, message):
+        if job_id != self._job_id:
+            return
+        self._job_id = None
+        if self._committed_at is not None:
+            self.discard()
+            self.failed.emit(message)
+        else:
+            logger.warning("Speculative render failed: %s", message)
+
+    def _emit_ready(self):
+        logger.info(
+            "Print job ready %.3fs after commit",
+            time.monotonic() - self._committed_at,
+        )
+        result = self._data
+        self.discard()
+        self._deliver(result)
+
+    def _log_stats(self, result):
+        logger.info(
+            "Pre-render %s (hits: %s, misses: %s)", result, self._hits, self._misses
+        )
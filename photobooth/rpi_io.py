@@ -1,5 +1,6 @@
 import logging
 import os
+import time
 from contextlib import contextmanager
 from pathlib import Path
 
@@ -12,6 +13,24 @@ class RpiIo(QObject):
     yes_button_pressed = pyqtSignal()
     no_button_pressed = pyqtSignal()
 
+    def __init__(self):
+        super().__init__()
+        # When the yes button was last pressed, by monotonic time, which can be
+        # well before the GUI gets around to handling it
+        self._yes_pressed_at = None
+
+    def on_yes_pressed(self):
+        self._yes_pressed_at = time.monotonic()
+        self.yes_button_pressed.emit()
+
+    def take_yes_pressed_at(self):
+        """
+        When the yes button was pressed, or None if it hasn't been since the
+        last call, e.g. if the photo was asked for with the keyboard instead
+        """
+        pressed_at, self._yes_pressed_at = self._yes_pressed_at, None
+        return pressed_at
+
 
 @contextmanager
 def rpi_io_factory(rpi_io_config) -> RpiIo:
@@ -33,7 +52,7 @@ def rpi_io_factory(rpi_io_config) -> RpiIo:
 
             def when_yes_pressed():
                 logger.warning("Yes pressed")
-                rpi_io.yes_button_pressed.emit()
+                rpi_io.on_yes_pressed()
 
             yes_button.when_pressed = when_yes_pressed
             no_button.when_pressed = lambda: rpi_io.no_button_pressed.emit()
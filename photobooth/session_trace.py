@@ -0,0 +1,254 @@
+"""
+Trace how long each guest's session takes, from pressing the button to the
+print coming out, and export the timings.
+
+From the root of the repository, to show the slowest sessions recorded in
+sessionLogFile:
+
+    python -m photobooth.session_trace /path/to/sessions.jsonl --slowest 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    One guest's go at the photobooth, with the start and end of each stage of
+    it, e.g. "countdown" or "print", by monotonic time.
+    """
+
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.spans = {}
+        self.outcome = None
+
+    def begin(self, stage, at=None):
+        self.spans[stage] = [time.monotonic() if at is None else at, None]
+
+    def end(self, stage):
+        span = self.spans.get(stage)
+        if span is None:
+            logger.warning("Session %s ending %s, which never began", self, stage)
+        elif span[1] is None:
+            span[1] = time.monotonic()
+
+    def durations(self):
+        """
+        Seconds taken by each stage which has ended, and by the whole session
+        """
+        ended = {
+            stage: (start, end)
+            for stage, (start, end) in self.spans.items()
+            if end is not None
+        }
+        durations = {stage: end - start for stage, (start, end) in ended.items()}
+        if ended:
+            durations["session"] = max(end for _, end in ended.values()) - min(
+                start for start, _ in ended.values()
+            )
+        return durations
+
+    def __str__(self):
+        return self.session_id
+
+
+class SessionTracer:
+    """
+    Keeps track of the session in progress, and exports each session's timings
+    once it's finished.
+
+    Each finished session is appended to session_log_file as a line of JSON,
+    and a histogram of how long each stage took is kept up to date in
+    prometheus_file, in the text format read by node_exporter's textfile
+    collector.  Either may be blank to not write it.
+
+    The GUI starts a session when the button is pressed, and hands it to the
+    printer along with the print job, which finishes it once the job has
+    printed.  If several photos are printed on each sheet, the print is only
+    traced for the session which filled the sheet, and sheets printed part
+    full after sheetTimeoutSeconds aren't traced at all.
+
+    Only use from the GUI thread.
+    """
+
+    # Upper bounds of the histogram buckets, in seconds
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self, session_log_file="", prometheus_file=""):
+        self._session_log_file = _path(session_log_file)
+        self._prometheus_file = _path(prometheus_file)
+        self._current = None
+
+        # By stage, how many took at most each bucket's seconds
+        self._bucket_counts = defaultdict(Counter)
+        self._sums = Counter()
+        self._counts = Counter()
+        self._outcomes = Counter()
+
+    def start_session(self, started_at=None) -> Session:
+        """
+        Start a new session, finishing whichever was in progress as abandoned
+        """
+        if self._current is not None:
+            self.finish(self._current, "abandoned")
+        self._current = Session()
+        if started_at is not None:
+            self._current.begin("button", at=started_at)
+            self._current.end("button")
+        logger.info("Started session %s", self._current)
+        return self._current
+
+    def current_session(self):
+        return self._current
+
+    def release_session(self):
+        """
+        Stop tracking the session in progress, which something else, e.g. a
+        print job, has taken over and will finish
+        """
+        self._current = None
+
+    def begin(self, stage):
+        if self._current is not None:
+            self._current.begin(stage)
+
+    def end(self, stage):
+        if self._current is not None:
+            self._current.end(stage)
+
+    def finish_current(self, outcome):
+        if self._current is not None:
+            self.finish(self._current, outcome)
+
+    def finish(self, session: Session, outcome):
+        if session is self._current:
+            self._current = None
+        if session.outcome is not None:
+            return
+        session.outcome = outcome
+
+        durations = session.durations()
+        logger.info(
+            "Session %s %s: %s",
+            session,
+            outcome,
+            ", ".join(f"{stage} {s:.3f}s" for stage, s in durations.items()),
+        )
+        self._outcomes[outcome] += 1
+        for stage, seconds in durations.items():
+            self._observe(stage, seconds)
+
+        try:
+            if self._session_log_file is not None:
+                self._append_session(session, durations)
+            if self._prometheus_file is not None:
+                self._write_prometheus()
+        except OSError:
+            logger.exception("Failed to export timings of session %s", session)
+
+    def _observe(self, stage, seconds):
+        for bucket in SessionTracer.BUCKETS:
+            if seconds <= bucket:
+                self._bucket_counts[stage][bucket] += 1
+        self._sums[stage] += seconds
+        self._counts[stage] += 1
+
+    def _append_session(self, session, durations):
+        self._session_log_file.parent.mkdir(parents=True, exist_ok=True)
+        with self._session_log_file.open("a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "session": session.session_id,
+                        "started": session.started,
+                        "outcome": session.outcome,
+                        "seconds": durations,
+                    }
+                )
+                + "\n"
+            )
+
+    def _write_prometheus(self):
+        lines = [
+            "# HELP photobooth_session_stage_seconds "
+            "How long each stage of a session took",
+            "# TYPE photobooth_session_stage_seconds histogram",
+        ]
+        for stage in sorted(self._counts):
+            for bucket in SessionTracer.BUCKETS:
+                lines.append(
+                    f'photobooth_session_stage_seconds_bucket{{stage="{stage}",'
+                    f'le="{bucket}"}} {self._bucket_counts[stage][bucket]}'
+                )
+            lines += [
+                f'photobooth_session_stage_seconds_bucket{{stage="{stage}",'
+                f'le="+Inf"}} {self._counts[stage]}',
+                f'photobooth_session_stage_seconds_sum{{stage="{stage}"}} '
+                f"{self._sums[stage]}",
+                f'photobooth_session_stage_seconds_count{{stage="{stage}"}} '
+                f"{self._counts[stage]}",
+            ]
+        lines += [
+            "# HELP photobooth_sessions_total Sessions finished, by outcome",
+            "# TYPE photobooth_sessions_total counter",
+        ]
+        for outcome in sorted(self._outcomes):
+            lines.append(
+                f'photobooth_sessions_total{{outcome="{outcome}"}} '
+                f"{self._outcomes[outcome]}"
+            )
+
+        # Written to a temporary file and moved into place, so the collector
+        # never reads half a file
+        self._prometheus_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._prometheus_file.with_suffix(".tmp")
+        tmp_path.write_text("\n".join(lines) + "\n")
+        os.replace(tmp_path, self._prometheus_file)
+
+
+def _path(location):
+    return Path(location).expanduser() if location else None
+
+
+def slowest_sessions(session_log_file, n, stage="session"):
+    """
+    The n sessions from session_log_file which took longest at stage
+    """
+    with Path(session_log_file).expanduser().open() as f:
+        sessions = [json.loads(line) for line in f if line.strip()]
+    sessions = [s for s in sessions if stage in s["seconds"]]
+    return sorted(sessions, key=lambda s: s["seconds"][stage], reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the slowest sessions")
+    parser.add_argument("session_log_file", help="sessionLogFile from the config")
+    parser.add_argument("--slowest", type=int, default=10, help="Sessions to show")
+    parser.add_argument(
+        "--stage", default="session", help="Stage to rank by, e.g. capture"
+    )
+    args = parser.parse_args()
+
+    for session in slowest_sessions(args.session_log_file, args.slowest, args.stage):
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(session["started"]))
+        print(
+            f"{session['session']} {started} {session['outcome']}: "
+            + ", ".join(
+                f"{stage} {seconds:.3f}s"
+                for stage, seconds in session["seconds"].items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
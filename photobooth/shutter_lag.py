@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import statistics
+from collections import deque
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ShutterLag:
+    """
+    Keep a rolling record of how long each camera takes to actually take a photo
+    once capture is triggered, by camera and resolution, so that capture can be
+    triggered early by that much.
+
+    Every capture is timed from searchAndLock to capture being triggered, from
+    then until the image is exposed (if the capture backend says when that is),
+    and until the image arrives.  The last SAMPLES of each are written to
+    metrics_path as JSON along with a summary, so that cameras can be compared,
+    and read back in at startup.
+    """
+
+    SAMPLES = 20
+
+    LOCK_TO_TRIGGER = "lock_to_trigger"
+    TRIGGER_TO_EXPOSED = "trigger_to_exposed"
+    TRIGGER_TO_CAPTURED = "trigger_to_captured"
+    _MEASUREMENTS = (LOCK_TO_TRIGGER, TRIGGER_TO_EXPOSED, TRIGGER_TO_CAPTURED)
+
+    def __init__(self, metrics_path):
+        self._path = Path(metrics_path) if metrics_path else None
+        # Samples of each measurement in seconds, by camera
+        self._samples = {}
+        self._load()
+
+    def estimate(self, camera_key) -> float:
+        """
+        How many seconds after triggering capture the photo is actually taken,
+        or 0 if we don't know yet.
+        """
+        samples = self._samples.get(camera_key, {})
+        for measurement in (
+            ShutterLag.TRIGGER_TO_EXPOSED,
+            ShutterLag.TRIGGER_TO_CAPTURED,
+        ):
+            if samples.get(measurement):
+                return statistics.median(samples[measurement])
+        return 0
+
+    def record(self, camera_key, **seconds):
+        """
+        Record the time in seconds of one capture for each measurement given,
+        e.g. record(key, trigger_to_captured=.3)
+        """
+        samples = self._samples.setdefault(camera_key, {})
+        for measurement, value in seconds.items():
+            if measurement not in ShutterLag._MEASUREMENTS:
+                raise ValueError(f"Unknown shutter lag measurement {measurement}")
+            if value is not None:
+                samples.setdefault(
+                    measurement, deque(maxlen=ShutterLag.SAMPLES)
+                ).append(value)
+
+        for measurement, summary in _summarise(samples).items():
+            logger.info(
+                "Shutter lag for %s, %s - median: %.3fs, p90: %.3fs, max: %.3fs "
+                "(n=%s)",
+                camera_key,
+                measurement,
+                summary["median"],
+                summary["p90"],
+                summary["max"],
+                summary["count"],
+            )
+        self._save()
+
+    def _load(self):
+        if self._path is None or not self._path.exists():
+            return
+        try:
+            with self._path.open() as f:
+                metrics = json.load(f)
+            for camera_key, measurements in metrics.items():
+                self._samples[camera_key] = {
+                    measurement: deque(
+                        measurements[measurement]["samples"],
+                        maxlen=ShutterLag.SAMPLES,
+                    )
+                    for measurement in ShutterLag._MEASUREMENTS
+                    if measurement in measurements
+                }
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.exception("Ignoring unreadable shutter lag file %s", self._path)
+            self._samples = {}
+
+    def _save(self):
+        if self._path is None:
+            return
+        metrics = {
+            camera_key: {
+                measurement: dict(summary, samples=list(samples[measurement]))
+                for measurement, summary in _summarise(samples).items()
+            }
+            for camera_key, samples in self._samples.items()
+        }
+        # Write then rename, so that nothing ever reads half a file
+        temporary_path = self._path.with_name(self._path.name + ".tmp")
+        try:
+            with temporary_path.open("w") as f:
+                json.dump(metrics, f, indent=2, sort_keys=True)
+            os.replace(temporary_path, self._path)
+        except OSError:
+            logger.exception("Failed to write shutter lag file %s", self._path)
+
+
+def _summarise(samples):
+    summaries = {}
+    for measurement, values in samples.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        summaries[measurement] = {
+            "count": len(ordered),
+            "median": statistics.median(ordered),
+            "p90": ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+            "max": ordered[-1],
+        }
+    return summaries
@@ -0,0 +1,49 @@
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Stands in for every state in a transition, e.g. errors which are handled the
+# same whatever state they arrive in
+ANY_STATE = object()
+
+
+class TransitionTable:
+    """
+    Which handler to call for each event in each state, given as a dict of
+    (state, event) to handler, where event is a name like "accept" and state is
+    anything hashable identifying the state, e.g. an Enum member or a class.
+
+    Dispatching is a dict lookup, falling back to a transition from ANY_STATE.
+    Events with no transition from the current state are dropped, logged and
+    counted in dropped, by state and event.
+    """
+
+    def __init__(self, name, transitions):
+        self._name = name
+        self._transitions = dict(transitions)
+        self.dropped = Counter()
+
+    def dispatch(self, state, event, *args):
+        handler = self._transitions.get((state, event))
+        if handler is None:
+            handler = self._transitions.get((ANY_STATE, event))
+        if handler is None:
+            self.dropped[state, event] += 1
+            logger.warning(
+                "%s dropping unexpected %s while in %s state (%s dropped)",
+                self._name,
+                event,
+                _state_name(state),
+                self.dropped[state, event],
+            )
+            return
+        logger.debug(
+            "%s caught %s while in %s state", self._name, event, _state_name(state)
+        )
+        handler(*args)
+
+
+def _state_name(state):
+    # Both classes and Enum members have a name, without any module path
+    return getattr(state, "__name__", None) or getattr(state, "name", state)
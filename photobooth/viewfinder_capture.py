@@ -0,0 +1,329 @@
+import logging
+import threading
+import time
+from itertools import count
+
+from PyQt5.QtCore import QObject, QSize, Qt, pyqtSignal
+from PyQt5.QtGui import QImage
+from PyQt5.QtMultimedia import QCamera, QCameraImageCapture, QVideoFrame, QVideoProbe
+
+logger = logging.getLogger(__name__)
+
+
+class ViewfinderCapture(QObject):
+    """
+    A stand in for QCameraImageCapture which takes the still from the next
+    viewfinder frame, rather than asking the camera for a separate still image.
+
+    This means the camera never has to switch pipelines, so it can stay running
+    between captures instead of being unloaded and restarted, at the cost of
+    stills only being as big as the viewfinder resolution.
+    """
+
+    # Same signatures as QCameraImageCapture's
+    imageCaptured = pyqtSignal(int, QImage)
+    error = pyqtSignal(int, int, str)
+
+    def __init__(self, camera: QCamera):
+        super().__init__()
+        self._capture_ids = count(1)
+        # Captures waiting for a frame, guarded by _lock as frames arrive on the
+        # camera's streaming thread
+        self._lock = threading.Lock()
+        self._pending = []
+
+        self._probe = QVideoProbe()
+        if not self._probe.setSource(camera):
+            raise ValueError(
+                "This camera doesn't support probing viewfinder frames, "
+                "use captureMode=stillImage instead"
+            )
+
+    def capture(self) -> int:
+        capture_id = next(self._capture_ids)
+        with self._lock:
+            if not self._pending:
+                # Only listen to frames when there's a capture waiting, as
+                # otherwise we'd call into Python for every frame from the
+                # camera.  Frames are only valid until the slot returns, so it's
+                # called directly on the thread the frame arrives on.
+                self._probe.videoFrameProbed.connect(
+                    self._on_frame_probed, Qt.DirectConnection
+                )
+            self._pending.append((capture_id, time.monotonic()))
+        return capture_id
+
+    def _on_frame_probed(self, frame: QVideoFrame):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            self._probe.videoFrameProbed.disconnect(self._on_frame_probed)
+
+        image = _to_image(frame)
+        for capture_id, requested_at in pending:
+            if image.isNull():
+                self.error.emit(
+                    capture_id,
+                    QCameraImageCapture.FormatError,
+                    f"Can't convert viewfinder frame in format {frame.pixelFormat()}",
+                )
+            else:
+                logger.debug(
+                    "Captured viewfinder frame %s %.3fs after request",
+                    capture_id,
+                    time.monotonic() - requested_at,
+                )
+                self.imageCaptured.emit(capture_id, image)
+
+
+class RingBufferCapture(QObject):
+    """
+    A stand in for QCameraImageCapture with no shutter lag, which picks the
+    sharpest of the viewfinder frames either side of the moment capture is
+    called.
+
+    From prepare being called, i.e. the start of the countdown, the last
+    buffer_frames viewfinder frames are copied into a ring of reused buffers.
+    Once capture has been called and window_seconds have passed, every frame
+    within window_seconds of the capture is scored by how sharp its luma is,
+    and the best one is converted to an image.
+
+    Raises ImportError if numpy isn't installed.
+    """
+
+    # Same signatures as QCameraImageCapture's
+    imageCaptured = pyqtSignal(int, QImage)
+    error = pyqtSignal(int, int, str)
+
+    def __init__(self, camera: QCamera, buffer_frames, window_seconds):
+        super().__init__()
+        # Imported here as it's optional, see LiveFeedWidget
+        import numpy
+
+        self._numpy = numpy
+        if buffer_frames < 1:
+            raise ValueError("ringBufferFrames must be at least 1")
+        self._window_seconds = window_seconds
+        self._capture_ids = count(1)
+
+        # Everything below is guarded by _lock, as frames arrive on the camera's
+        # streaming thread
+        self._lock = threading.Lock()
+        self._listening = False
+        self._buffers = [None] * buffer_frames
+        self._frames = [None] * buffer_frames
+        self._next = 0
+        self._pending = None
+
+        self._probe = QVideoProbe()
+        if not self._probe.setSource(camera):
+            raise ValueError(
+                "This camera doesn't support probing viewfinder frames, "
+                "use captureMode=stillImage instead"
+            )
+
+    def prepare(self):
+        with self._lock:
+            self._frames = [None] * len(self._frames)
+            self._pending = None
+            if not self._listening:
+                # See ViewfinderCapture.capture
+                self._probe.videoFrameProbed.connect(
+                    self._on_frame_probed, Qt.DirectConnection
+                )
+                self._listening = True
+
+    def capture(self) -> int:
+        capture_id = next(self._capture_ids)
+        with self._lock:
+            if not self._listening:
+                logger.warning("Capture without prepare, buffering from now")
+                self._probe.videoFrameProbed.connect(
+                    self._on_frame_probed, Qt.DirectConnection
+                )
+                self._listening = True
+            self._pending = (capture_id, time.monotonic())
+        return capture_id
+
+    def _on_frame_probed(self, frame: QVideoFrame):
+        now = time.monotonic()
+        with self._lock:
+            if not self._listening:
+                return
+            self._store(frame, now)
+
+            if self._pending is None:
+                return
+            capture_id, requested_at = self._pending
+            if now - requested_at < self._window_seconds:
+                return
+
+            self._pending = None
+            self._listening = False
+            self._probe.videoFrameProbed.disconnect(self._on_frame_probed)
+            candidates = [
+                (index, frame_info)
+                for index, frame_info in enumerate(self._frames)
+                if frame_info is not None
+                and abs(frame_info[0] - requested_at) <= self._window_seconds
+            ]
+            best = self._best(candidates, requested_at)
+
+        if best is None:
+            self.error.emit(
+                capture_id,
+                QCameraImageCapture.NotReadyError,
+                "No viewfinder frames around the time of capture",
+            )
+            return
+
+        image = self._to_image(*best)
+        if image.isNull():
+            self.error.emit(
+                capture_id,
+                QCameraImageCapture.FormatError,
+                f"Can't convert viewfinder frame in format {best[1][1]}",
+            )
+        else:
+            self.imageCaptured.emit(capture_id, image)
+
+    def _store(self, frame: QVideoFrame, arrived_at):
+        if not frame.map(QVideoFrame.ReadOnly):
+            logger.warning("Failed to map viewfinder frame, skipping it")
+            return
+        try:
+            size = frame.mappedBytes()
+            buffer = self._buffers[self._next]
+            if buffer is None or buffer.size != size:
+                buffer = self._numpy.empty(size, self._numpy.uint8)
+                self._buffers[self._next] = buffer
+            bits = frame.bits()
+            bits.setsize(size)
+            buffer[:] = self._numpy.frombuffer(bits, self._numpy.uint8)
+        finally:
+            frame.unmap()
+
+        self._frames[self._next] = (
+            arrived_at,
+            frame.pixelFormat(),
+            frame.width(),
+            frame.height(),
+            frame.bytesPerLine(),
+        )
+        self._next = (self._next + 1) % len(self._buffers)
+
+    def _best(self, candidates, requested_at):
+        best = None
+        best_key = None
+        for index, frame_info in candidates:
+            arrived_at, pixel_format, width, height, bytes_per_line = frame_info
+            luma = _luma(
+                self._numpy,
+                self._buffers[index],
+                pixel_format,
+                width,
+                height,
+                bytes_per_line,
+            )
+            score = 0 if luma is None else sharpness(self._numpy, luma)
+            # Prefer the frame closest to the capture when the scores are tied,
+            # e.g. because the luma can't be found for this pixel format
+            key = (score, -abs(arrived_at - requested_at))
+            logger.debug("Frame %.3fs from capture scored %.1f", -key[1], score)
+            if best_key is None or key > best_key:
+                best, best_key = (index, frame_info), key
+
+        if best is not None:
+            logger.info(
+                "Picked frame %.3fs from capture out of %s, sharpness %.1f",
+                best[1][0] - requested_at,
+                len(candidates),
+                best_key[0],
+            )
+        return best
+
+    def _to_image(self, index, frame_info):
+        _, pixel_format, width, height, bytes_per_line = frame_info
+        buffer = self._buffers[index]
+        frame = QVideoFrame(
+            buffer.size, QSize(width, height), bytes_per_line, pixel_format
+        )
+        if not frame.map(QVideoFrame.WriteOnly):
+            return QImage()
+        try:
+            bits = frame.bits()
+            bits.setsize(buffer.size)
+            self._numpy.frombuffer(bits, self._numpy.uint8)[:] = buffer
+        finally:
+            frame.unmap()
+        return _to_image(frame)
+
+
+# Where to find the luma of each kind of frame, as (first byte, step between
+# pixels).  Planar YUV formats all start with a full size Y plane.
+_LUMA_LAYOUTS = {
+    QVideoFrame.Format_YUV420P: (0, 1),
+    QVideoFrame.Format_YUV422P: (0, 1),
+    QVideoFrame.Format_YV12: (0, 1),
+    QVideoFrame.Format_NV12: (0, 1),
+    QVideoFrame.Format_NV21: (0, 1),
+    QVideoFrame.Format_Y8: (0, 1),
+    QVideoFrame.Format_YUYV: (0, 2),
+    QVideoFrame.Format_UYVY: (1, 2),
+    # No luma as such, but green makes up most of it
+    QVideoFrame.Format_RGB32: (1, 4),
+    QVideoFrame.Format_ARGB32: (1, 4),
+    QVideoFrame.Format_BGR32: (1, 4),
+    QVideoFrame.Format_BGRA32: (1, 4),
+    QVideoFrame.Format_RGB24: (1, 3),
+    QVideoFrame.Format_BGR24: (1, 3),
+}
+
+# Only every this many pixels in each direction are used to score sharpness
+_SHARPNESS_STEP = 2
+
+
+def _luma(numpy, buffer, pixel_format, width, height, bytes_per_line):
+    try:
+        offset, step = _LUMA_LAYOUTS[pixel_format]
+    except KeyError:
+        return None
+    rows = buffer[: height * bytes_per_line].reshape(height, bytes_per_line)
+    return rows[::_SHARPNESS_STEP, offset : width * step : step * _SHARPNESS_STEP]
+
+
+def sharpness(numpy, luma):
+    """
+    Variance of the Laplacian of a 2D luma array, which is higher the more
+    sharp edges there are, i.e. the less blurred the image is.
+    """
+    luma = luma.astype(numpy.int32)
+    laplacian = (
+        4 * luma[1:-1, 1:-1]
+        - luma[:-2, 1:-1]
+        - luma[2:, 1:-1]
+        - luma[1:-1, :-2]
+        - luma[1:-1, 2:]
+    )
+    return float(laplacian.var()) if laplacian.size else 0.0
+
+
+def _to_image(frame: QVideoFrame) -> QImage:
+    # QVideoFrame.image converts from YUV and friends too, but only since Qt 5.15
+    if hasattr(frame, "image"):
+        return frame.image()
+
+    image_format = QVideoFrame.imageFormatFromPixelFormat(frame.pixelFormat())
+    if image_format == QImage.Format_Invalid or not frame.map(QVideoFrame.ReadOnly):
+        return QImage()
+    try:
+        return QImage(
+            frame.bits(),
+            frame.width(),
+            frame.height(),
+            frame.bytesPerLine(),
+            image_format,
+        ).copy()
+    finally:
+        frame.unmap()
@@ -0,0 +1,129 @@
+import logging
+import statistics
+import threading
+import time
+from collections import Counter, deque
+
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+from PyQt5.QtMultimedia import QCamera, QVideoFrame, QVideoProbe
+
+logger = logging.getLogger(__name__)
+
+
+class ViewfinderStats(QObject):
+    """
+    Measure how well the viewfinder keeps up with the camera.
+
+    Every frame from the camera is timestamped as it arrives, via a QVideoProbe,
+    and frame_presented is called whenever the live feed is painted.  From those
+    this works out, over the last WINDOW frames:
+
+    * The rate frames arrive at, and the rate they make it onto the screen
+    * Frames dropped before they got to us, from gaps in the arrival times
+    * Frames which arrived but were replaced by a newer one before being painted
+    * Latency from a frame arriving to it being painted
+
+    A summary is logged every LOG_INTERVAL_SECONDS, with histograms of the frame
+    intervals and latencies at debug level, and emitted as summary_changed for
+    the on screen overlay.
+    """
+
+    WINDOW = 300
+    LOG_INTERVAL_SECONDS = 10
+    SUMMARY_INTERVAL_MS = 1000
+
+    # Bucket width of the histograms
+    HISTOGRAM_BUCKET_MS = 10
+
+    # A gap this many times longer than the usual frame interval means frames
+    # were dropped
+    DROPPED_FRAME_GAP = 1.5
+
+    summary_changed = pyqtSignal(str)
+
+    def __init__(self, camera: QCamera):
+        super().__init__()
+
+        # Guarded by _lock, as frames arrive on the camera's streaming thread
+        self._lock = threading.Lock()
+        self._arrivals = deque(maxlen=ViewfinderStats.WINDOW)
+        self._frames_arrived = 0
+        self._frames_presented_up_to = 0
+
+        # Only touched on the GUI thread
+        self._presented = deque(maxlen=ViewfinderStats.WINDOW)
+        self._latencies = deque(maxlen=ViewfinderStats.WINDOW)
+        self._not_presented = deque(maxlen=ViewfinderStats.WINDOW)
+        self._last_logged_at = time.monotonic()
+
+        self._probe = QVideoProbe()
+        if not self._probe.setSource(camera):
+            raise ValueError("This camera doesn't support probing viewfinder frames")
+        self._probe.videoFrameProbed.connect(self._on_frame_probed, Qt.DirectConnection)
+
+        self._summary_timer = QTimer()
+        self._summary_timer.timeout.connect(self._summarise)
+        self._summary_timer.start(ViewfinderStats.SUMMARY_INTERVAL_MS)
+
+    def frame_presented(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._frames_arrived == self._frames_presented_up_to:
+                # Painted for some other reason, e.g. the overlay text changed
+                return
+            arrived_at = self._arrivals[-1]
+            skipped = self._frames_arrived - self._frames_presented_up_to - 1
+            self._frames_presented_up_to = self._frames_arrived
+
+        self._presented.append(now)
+        self._latencies.append(now - arrived_at)
+        self._not_presented.append(skipped)
+
+    def _on_frame_probed(self, frame: QVideoFrame):
+        with self._lock:
+            self._arrivals.append(time.monotonic())
+            self._frames_arrived += 1
+
+    def _summarise(self):
+        with self._lock:
+            arrivals = list(self._arrivals)
+        if len(arrivals) < 2 or len(self._presented) < 2:
+            return
+
+        intervals = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+        usual_interval = statistics.median(intervals)
+        dropped = sum(
+            round(interval / usual_interval) - 1
+            for interval in intervals
+            if interval > usual_interval * ViewfinderStats.DROPPED_FRAME_GAP
+        )
+        latencies = sorted(self._latencies)
+
+        summary = (
+            f"{_rate(arrivals):.1f} fps in, {_rate(self._presented):.1f} fps shown, "
+            f"{dropped} dropped, {sum(self._not_presented)} not shown, "
+            f"latency {statistics.median(latencies) * 1000:.0f}ms "
+            f"(p90 {latencies[int(len(latencies) * 0.9)] * 1000:.0f}ms)"
+        )
+        self.summary_changed.emit(summary)
+
+        now = time.monotonic()
+        if now - self._last_logged_at >= ViewfinderStats.LOG_INTERVAL_SECONDS:
+            self._last_logged_at = now
+            logger.info("Viewfinder over last %s frames: %s", len(arrivals), summary)
+            logger.debug("Frame interval histogram: %s", _histogram(intervals))
+            logger.debug("Frame latency histogram: %s", _histogram(latencies))
+
+
+def _rate(timestamps):
+    duration = timestamps[-1] - timestamps[0]
+    return (len(timestamps) - 1) / duration if duration > 0 else 0
+
+
+def _histogram(seconds):
+    bucket_ms = ViewfinderStats.HISTOGRAM_BUCKET_MS
+    counts = Counter(int(s * 1000 // bucket_ms) * bucket_ms for s in seconds)
+    return ", ".join(
+        f"{bucket}-{bucket + bucket_ms}ms: {counts[bucket]}"
+        for bucket in sorted(counts)
+    )
@@ -3,7 +3,9 @@ import logging
 from PyQt5.QtCore import QEvent, Qt, pyqtSignal
 from PyQt5.QtGui import QImage
 
+from photobooth.captured_image import CapturedImage
 from photobooth.mask import Mask
+from photobooth.pixmap_cache import PixmapCache
 from photobooth.resources import images_root
 from photobooth.rpi_io import RpiIo, RpiIoQtHelper
 from photobooth.widgets.static_image_widget import StaticImageWidget
@@ -18,11 +20,12 @@ class ErrorWidget(StaticImageWidget):
         self,
         mask: Mask,
         mask_offset,
+        pixmap_cache: PixmapCache,
         rpi_io: RpiIo,
         parent=None,
         flags=Qt.WindowFlags(),
     ):
-        super().__init__(mask, mask_offset, parent, flags)
+        super().__init__(mask, mask_offset, pixmap_cache, parent, flags)
 
         self._io = RpiIoQtHelper(self, rpi_io)
         self._io.yes_button_pressed.connect(self.accept)
@@ -31,7 +34,7 @@ class ErrorWidget(StaticImageWidget):
         image = QImage()
         if not image.load(str(images_root / "error.jpg")):
             raise ValueError("Failed to load error image")
-        self.set_image(image)
+        self.set_image(CapturedImage(image, is_mirrored=False))
 
     def set_error_message(self, text):
         self.set_text(f"Error: {text[:300]}")
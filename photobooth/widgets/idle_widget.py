@@ -1,12 +1,18 @@
 import logging
 from enum import Enum
+from functools import partial
 
 from PyQt5.QtCore import QRect, Qt, QTimer, pyqtSignal
-from PyQt5.QtGui import QImage, QKeyEvent
+from PyQt5.QtGui import QKeyEvent, QResizeEvent
+from PyQt5.QtWidgets import QLabel
 
 from photobooth.camera import Camera
+from photobooth.captured_image import CapturedImage
 from photobooth.mask import Mask
 from photobooth.rpi_io import RpiIo, RpiIoQtHelper
+from photobooth.session_trace import SessionTracer
+from photobooth.shutter_lag import ShutterLag
+from photobooth.state_machine import ANY_STATE, TransitionTable
 from photobooth.widgets.base_widget import BaseWidget
 from photobooth.widgets.live_feed_widget import LiveFeedWidget
 
@@ -14,14 +20,18 @@ logger = logging.getLogger(__name__)
 
 
 class IdleWidget(BaseWidget):
+    NOTICE_TIMEOUT_SECONDS = 10
+
     class _State(Enum):
         Init = "Init"
         Idle = "Idle"
         Countdown = "Countdown"
         AwaitingCapture = "AwaitingCapture"
 
-    image_captured = pyqtSignal(QImage)
+    image_captured = pyqtSignal(CapturedImage)
     error = pyqtSignal(str)
+    # Ready to take a photo, once the live feed is up
+    ready = pyqtSignal()
 
     def __init__(
         self,
@@ -30,6 +40,7 @@ class IdleWidget(BaseWidget):
         mask_offset,
         camera: Camera,
         rpi_io: RpiIo,
+        tracer: SessionTracer,
         parent=None,
     ):
         super().__init__(parent)
@@ -37,9 +48,13 @@ class IdleWidget(BaseWidget):
         camera_config = config["camera"]
 
         self._mask = mask
+        self._tracer = tracer
 
         self._countdown_timer_seconds = gui_config.getint("countdownTimerSeconds")
         self._countdown_timer_seconds_remaining = None
+        self._compensate_shutter_lag = gui_config.getboolean(
+            "compensateShutterLag", fallback=True
+        )
 
         # Setup live feed
         #
@@ -47,29 +62,102 @@ class IdleWidget(BaseWidget):
             camera,
             camera_config["isMirrored"],
             self._mask,
+            ShutterLag(camera_config.get("shutterLagFile", fallback="")),
+            tracer,
+            capture_mode=camera_config.get(
+                "captureMode", fallback=LiveFeedWidget.STILL_IMAGE_CAPTURE
+            ),
+            ring_buffer_frames=camera_config.getint("ringBufferFrames", fallback=15),
+            best_frame_window_seconds=camera_config.getfloat(
+                "bestFrameWindowSeconds", fallback=0.2
+            ),
+            collect_viewfinder_stats=gui_config.getboolean(
+                "logViewfinderStats", fallback=False
+            ),
+            show_viewfinder_stats=gui_config.getboolean(
+                "showViewfinderStats", fallback=False
+            ),
+            cropped_viewfinder=gui_config.getboolean(
+                "croppedViewfinder", fallback=False
+            ),
             parent=self,
         )
         self._live_feed.setGeometry(QRect(mask_offset, self._mask.size))
-        self._live_feed.image_captured.connect(self._image_captured)
+        self._live_feed.image_captured.connect(partial(self._dispatch, "captured"))
         self._live_feed.error.connect(self.error)
-        self._live_feed.initialized.connect(self._on_live_feed_initialized)
+        self._live_feed.initialized.connect(partial(self._dispatch, "initialized"))
 
-        # Countdown timer
+        # Countdown timer, and the timer which triggers capture, which goes off
+        # early by the camera's shutter lag so that the photo is taken at 0.
         self._timer = QTimer()
-        self._timer.timeout.connect(self._countdown_timer_tick)
+        self._timer.timeout.connect(partial(self._dispatch, "tick"))
+        self._capture_timer = QTimer()
+        self._capture_timer.setSingleShot(True)
+        self._capture_timer.timeout.connect(partial(self._dispatch, "trigger"))
+
+        # Status line, e.g. for letting people know the printer is busy
+        #
+        self._status = QLabel(parent=self)
+        self._status.setObjectName("status")
+        self._status.setAlignment(Qt.AlignCenter)
+        self._status_text = ""
+        self._capture_blocked = False
+
+        self._notice_timer = QTimer()
+        self._notice_timer.setSingleShot(True)
+        self._notice_timer.timeout.connect(
+            lambda: self._status.setText(self._status_text)
+        )
 
         # Setup RpiIo
         #
+        self._rpi_io = rpi_io
         self._io = RpiIoQtHelper(self, rpi_io)
-        self._io.yes_button_pressed.connect(self._capture_requested)
+        self._io.yes_button_pressed.connect(self._on_yes_button_pressed)
 
         # Setup State
         #
+        State = IdleWidget._State
+        self._transitions = TransitionTable(
+            "IdleWidget",
+            {
+                (State.Idle, "capture_requested"): self._start_countdown,
+                (State.Countdown, "tick"): self._countdown_timer_tick,
+                (State.AwaitingCapture, "tick"): self._countdown_timer_tick,
+                (State.Countdown, "trigger"): self._trigger_capture,
+                (State.AwaitingCapture, "captured"): self._image_captured,
+                (ANY_STATE, "captured"): self._unexpected_image_captured,
+                (ANY_STATE, "initialized"): self._on_live_feed_initialized,
+            },
+        )
         self._switch_to_init()
 
     def reload(self):
         self._live_feed.reload()
 
+    def set_status_text(self, text: str):
+        self._status_text = text
+        if not self._notice_timer.isActive():
+            self._status.setText(text)
+
+    def show_notice(self, text: str):
+        """
+        Show text in place of the status for a while
+        """
+        self._status.setText(text)
+        self._notice_timer.start(IdleWidget.NOTICE_TIMEOUT_SECONDS * 1000)
+
+    def set_capture_blocked(self, blocked: bool):
+        self._capture_blocked = blocked
+
+    def resizeEvent(self, event: QResizeEvent) -> None:
+        # Keep the status below the live feed rather than on top of it, so it
+        # doesn't need repainting with every frame from the camera.
+        status_top = self._live_feed.geometry().bottom() + 1
+        self._status.setGeometry(
+            QRect(0, status_top, self.width(), self.height() - status_top)
+        )
+
     def keyPressEvent(self, event: QKeyEvent):
         super().keyPressEvent(event)
 
@@ -79,44 +167,74 @@ class IdleWidget(BaseWidget):
         else:
             event.ignore()
 
-    def _capture_requested(self):
-        if self._state == IdleWidget._State.Idle:
-            self._state = IdleWidget._State.Countdown
-            self._countdown_timer_seconds_remaining = self._countdown_timer_seconds
-            self._live_feed.set_overlay_text(
-                str(self._countdown_timer_seconds_remaining)
-            )
-            self._live_feed.prepare()
-            self._timer.start(1000)
+    @property
+    def dropped_events(self):
+        """
+        How many of each event have been dropped in each state
+        """
+        return self._transitions.dropped
+
+    def _dispatch(self, event: str, *args):
+        self._transitions.dispatch(self._state, event, *args)
+
+    def _on_yes_button_pressed(self):
+        self._capture_requested(self._rpi_io.take_yes_pressed_at())
+
+    def _capture_requested(self, pressed_at=None):
+        if self._capture_blocked:
+            logger.warning("Dropping capture request while capture is blocked")
         else:
-            logger.warning("Dropping capture request when in state: %s", self._state)
+            self._dispatch("capture_requested", pressed_at)
+
+    def _start_countdown(self, pressed_at):
+        self._tracer.start_session(started_at=pressed_at)
+        self._tracer.begin("countdown")
+        self._state = IdleWidget._State.Countdown
+        self._countdown_timer_seconds_remaining = self._countdown_timer_seconds
+        self._live_feed.set_overlay_text(str(self._countdown_timer_seconds_remaining))
+        self._live_feed.prepare()
+        self._timer.start(1000)
+        self._capture_timer.start(self._capture_delay_ms())
 
     def _countdown_timer_tick(self):
-        if self._state == IdleWidget._State.Idle:
-            logger.warning("Dropping countdown tick while in idle state")
-        else:
-            self._countdown_timer_seconds_remaining -= 1
-            self._live_feed.set_overlay_text(
-                str(self._countdown_timer_seconds_remaining)
-            )
-            logger.debug(
-                "Countdown timer tick: %s", self._countdown_timer_seconds_remaining
-            )
-            if self._countdown_timer_seconds_remaining <= 0:
-                self._timer.stop()
-                self._state = IdleWidget._State.AwaitingCapture
-                self._live_feed.trigger_capture()
-
-    def _image_captured(self, image: QImage):
+        self._countdown_timer_seconds_remaining -= 1
+        self._live_feed.set_overlay_text(str(self._countdown_timer_seconds_remaining))
+        logger.debug(
+            "Countdown timer tick: %s", self._countdown_timer_seconds_remaining
+        )
+        if self._countdown_timer_seconds_remaining <= 0:
+            self._timer.stop()
+
+    def _capture_delay_ms(self):
+        countdown_ms = self._countdown_timer_seconds * 1000
+        if not self._compensate_shutter_lag:
+            return countdown_ms
+
+        shutter_lag_ms = int(self._live_feed.shutter_lag_seconds() * 1000)
+        logger.debug("Triggering capture %sms early for shutter lag", shutter_lag_ms)
+        return max(0, countdown_ms - shutter_lag_ms)
+
+    def _trigger_capture(self):
+        self._tracer.end("countdown")
+        self._state = IdleWidget._State.AwaitingCapture
+        self._live_feed.trigger_capture()
+
+    def _unexpected_image_captured(self, image: CapturedImage):
+        # Still show it, rather than lose the photo
+        logger.warning("Unexpected image captured while in state: %s", self._state)
+        self._image_captured(image)
+
+    def _image_captured(self, image: CapturedImage):
         logger.debug("imageCaptured: %s", image)
-        if self._state != IdleWidget._State.AwaitingCapture:
-            logger.warning("Unexpected image captured while in state: %s", self._state)
+        self._timer.stop()
+        self._capture_timer.stop()
         self._switch_to_init()
         self.image_captured.emit(image)
 
     def _switch_to_idle(self):
         self._live_feed.set_overlay_text("")
         self._state = IdleWidget._State.Idle
+        self.ready.emit()
 
     def _switch_to_init(self):
         self._state = IdleWidget._State.Init
@@ -1,20 +1,35 @@
 import logging
+import time
 from enum import Enum
+from functools import partial
 
 from PyQt5.QtCore import QSizeF, Qt, pyqtSignal
-from PyQt5.QtGui import QImage, QPainter, QPixmap, QTransform
+from PyQt5.QtGui import QImage, QPaintEvent, QTransform
 from PyQt5.QtMultimedia import QCamera, QCameraImageCapture
 from PyQt5.QtMultimediaWidgets import QGraphicsVideoItem
 from PyQt5.QtWidgets import QGraphicsView
 
 from photobooth.camera import Camera
+from photobooth.captured_image import CapturedImage
+from photobooth.cropping_video_surface import CroppingVideoSurface, VideoSurfaceItem
 from photobooth.mask import Mask
+from photobooth.mock_camera import MockCamera
+from photobooth.session_trace import SessionTracer
+from photobooth.shutter_lag import ShutterLag
+from photobooth.state_machine import ANY_STATE, TransitionTable
+from photobooth.viewfinder_capture import RingBufferCapture, ViewfinderCapture
+from photobooth.viewfinder_stats import ViewfinderStats
 from photobooth.widgets.overlay_text_graphics_scene import OverlayTextGraphicsScene
 
 logger = logging.getLogger(__name__)
 
 
 class LiveFeedWidget(QGraphicsView):
+    # Ways of taking a photo, see captureMode in the config
+    STILL_IMAGE_CAPTURE = "stillImage"
+    VIEWFINDER_CAPTURE = "viewfinder"
+    RING_BUFFER_CAPTURE = "ringBuffer"
+
     class _State(Enum):
         Init = "Init"
         Idle = "Idle"
@@ -22,7 +37,7 @@ class LiveFeedWidget(QGraphicsView):
         WaitingForCapture = "WaitingForCapture"
 
     error = pyqtSignal(str)
-    image_captured = pyqtSignal(QImage)
+    image_captured = pyqtSignal(CapturedImage)
     initialized = pyqtSignal()
 
     def __init__(
@@ -30,21 +45,65 @@ class LiveFeedWidget(QGraphicsView):
         camera: Camera,
         is_mirrored: bool,
         mask: Mask,
+        shutter_lag: ShutterLag,
+        tracer: SessionTracer,
+        capture_mode=STILL_IMAGE_CAPTURE,
+        ring_buffer_frames=15,
+        best_frame_window_seconds=0.2,
+        collect_viewfinder_stats=False,
+        show_viewfinder_stats=False,
+        cropped_viewfinder=False,
         parent=None,
     ):
         super().__init__(parent=parent)
         self._is_mirrored = is_mirrored
+        self._capture_mode = capture_mode
         self._mask = mask
+        self._shutter_lag = shutter_lag
+        self._tracer = tracer
+
+        # Timings of the capture in progress, see ShutterLag
+        self._locked_at = None
+        self._triggered_at = None
+        self._exposed_at = None
 
         self._state = LiveFeedWidget._State.Init
+        State = LiveFeedWidget._State
+        self._transitions = TransitionTable(
+            "LiveFeedWidget",
+            {
+                (State.Idle, "prepare"): self._prepare,
+                (State.Preparing, "trigger_capture"): self._trigger_capture,
+                (State.WaitingForCapture, "captured"): self._image_captured,
+                (ANY_STATE, "captured"): self._unexpected_image_captured,
+            },
+        )
 
-        self._video_item = QGraphicsVideoItem()
-        # I think this is the size in pixels on the screen?
-        self._video_item.setSize(QSizeF(self._mask.size))
-        # TODO I think this will not draw centrally?  If not should fix this
-        self._video_item.setAspectRatioMode(Qt.KeepAspectRatioByExpanding)
-        if self._is_mirrored:
-            self._video_item.setTransform(QTransform().scale(-1, 1))
+        self._video_surface = None
+        if cropped_viewfinder:
+            try:
+                self._video_surface = CroppingVideoSurface(
+                    self._mask.size,
+                    self._mask.clip_region.boundingRect(),
+                    self._is_mirrored,
+                )
+            except ImportError:
+                logger.warning("numpy isn't installed, not cropping the viewfinder")
+
+        if self._video_surface is not None:
+            self._video_item = VideoSurfaceItem(
+                self._video_surface,
+                self._mask.size,
+                self._mask.clip_region.boundingRect(),
+            )
+        else:
+            self._video_item = QGraphicsVideoItem()
+            # I think this is the size in pixels on the screen?
+            self._video_item.setSize(QSizeF(self._mask.size))
+            # TODO I think this will not draw centrally?  If not should fix this
+            self._video_item.setAspectRatioMode(Qt.KeepAspectRatioByExpanding)
+            if self._is_mirrored:
+                self._video_item.setTransform(QTransform().scale(-1, 1))
 
         self.setMask(self._mask.clip_region)
 
@@ -59,18 +118,52 @@ class LiveFeedWidget(QGraphicsView):
         # Setup camera
         #
         self._camera = camera
-        self._camera.setViewfinder(self._video_item)
-        self._camera.setCaptureMode(QCamera.CaptureStillImage)
+        self._camera.setViewfinder(
+            self._video_surface if self._video_surface is not None else self._video_item
+        )
         self._camera.error.connect(self._on_camera_error)
         self._camera.statusChanged.connect(self._on_camera_status_changed)
 
         # Setup capture
         #
-        self._capture = QCameraImageCapture(self._camera)
-        self._capture.setCaptureDestination(QCameraImageCapture.CaptureToBuffer)
-        self._capture.imageCaptured.connect(self._image_captured)
+        if isinstance(self._camera, MockCamera):
+            # Takes the frame on screen whatever the captureMode
+            self._capture = self._camera.image_capture()
+        elif capture_mode == LiveFeedWidget.STILL_IMAGE_CAPTURE:
+            self._camera.setCaptureMode(QCamera.CaptureStillImage)
+            self._capture = QCameraImageCapture(self._camera)
+            self._capture.setCaptureDestination(QCameraImageCapture.CaptureToBuffer)
+        elif capture_mode == LiveFeedWidget.VIEWFINDER_CAPTURE:
+            self._camera.setCaptureMode(QCamera.CaptureViewfinder)
+            self._capture = ViewfinderCapture(self._camera)
+        elif capture_mode == LiveFeedWidget.RING_BUFFER_CAPTURE:
+            self._camera.setCaptureMode(QCamera.CaptureViewfinder)
+            self._capture = RingBufferCapture(
+                self._camera, ring_buffer_frames, best_frame_window_seconds
+            )
+        else:
+            raise ValueError(
+                f"Unknown captureMode {capture_mode}, expected one of "
+                f"{LiveFeedWidget.STILL_IMAGE_CAPTURE}, "
+                f"{LiveFeedWidget.VIEWFINDER_CAPTURE} or "
+                f"{LiveFeedWidget.RING_BUFFER_CAPTURE}"
+            )
+        self._capture.imageCaptured.connect(partial(self._dispatch, "captured"))
         self._capture.error.connect(self._on_capture_error)
 
+        # Setup instrumentation
+        #
+        self._viewfinder_stats = None
+        if collect_viewfinder_stats or show_viewfinder_stats:
+            self._viewfinder_stats = ViewfinderStats(self._camera)
+            if show_viewfinder_stats:
+                self._viewfinder_stats.summary_changed.connect(
+                    self._scene.set_debug_text
+                )
+
+        if capture_mode == LiveFeedWidget.STILL_IMAGE_CAPTURE:
+            self._capture.imageExposed.connect(self._image_exposed)
+
         self._camera.start()
 
         logger.info("Camera started")
@@ -78,72 +171,122 @@ class LiveFeedWidget(QGraphicsView):
     def set_overlay_text(self, text: str):
         self._scene.set_overlay_text(text)
 
+    def paintEvent(self, event: QPaintEvent) -> None:
+        super().paintEvent(event)
+        if self._viewfinder_stats is not None:
+            self._viewfinder_stats.frame_presented()
+
+    def shutter_lag_seconds(self) -> float:
+        """
+        How long after trigger_capture the photo is expected to be taken
+        """
+        if self._capture_mode == LiveFeedWidget.RING_BUFFER_CAPTURE:
+            # Frames are picked from around the time capture was triggered
+            return 0
+        return self._shutter_lag.estimate(self._camera_key())
+
+    @property
+    def dropped_events(self):
+        """
+        How many of each event have been dropped in each state
+        """
+        return self._transitions.dropped
+
     def prepare(self):
-        if self._state != LiveFeedWidget._State.Idle:
-            logger.warning("Dropping call to prepare when in state: %s", self._state)
-        else:
-            self._state = LiveFeedWidget._State.Preparing
-            self._camera.searchAndLock()
+        self._dispatch("prepare")
 
     def trigger_capture(self):
-        if self._state != LiveFeedWidget._State.Preparing:
-            logger.warning(
-                "Dropping call to trigger_capture when in state: %s", self._state
-            )
-        else:
-            logger.debug("trigger_capture")
-            self._state = LiveFeedWidget._State.WaitingForCapture
-            self._capture.capture()
+        self._dispatch("trigger_capture")
+
+    def _dispatch(self, event: str, *args):
+        self._transitions.dispatch(self._state, event, *args)
+
+    def _prepare(self):
+        self._state = LiveFeedWidget._State.Preparing
+        self._locked_at = time.monotonic()
+        self._triggered_at = self._exposed_at = None
+        self._camera.hold_viewfinder_settings(True)
+        self._camera.searchAndLock()
+        if self._capture_mode == LiveFeedWidget.RING_BUFFER_CAPTURE:
+            self._capture.prepare()
+
+    def _trigger_capture(self):
+        self._tracer.begin("capture")
+        self._state = LiveFeedWidget._State.WaitingForCapture
+        self._triggered_at = time.monotonic()
+        self._capture.capture()
 
     # noinspection PyPep8Naming
     def _on_camera_error(self, QCamera_Error: int):
         self._state = LiveFeedWidget._State.Idle
+        self._camera.hold_viewfinder_settings(False)
         self.error.emit(f"Camera error, code: {QCamera_Error}")
 
     # noinspection PyPep8Naming
     def _on_capture_error(self, p_int=None, QCameraImageCapture_Error=None, p_str=None):
         self._state = LiveFeedWidget._State.Idle
+        self._camera.hold_viewfinder_settings(False)
         self.error.emit(
             f"Capture error: {p_int} / {QCameraImageCapture_Error} / {p_str}"
         )
 
-    def _image_captured(self, id_: int, image: QImage):
-        if self._state != LiveFeedWidget._State.WaitingForCapture:
-            logger.warning("Dropping _image_captured when in state: %s", self._state)
+    def _image_exposed(self, id_: int):
+        logger.debug("image exposed: %s", id_)
+        self._exposed_at = time.monotonic()
+
+    def _unexpected_image_captured(self, id_: int, image: QImage):
+        # Still pass it on, but its timings are meaningless for shutter lag
+        logger.warning("Unexpected image captured when in state: %s", self._state)
+        self._image_captured(id_, image, record_shutter_lag=False)
+
+    def _image_captured(self, id_: int, image: QImage, record_shutter_lag=True):
+        if record_shutter_lag:
+            self._record_shutter_lag()
+            self._tracer.end("capture")
         self._state = LiveFeedWidget._State.Idle
         logger.debug("image captured: %s %s", id_, image)
         self._camera.unlock()
+        self._camera.hold_viewfinder_settings(False)
 
-        # TODO If I don't unload and the reload the camera, gstreamer dies
-        #  with CameraBin error: "Internal data stream error.", not sure why
-        #  :(
-        self._camera.unload()
+        if self._capture_mode == LiveFeedWidget.STILL_IMAGE_CAPTURE:
+            # TODO If I don't unload and the reload the camera, gstreamer dies
+            #  with CameraBin error: "Internal data stream error.", not sure why
+            #  :(
+            self._camera.unload()
 
-        self.image_captured.emit(_mirror_if_necessary(image, self._is_mirrored))
+        self.image_captured.emit(CapturedImage(image, self._is_mirrored))
 
     def reload(self):
-        # See comment on _image_captured
-        self._camera.start()
+        if self._camera.status() == QCamera.ActiveStatus:
+            # Never stopped, as the photo was taken from the viewfinder
+            self._state = LiveFeedWidget._State.Idle
+            self.initialized.emit()
+        else:
+            # See comment on _image_captured
+            self._camera.start()
+
+    def _record_shutter_lag(self):
+        captured_at = time.monotonic()
+        self._shutter_lag.record(
+            self._camera_key(),
+            lock_to_trigger=self._triggered_at - self._locked_at,
+            trigger_to_exposed=(
+                None
+                if self._exposed_at is None
+                else self._exposed_at - self._triggered_at
+            ),
+            trigger_to_captured=captured_at - self._triggered_at,
+        )
+
+    def _camera_key(self):
+        resolution = self._camera.viewfinderSettings().resolution()
+        return (
+            f"{self._camera.device_name} {resolution.width()}x{resolution.height()} "
+            f"{self._capture_mode}"
+        )
 
     def _on_camera_status_changed(self, status):
         logger.debug("_on_camera_status_changed: %s", status)
         if status == QCamera.ActiveStatus:
             self._state = LiveFeedWidget._State.Idle
             self.initialized.emit()
-
-
-def _mirror_if_necessary(image, is_mirrored):
-    if not is_mirrored:
-        return image
-
-    mirrored = QImage(image.size(), QImage.Format_RGB32)
-
-    painter = QPainter(mirrored)
-    painter.setRenderHints(QPainter.Antialiasing, QPainter.SmoothPixmapTransform)
-    pixmap = QPixmap.fromImage(image)
-    if is_mirrored:
-        pixmap = pixmap.transformed(QTransform().scale(-1.0, 1.0))
-    painter.drawPixmap(0, 0, pixmap)
-    painter.end()
-
-    return mirrored
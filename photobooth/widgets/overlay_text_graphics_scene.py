@@ -1,7 +1,7 @@
 import logging
 
-from PyQt5.QtCore import QRectF, QSize, Qt
-from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import QPointF, QRect, QRectF, QSize, Qt
+from PyQt5.QtGui import QFontMetrics, QPainter, QPixmap
 from PyQt5.QtWidgets import QGraphicsScene
 
 logger = logging.getLogger(__name__)
@@ -9,22 +9,105 @@ logger = logging.getLogger(__name__)
 
 class OverlayTextGraphicsScene(QGraphicsScene):
     """
-    A QGraphicsScene which will draw some text in the center of the foreground
+    A QGraphicsScene which will draw some text in the center of the foreground,
+    and optionally some small debug text in the top left corner
+
+    The overlay text is huge and drawn over every frame of the live feed, but
+    only changes once a second during the countdown, so each string is
+    rendered to a pixmap the first time it's shown and that is drawn instead.
+    The debug text is too, but only the latest, as it's different every time.
     """
 
     def __init__(self, size: QSize):
         super().__init__()
         self._overlay_text = None
+        self._debug_text = None
 
         # Get the default font and guess at the best size for it
         self._font = QPainter().font()
-        self._font.setPixelSize(min(size.height(), size.width()) / 2)
+        self._font.setPixelSize(min(size.height(), size.width()) // 2)
+        self._debug_font = QPainter().font()
+        self._debug_font.setPixelSize(max(10, min(size.height(), size.width()) // 30))
+
+        # Overlay text to the pixmap it's drawn from
+        self._text_pixmaps = {}
+        self._debug_pixmap = None
 
     def set_overlay_text(self, overlay_text):
+        if overlay_text == self._overlay_text:
+            return
+        # Only the old and new text need repainting, not the whole scene
+        for text in (self._overlay_text, overlay_text):
+            if text:
+                self.update(self._text_target(self._text_pixmap(text)))
         self._overlay_text = overlay_text
 
+    def set_debug_text(self, debug_text):
+        if debug_text == self._debug_text:
+            return
+        for pixmap in (self._debug_pixmap, self._render_debug_pixmap(debug_text)):
+            if pixmap is not None:
+                self.update(self._debug_target(pixmap))
+        self._debug_text = debug_text
+
     def drawForeground(self, painter: QPainter, rect: QRectF) -> None:
         super().drawForeground(painter, rect)
         if self._overlay_text:
+            pixmap = self._text_pixmap(self._overlay_text)
+            target = self._text_target(pixmap)
+            if target.intersects(rect):
+                painter.drawPixmap(target.topLeft(), pixmap)
+        if self._debug_pixmap is not None:
+            target = self._debug_target(self._debug_pixmap)
+            if target.intersects(rect):
+                painter.drawPixmap(target.topLeft(), self._debug_pixmap)
+
+    def _render_debug_pixmap(self, text):
+        if not text:
+            self._debug_pixmap = None
+        else:
+            text_rect = QFontMetrics(self._debug_font).boundingRect(
+                QRect(), Qt.AlignTop | Qt.AlignLeft, text
+            )
+            self._debug_pixmap = QPixmap(text_rect.size())
+            self._debug_pixmap.fill(Qt.transparent)
+            painter = QPainter(self._debug_pixmap)
+            painter.setFont(self._debug_font)
+            painter.drawText(
+                QRectF(self._debug_pixmap.rect()), Qt.AlignTop | Qt.AlignLeft, text
+            )
+            painter.end()
+        return self._debug_pixmap
+
+    def _debug_target(self, pixmap: QPixmap) -> QRectF:
+        target = QRectF(pixmap.rect())
+        target.moveTopLeft(QPointF(self.sceneRect().topLeft().toPoint()))
+        return target
+
+    def _text_pixmap(self, text):
+        cached = self._text_pixmaps.get(text)
+        if cached is None:
+            # Leave a little room for glyphs which overhang their advance
+            margin = self._font.pixelSize() // 8
+            text_rect = QFontMetrics(self._font).boundingRect(
+                QRect(), Qt.AlignCenter, text
+            )
+            pixmap = QPixmap(text_rect.size() + QSize(margin, margin) * 2)
+            pixmap.fill(Qt.transparent)
+            painter = QPainter(pixmap)
             painter.setFont(self._font)
-            painter.drawText(rect, Qt.AlignCenter, self._overlay_text)
+            painter.drawText(QRectF(pixmap.rect()), Qt.AlignCenter, text)
+            painter.end()
+
+            cached = self._text_pixmaps[text] = pixmap
+            logger.debug("Rendered overlay text %r", text)
+        return cached
+
+    def _text_target(self, pixmap: QPixmap) -> QRectF:
+        # Centred on the scene rather than on (0, 0, width, height), as the
+        # video item is flipped into negative x when the live feed is mirrored
+        target = QRectF(pixmap.rect())
+        target.moveCenter(self.sceneRect().center())
+        # Whole pixels, so the pixmap isn't resampled when it's drawn
+        target.moveTopLeft(QPointF(target.topLeft().toPoint()))
+        return target
@@ -4,6 +4,7 @@ from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QKeyEvent
 
 from photobooth.mask import Mask
+from photobooth.pixmap_cache import PixmapCache
 from photobooth.rpi_io import RpiIo, RpiIoQtHelper
 from photobooth.widgets.static_image_widget import StaticImageWidget
 
@@ -18,11 +19,12 @@ class PreviewWidget(StaticImageWidget):
         self,
         mask: Mask,
         mask_offset,
+        pixmap_cache: PixmapCache,
         rpi_io: RpiIo,
         parent=None,
         flags=Qt.WindowFlags(),
     ):
-        super().__init__(mask, mask_offset, parent, flags)
+        super().__init__(mask, mask_offset, pixmap_cache, parent, flags)
         self._io = RpiIoQtHelper(self, rpi_io)
         self._io.yes_button_pressed.connect(self.accept)
         self._io.no_button_pressed.connect(self.reject)
@@ -1,10 +1,18 @@
 from PyQt5.QtCore import Qt
 
 from photobooth.mask import Mask
+from photobooth.pixmap_cache import PixmapCache
 from photobooth.widgets.static_image_widget import StaticImageWidget
 
 
 class PrintingWidget(StaticImageWidget):
-    def __init__(self, mask: Mask, mask_offset, parent=None, flags=Qt.WindowFlags()):
-        super().__init__(mask, mask_offset, parent=parent, flags=flags)
+    def __init__(
+        self,
+        mask: Mask,
+        mask_offset,
+        pixmap_cache: PixmapCache,
+        parent=None,
+        flags=Qt.WindowFlags(),
+    ):
+        super().__init__(mask, mask_offset, pixmap_cache, parent=parent, flags=flags)
         self.set_text("Printing")
@@ -1,16 +1,26 @@
 from PyQt5.QtCore import QRect, Qt
-from PyQt5.QtGui import QImage, QPixmap, QResizeEvent
+from PyQt5.QtGui import QPixmap, QResizeEvent
 from PyQt5.QtWidgets import QLabel
 
+from photobooth.captured_image import CapturedImage
 from photobooth.mask import Mask
+from photobooth.pixmap_cache import PixmapCache
 from photobooth.widgets.base_widget import BaseWidget
 
 
 class StaticImageWidget(BaseWidget):
-    def __init__(self, mask: Mask, mask_offset, parent=None, flags=Qt.WindowFlags()):
+    def __init__(
+        self,
+        mask: Mask,
+        mask_offset,
+        pixmap_cache: PixmapCache,
+        parent=None,
+        flags=Qt.WindowFlags(),
+    ):
         super().__init__(parent, flags)
 
         self._mask = mask
+        self._pixmap_cache = pixmap_cache
         self._image = None
 
         self._imageLabel: QLabel = QLabel(parent=self)
@@ -33,7 +43,7 @@ class StaticImageWidget(BaseWidget):
         if self._image:
             self._load_image_into_imagelabel()
 
-    def set_image(self, image: QImage):
+    def set_image(self, image: CapturedImage):
         self._image = image
         self._load_image_into_imagelabel()
 
@@ -41,8 +51,15 @@ class StaticImageWidget(BaseWidget):
         self._text.setText(text)
 
     def _load_image_into_imagelabel(self):
-        self._imageLabel.setPixmap(
-            QPixmap.fromImage(
-                self._mask.shrink_and_clip_to_mask_size(self._image), Qt.AutoColor
-            )
+        # Shared with the other screens, so e.g. going from preview to printing
+        # doesn't crop and convert the same photo again
+        pixmap = self._pixmap_cache.get(
+            self._image.image,
+            self._mask.size,
+            "preview mirrored" if self._image.is_mirrored else "preview",
+            lambda: QPixmap.fromImage(self._image.preview(self._mask), Qt.AutoColor),
         )
+        if self._imageLabel.pixmap() is None or (
+            self._imageLabel.pixmap().cacheKey() != pixmap.cacheKey()
+        ):
+            self._imageLabel.setPixmap(pixmap)